@@ -1,39 +1,276 @@
 import os
+import random
+import threading
+import time
 import requests
 import json
+from email.utils import parsedate_to_datetime
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from prompt_cache import PromptCache
 
 # Load .env if present
 load_dotenv()
 
-COHERE_API_KEY = os.getenv("COHERE_API_KEY")
-if not COHERE_API_KEY:
-    raise RuntimeError("⚠️ Missing COHERE_API_KEY. Put it in your .env or export it.")
-
-URL = "https://api.cohere.com/v2/chat"
-HEADERS = {
-    "Authorization": f"Bearer {COHERE_API_KEY}",
-    "Content-Type": "application/json",
-}
-
-def getResponseFromPrompt(prompt: str, model: str = "command-r") -> str:
-    """Send a simple chat prompt to Cohere and return text response."""
-    payload = {
-        "model": model,
-        "messages": [{"role": "user", "content": prompt}],
-    }
-    r = requests.post(URL, headers=HEADERS, json=payload, timeout=45)
-    r.raise_for_status()
-    data = r.json()
-
-    # Cohere v2/chat may return "text" OR structured content
-    if "text" in data:
-        return data["text"].strip()
-    if "message" in data and "content" in data["message"]:
-        parts = data["message"]["content"]
-        if parts and isinstance(parts, list):
-            return parts[0].get("text", "").strip()
-    return json.dumps(data, indent=2)
+# Point COHERE_BASE_URL at a local stand-in (benchmarks/stub_llm_server.py) to run without Cohere
+BASE_URL = os.getenv("COHERE_BASE_URL", "https://api.cohere.com")
+CHAT_PATH = "/v2/chat"
+
+# Seconds to wait for a connection, and for the reply once connected
+CONNECT_TIMEOUT = float(os.getenv("COHERE_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT = float(os.getenv("COHERE_READ_TIMEOUT", 45))
+
+# Connections kept open for reuse (a web process runs a few AI jobs at a time)
+POOL_SIZE = int(os.getenv("COHERE_POOL_SIZE", 10))
+
+# Calls open to the API at once across the whole process, however many jobs and fan-out threads want one
+MAX_CONCURRENT = int(os.getenv("COHERE_MAX_CONCURRENT", 10))
+
+# Retries after a 429/5xx reply or a network error, waiting base * 2^attempt seconds (with jitter, capped)
+MAX_RETRIES = int(os.getenv("COHERE_MAX_RETRIES", 3))
+BACKOFF_BASE = float(os.getenv("COHERE_BACKOFF_BASE", 0.5))
+BACKOFF_MAX = float(os.getenv("COHERE_BACKOFF_MAX", 30))
+
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+# Responses are kept on disk so repeated prompts don't go upstream again; an empty path turns this off
+PROMPT_CACHE_PATH = os.getenv("PROMPT_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompt_cache.sqlite3"))
+PROMPT_CACHE_TTL = float(os.getenv("PROMPT_CACHE_TTL", 7 * 24 * 3600))
+PROMPT_CACHE_MAX_BYTES = int(os.getenv("PROMPT_CACHE_MAX_BYTES", 50 * 1024 * 1024))
+
+
+def retry_after_seconds(header_value):
+    """Seconds a Retry-After header asks for (given as seconds or as an HTTP date), or None"""
+    if not header_value:
+        return None
+    try:
+        return max(0.0, float(header_value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(header_value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class CohereClient:
+    """Chat client for Cohere's v2 API that reuses connections and retries transient failures
+
+    The API key is read when the first request is made, not when the client is created.
+    """
+
+    def __init__(self, base_url=BASE_URL, api_key=None, connect_timeout=CONNECT_TIMEOUT,
+                 read_timeout=READ_TIMEOUT, pool_size=POOL_SIZE, max_retries=MAX_RETRIES,
+                 backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX, max_concurrent=MAX_CONCURRENT):
+        self.url = base_url.rstrip("/") + CHAT_PATH
+        self._api_key = api_key
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.session = requests.Session()
+        # Retries are done here, where Retry-After and jitter are handled, not by urllib3
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # Held only while a request is open, not while backing off
+        self.max_concurrent = max_concurrent
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+
+    @property
+    def api_key(self):
+        api_key = self._api_key or os.getenv("COHERE_API_KEY")
+        if not api_key:
+            raise RuntimeError("⚠️ Missing COHERE_API_KEY. Put it in your .env or export it.")
+        return api_key
+
+    def backoff(self, attempt, response=None):
+        """Seconds to wait before retry number attempt + 1: the server's Retry-After if it sent one, else full jitter"""
+        if response is not None:
+            wait = retry_after_seconds(response.headers.get("Retry-After"))
+            if wait is not None:
+                return min(wait, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def post(self, payload, stream=False):
+        """POST payload to the chat endpoint and return the successful response
+
+        With stream, the body is left unread and the response keeps its concurrency slot;
+        the caller closes it and calls release() when done.
+        """
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+        attempt = 0
+        while True:
+            try:
+                response = self._send(headers, payload, stream)
+            except (requests.ConnectionError, requests.Timeout) as ex:
+                if attempt >= self.max_retries:
+                    self._count_failure()
+                    raise
+                print(f"Cohere request failed ({ex}), retrying")
+                wait = self.backoff(attempt)
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    if not response.ok:
+                        self._count_failure()
+                    response.raise_for_status()
+                    return response
+                print(f"Cohere answered {response.status_code}, retrying")
+                wait = self.backoff(attempt, response)
+                response.close()
+            with self._lock:
+                self.retries += 1
+            time.sleep(wait)
+            attempt += 1
+
+    def _send(self, headers, payload, stream=False):
+        self._slots.acquire()
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            response = self.session.post(self.url, headers=headers, json=payload, timeout=self.timeout, stream=stream)
+        except BaseException:
+            self.release()
+            raise
+        # A successful stream stays open (and counted) until its reader is done with it
+        if not stream or not response.ok:
+            self.release()
+        return response
+
+    def release(self):
+        """Give back the concurrency slot of a streamed response"""
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def chat(self, prompt, model="command-r"):
+        """Send a simple chat prompt and return the reply's text"""
+        payload = {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+        }
+        data = self.post(payload).json()
+
+        # Cohere v2/chat may return "text" OR structured content
+        if "text" in data:
+            return data["text"].strip()
+        if "message" in data and "content" in data["message"]:
+            parts = data["message"]["content"]
+            if parts and isinstance(parts, list):
+                return parts[0].get("text", "").strip()
+        return json.dumps(data, indent=2)
+
+    def chat_stream(self, prompt, model="command-r"):
+        """Send a simple chat prompt and yield the reply's text piece by piece as it is generated
+
+        Failures before the reply starts are retried like chat(); a reply cut off halfway raises.
+        """
+        payload = {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": True,
+        }
+        response = self.post(payload, stream=True)
+        try:
+            response.encoding = response.encoding or "utf-8"
+            # Server-sent events; the text arrives in content-delta events
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                try:
+                    event = json.loads(line[len("data:"):])
+                except ValueError:
+                    continue
+                if event.get("type") == "content-delta":
+                    text = event.get("delta", {}).get("message", {}).get("content", {}).get("text")
+                    if text:
+                        yield text
+                elif event.get("type") == "message-end":
+                    break
+        finally:
+            response.close()
+            self.release()
+
+    def _count_failure(self):
+        with self._lock:
+            self.failures += 1
+
+    def stats(self):
+        """Counters for monitoring calls to the API"""
+        with self._lock:
+            return {
+                "url": self.url,
+                "requests": self.requests,
+                "retries": self.retries,
+                "failures": self.failures,
+                "max_concurrent": self.max_concurrent,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+            }
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """The client shared by the whole process, created on first use"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = CohereClient()
+        return _client
+
+
+_prompt_cache = None
+_prompt_cache_lock = threading.Lock()
+
+
+def get_prompt_cache():
+    """The prompt cache shared by the whole process, or None when PROMPT_CACHE_PATH is empty"""
+    global _prompt_cache
+    if not PROMPT_CACHE_PATH:
+        return None
+    with _prompt_cache_lock:
+        if _prompt_cache is None:
+            _prompt_cache = PromptCache(PROMPT_CACHE_PATH, PROMPT_CACHE_TTL, PROMPT_CACHE_MAX_BYTES)
+        return _prompt_cache
+
+
+def getResponseFromPrompt(prompt: str, model: str = "command-r", refresh: bool = False) -> str:
+    """Send a simple chat prompt to Cohere and return text response (cached; refresh asks again)."""
+    cache = get_prompt_cache()
+    if cache is None:
+        return get_client().chat(prompt, model)
+    return cache.get_or_compute(prompt, model, lambda: get_client().chat(prompt, model), refresh)
+
+
+def streamResponseFromPrompt(prompt: str, model: str = "command-r", refresh: bool = False):
+    """Yield Cohere's text response to a chat prompt as it is generated (a cached response comes in one piece)."""
+    cache = get_prompt_cache()
+    if cache is not None and not refresh:
+        cached = cache.get(prompt, model)
+        if cached is not None:
+            yield cached
+            return
+    pieces = []
+    for piece in get_client().chat_stream(prompt, model):
+        pieces.append(piece)
+        yield piece
+    # Only replies read to the end are cached
+    if cache is not None:
+        cache.put(prompt, model, "".join(pieces).strip())
 
 
 # if __name__ == "__main__":
@@ -43,4 +280,4 @@ def getResponseFromPrompt(prompt: str, model: str = "command-r") -> str:
 
 #     response = getResponseFromPrompt(prompt)
 #     print("=== Raw Cohere output ===")
-#     print(response)
\ No newline at end of file
+#     print(response)
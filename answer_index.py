@@ -0,0 +1,276 @@
+# File used for
+#     - indexing the answers of a deck by character trigrams, answer type and answer length
+#     - finding the answers that look most like a card's answer, to offer as plausible wrong choices
+#     - keeping one index per deck, updated incrementally (only changed answers are re-indexed)
+#       whenever the deck's version changes
+
+import heapq
+import math
+import random
+import re
+import threading
+from collections import Counter, OrderedDict
+
+GRAM_SIZE = 3
+
+# A lookup reads at most this many posting entries, rarest trigrams first, so its cost
+# does not grow with the deck (very common trigrams say little about similarity anyway)
+MAX_POSTINGS_SCANNED = 96
+
+# Random picks per type/length bucket when trigrams find too few similar answers
+BUCKET_PICKS = 16
+
+# Similar answers of a different kind (a number next to words) are pushed down the ranking
+OTHER_TYPE_PENALTY = 0.25
+
+DATE_PATTERN = re.compile(r"^\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}$")
+NUMBER_PATTERN = re.compile(r"^[-+]?(\d[\d,]*)?\.?\d+\s*%?$")
+
+
+def normalize_answer(answer):
+    """Lowercase an answer and collapse its whitespace"""
+    return " ".join(answer.lower().split())
+
+
+def answer_type(normalized):
+    """Rough kind of an answer: date, number, word, phrase or sentence"""
+    if DATE_PATTERN.match(normalized):
+        return "date"
+    if NUMBER_PATTERN.match(normalized):
+        return "number"
+    words = normalized.count(" ") + 1
+    if words == 1:
+        return "word"
+    return "phrase" if words <= 4 else "sentence"
+
+
+def length_bucket(normalized):
+    """Answers of about the same length (within a factor of two) share a bucket"""
+    return min(len(normalized).bit_length(), 8)
+
+
+def answer_grams(normalized):
+    """The set of character trigrams of an answer, padded so short answers still have some"""
+    padded = f" {normalized} "
+    return frozenset(padded[i:i + GRAM_SIZE] for i in range(max(1, len(padded) - GRAM_SIZE + 1)))
+
+
+class AnswerIndex:
+    """Inverted trigram index over the distinct answers of one deck"""
+
+    def __init__(self, answers=()):
+        self._counts = {}       # answer -> number of cards using it
+        self._features = {}     # answer -> (normalized, trigrams, type, length bucket, 1 / sqrt(number of trigrams))
+        self._postings = {}     # trigram -> set of answers containing it
+        self._buckets = {}      # (type, length bucket) -> list of answers
+        self._bucket_slots = {} # answer -> its position in its bucket list
+        self._similar = {}      # answer -> ranked similar answers, dropped when a lookalike is added
+        self._lock = threading.Lock()
+        self.sync(answers)
+
+    def __len__(self):
+        return len(self._counts)
+
+    def add(self, answer):
+        """Count one more card with this answer"""
+        with self._lock:
+            self._add(answer)
+
+    def remove(self, answer):
+        """Count one card fewer with this answer"""
+        with self._lock:
+            self._remove(answer)
+
+    def sync(self, answers):
+        """Bring the index in line with a deck's current answers, re-indexing only what changed
+
+        Returns the number of distinct answers added or dropped.
+        """
+        wanted = Counter(answers)
+        changed = 0
+        with self._lock:
+            for answer in [answer for answer in self._counts if answer not in wanted]:
+                self._counts[answer] = 1
+                self._remove(answer)
+                changed += 1
+            for answer, count in wanted.items():
+                if answer not in self._counts:
+                    changed += 1
+                    self._add(answer)
+                self._counts[answer] = count
+        return changed
+
+    def _add(self, answer):
+        if answer in self._counts:
+            self._counts[answer] += 1
+            return
+        normalized = normalize_answer(answer)
+        grams = answer_grams(normalized)
+        bucket = (answer_type(normalized), length_bucket(normalized))
+        self._counts[answer] = 1
+        self._features[answer] = (normalized, grams, bucket[0], bucket[1], 1 / math.sqrt(len(grams)))
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(answer)
+        members = self._buckets.setdefault(bucket, [])
+        self._bucket_slots[answer] = len(members)
+        members.append(answer)
+        if self._similar:
+            # Only answers that would find this one in their own lookup can rank differently now
+            for posting in self._rarest_postings(grams):
+                for other in posting:
+                    self._similar.pop(other, None)
+
+    def _remove(self, answer):
+        count = self._counts.get(answer)
+        if count is None:
+            return
+        if count > 1:
+            self._counts[answer] = count - 1
+            return
+        del self._counts[answer]
+        normalized, grams, kind, length, _ = self._features.pop(answer)
+        for gram in grams:
+            posting = self._postings[gram]
+            posting.discard(answer)
+            if not posting:
+                del self._postings[gram]
+        # Swap-remove from the bucket so removal stays O(1)
+        members = self._buckets[(kind, length)]
+        slot = self._bucket_slots.pop(answer)
+        last = members.pop()
+        if last != answer:
+            members[slot] = last
+            self._bucket_slots[last] = slot
+        if not members:
+            del self._buckets[(kind, length)]
+        # Rankings that include this answer are refreshed the next time they are looked up
+
+    def similar(self, answer, k):
+        """Up to k other answers of the deck ranked by how much they look like answer"""
+        with self._lock:
+            ranked = self._similar.get(answer)
+            if ranked is None or len(ranked) < k or not all(other in self._counts for other in ranked):
+                ranked = self._rank(answer, k)
+                self._similar[answer] = ranked
+            return ranked[:k]
+
+    def _rarest_postings(self, grams):
+        """The postings of grams, rarest first, as far as MAX_POSTINGS_SCANNED entries go"""
+        postings = [self._postings[gram] for gram in grams if gram in self._postings]
+        postings.sort(key=len)
+        scanned = 0
+        for posting in postings:
+            scanned += len(posting)
+            if scanned > MAX_POSTINGS_SCANNED:
+                return
+            yield posting
+
+    def _rank(self, answer, k):
+        features = self._features.get(answer)
+        if features is None:
+            normalized = normalize_answer(answer)
+            grams = answer_grams(normalized)
+            features = (normalized, grams, answer_type(normalized), length_bucket(normalized), 1 / math.sqrt(len(grams)))
+        normalized, grams, kind, length, own_norm = features
+        total = len(self._counts)
+
+        # Accumulate idf-weighted trigram overlap, reading the rarest trigrams first
+        overlap = {}
+        for posting in self._rarest_postings(grams):
+            weight = math.log(total / len(posting)) + 1
+            weight *= weight
+            for other in posting:
+                overlap[other] = overlap.get(other, 0.0) + weight
+
+        scores = []
+        features = self._features
+        for other, score in overlap.items():
+            other_normalized, _, other_kind, _, other_norm = features[other]
+            if other_normalized == normalized:
+                continue
+            score *= own_norm * other_norm
+            if other_kind != kind:
+                score *= OTHER_TYPE_PENALTY
+            scores.append((score, other))
+        ranked = [other for _, other in heapq.nlargest(k, scores)]
+
+        if len(ranked) < k:
+            # Too few lookalikes: fall back to answers of the same kind and about the same length,
+            # then to answers of any kind (there are only a few dozen buckets)
+            seen = set(ranked)
+            nearby = [(kind, length), (kind, length - 1), (kind, length + 1)]
+            elsewhere = [bucket for bucket in self._buckets if bucket not in nearby]
+            random.shuffle(elsewhere)
+            for bucket in nearby + elsewhere:
+                members = self._buckets.get(bucket, ())
+                if len(members) > BUCKET_PICKS:
+                    members = [members[random.randrange(len(members))] for _ in range(BUCKET_PICKS)]
+                for other in members:
+                    if other not in seen and self._features[other][0] != normalized:
+                        seen.add(other)
+                        ranked.append(other)
+                        if len(ranked) >= k:
+                            return ranked
+        return ranked
+
+
+class AnswerIndexCache:
+    """Thread-safe LRU of AnswerIndex objects keyed like the deck cache and tagged with the deck version they match"""
+
+    # Built from, and synced with, what get() is given; subclasses cache other per-deck indexes
+    index_class = AnswerIndex
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (version, index)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.builds = 0
+        self.syncs = 0
+
+    def get(self, key, version, answers):
+        """Return the index for key, building it or syncing it with answers if version moved on
+
+        Every deck store versions its decks, so version is only None when the caller has no deck
+        version to pass; such a lookup always syncs, which is cheap when nothing changed.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if version is not None and entry[0] == version:
+                    self.hits += 1
+                    return entry[1]
+
+        if entry is None:
+            index = self.index_class(answers)
+        else:
+            index = entry[1]
+            index.sync(answers)
+
+        with self._lock:
+            if entry is None:
+                self.builds += 1
+            else:
+                self.syncs += 1
+            self._entries[key] = (version, index)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return index
+
+    def invalidate(self, key):
+        """Drop the index kept for key"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self):
+        """Counters for monitoring how often indexes are reused"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "builds": self.builds,
+                "syncs": self.syncs,
+            }
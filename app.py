@@ -1,16 +1,28 @@
+import csv
+import io
 import json
-import random
+import lzma
+import os
 from os import environ as env
 from urllib.parse import quote_plus, urlencode
-import pymongo
 from bson.objectid import ObjectId
-import datetime
+import queue
+import struct
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from authlib.integrations.flask_client import OAuth
 from dotenv import find_dotenv, load_dotenv
-from flask import Flask, redirect, render_template, session, url_for, request, jsonify
-from datacompression import Deck, Flashcard
-from ai_cards import getResponseFromPrompt
+from flask import Flask, Response, redirect, render_template, session, url_for, request, jsonify, stream_with_context
+from datacompression import Deck, Flashcard, is_packed_deck, iter_encoded_deck, pack_deck, read_deck_lazily, unpack_deck
+from answer_index import AnswerIndexCache
+from deck_cache import DeckCache
+from deck_store import DeckList, card_to_document, open_deck_store
+from dedup_index import DedupIndex, DedupIndexCache, NewCardFilter, card_pairs
+from job_queue import JobQueue, QueueFull
+from study_session import count_session_cards, deck_answers, deck_questions, estimate_plan_size, iter_session_plan
+from ai_cards import get_client, get_prompt_cache, getResponseFromPrompt, streamResponseFromPrompt
 
 ENV_FILE = find_dotenv()
 if ENV_FILE:
@@ -19,202 +31,264 @@ if ENV_FILE:
 app = Flask(__name__)
 app.secret_key = env.get("APP_SECRET_KEY")
 
-# MongoDB connection
-try:
-    mongo = pymongo.MongoClient(
-        host='localhost', 
-        port=27017,
-        serverSelectionTimeoutMS = 1000
-    )
-    db = mongo.studystack
-    mongo.server_info() # Triggers the exception if connection to the database is unsuccessful
-    print("Connected to MongoDB successfully")
-except Exception as ex:
-    print(f"ERROR - Cannot connect to MongoDB: {ex}")
-    db = None
+# Decks with at least this many cards are loaded column by column to save memory
+COLUMNAR_DECK_THRESHOLD = int(env.get("COLUMNAR_DECK_THRESHOLD", 1000))
+
+# Where users and decks live: "auto" (MongoDB if it answers, SQLite otherwise), "mongo", "sqlite" or "memory"
+store = open_deck_store(
+    backend=env.get("DECK_STORE", "auto"),
+    mongo_uri=env.get("MONGO_URI", "mongodb://localhost:27017/"),
+    sqlite_path=env.get("DECK_STORE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "studystacks.sqlite3")),
+    columnar_threshold=COLUMNAR_DECK_THRESHOLD
+)
+
+# Hydrated decks per user, reused until the user's deck_version changes
+deck_cache = DeckCache(
+    max_entries=int(env.get("DECK_CACHE_MAX_USERS", 1024)),
+    max_bytes=int(env.get("DECK_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+)
+
+# Per-deck answer similarity indexes for picking distractors, synced when the deck_version changes
+answer_indexes = AnswerIndexCache(max_entries=int(env.get("ANSWER_INDEX_CACHE_DECKS", 256)))
+
+# Per-deck duplicate card indexes for AI expansion and manual adds, synced when the deck_version changes
+dedup_indexes = DedupIndexCache(max_entries=int(env.get("DEDUP_INDEX_CACHE_DECKS", 256)))
+
+# AI deck expansions run here instead of in the request that asks for them
+expansion_jobs = JobQueue(
+    workers=int(env.get("AI_JOB_WORKERS", 2)),
+    max_queued=int(env.get("AI_JOB_QUEUE_SIZE", 20))
+)
+
+# Cards asked for in one AI prompt; larger expansions (up to AI_MAX_EXPANSION_CARDS) are split into parts
+AI_CARDS_PER_PROMPT = int(env.get("AI_CARDS_PER_PROMPT", 10))
+AI_MAX_EXPANSION_CARDS = int(env.get("AI_MAX_EXPANSION_CARDS", 100))
 
-# In-memory storage for decks (fallback if MongoDB is not available)
-user_decks = {}
+# Threads sending the parts of large expansions; COHERE_MAX_CONCURRENT caps how many calls are open at once
+ai_expansion_pool = ThreadPoolExecutor(max_workers=int(env.get("AI_FANOUT_WORKERS", 10)), thread_name_prefix="ai-expansion")
+
+# Study session plans (card order, answer modes, candidate answers) per deck, reused until the deck_version changes
+session_plans = DeckCache(
+    max_entries=int(env.get("SESSION_PLAN_CACHE_DECKS", 256)),
+    max_bytes=int(env.get("SESSION_PLAN_CACHE_BYTES", 32 * 1024 * 1024))
+)
 
 # User management helper functions
 def create_or_update_user(user_info):
     """Create or update user in database from OAuth info"""
-    if db is not None:
-        try:
-            user_id = user_info.get('sub')
-            email = user_info.get('email')
-            name = user_info.get('name')
-            picture = user_info.get('picture')
-            
-            if not user_id or not email:
-                return False
-            
-            # Check if user already exists
-            existing_user = db.users.find_one({"auth_id": user_id})
-            
-            user_data = {
-                "auth_id": user_id,
-                "email": email,
-                "name": name,
-                "picture": picture,
-                "last_login": datetime.datetime.utcnow()
-            }
-            
-            if existing_user:
-                # Update existing user
-                db.users.update_one(
-                    {"auth_id": user_id},
-                    {"$set": user_data}
-                )
-                print(f"Updated existing user: {email}")
-            else:
-                # Create new user
-                user_data["created_at"] = datetime.datetime.utcnow()
-                db.users.insert_one(user_data)
-                print(f"Created new user: {email}")
-            
-            return True
-        except Exception as ex:
-            print(f"Error creating/updating user: {ex}")
-            return False
-    return False
+    user_id = user_info.get('sub')
+    email = user_info.get('email')
+    if not user_id or not email:
+        return False
+    return store.upsert_user(user_id, email, user_info.get('name'), user_info.get('picture'))
 
 def get_user_by_auth_id(auth_id):
     """Get user from database by auth ID"""
-    if db is not None:
-        try:
-            return db.users.find_one({"auth_id": auth_id})
-        except Exception as ex:
-            print(f"Error getting user: {ex}")
-    return None
+    return store.get_user(auth_id)
+
+# Deck helper functions: the store does the storage, these add caching on top
+def clone_decks(decks):
+    """Copy a cached deck list so a request can edit it without touching the cache
+
+    Deck objects and their card lists are copied; Flashcard objects are shared, which is
+    safe because every change to a card is followed by a save that invalidates the cache.
+    """
+    copies = DeckList(loaded_ids=decks.loaded_ids)
+    for deck in decks:
+        copy = deck.copy()
+        copy._id = deck._id
+        copy._snapshot = deck._snapshot
+        copy._version = getattr(deck, '_version', None)
+        copies.append(copy)
+    return copies
+
+def forget_cached_decks(auth_id, deck_id=None):
+    """Drop this process's cached copies of a user's decks; other processes notice the bumped deck_version"""
+    deck_cache.invalidate(auth_id)
+    if deck_id is not None:
+        deck_cache.invalidate((auth_id, deck_id))
+
+def get_user_deck_version(auth_id):
+    """Get the counter every change to a user's decks bumps, or None if there is no such user"""
+    return store.get_deck_version(auth_id)
 
-# MongoDB helper functions
 def get_user_decks(auth_id):
-    """Get all decks for a user from MongoDB using their auth_id"""
-    if db is not None:
-        try:
-            # First, get the user from database to ensure they exist
-            user = db.users.find_one({"auth_id": auth_id})
-            if not user:
-                print(f"User with auth_id {auth_id} not found in database")
-                return []
-            
-            # Get decks linked to this user
-            decks_data = list(db.decks.find({"user_auth_id": auth_id}))
-            decks = []
-            for deck_data in decks_data:
-                # Convert MongoDB document to Deck object
-                flashcards = []
-                for card_data in deck_data.get('flashcards', []):
-                    flashcard = Flashcard(
-                        card_data['question'],
-                        card_data['answer'],
-                        card_data.get('correct_answers', 0),
-                        card_data.get('reversible', False)
-                    )
-                    flashcards.append(flashcard)
-                
-                deck = Deck(deck_data['name'], flashcards)
-                deck.experience = deck_data.get('experience', 0)
-                # Store the deck's database ID for future operations
-                deck._id = str(deck_data.get('_id', ''))
-                decks.append(deck)
-            return decks
-        except Exception as ex:
-            print(f"Error getting decks from MongoDB: {ex}")
+    """Get all decks for a user using their auth_id"""
+    # First, get the user's deck version to ensure they exist
+    version = store.get_deck_version(auth_id)
+    if version is None:
+        print(f"User with auth_id {auth_id} not found in database")
+        return DeckList()
     
-    # Fallback to in-memory storage (using auth_id as key)
-    return user_decks.get(auth_id, [])
-
-def save_user_decks(auth_id, decks):
-    """Save all decks for a user to MongoDB using their auth_id"""
-    if db is not None:
-        try:
-            # First, verify the user exists in database
-            user = db.users.find_one({"auth_id": auth_id})
-            if not user:
-                print(f"Cannot save decks: User with auth_id {auth_id} not found")
-                return False
-            
-            # Get existing deck IDs to track what needs to be deleted
-            existing_decks = list(db.decks.find({"user_auth_id": auth_id}, {"_id": 1}))
-            existing_deck_ids = [str(deck["_id"]) for deck in existing_decks]
-            processed_deck_ids = []
-            
-            # Save/update each deck individually
-            for deck in decks:
-                flashcards_data = []
-                for card in deck.flashcards:
-                    flashcards_data.append({
-                        'question': card.question,
-                        'answer': card.answer,
-                        'correct_answers': card.correct_answers,
-                        'reversible': card.reversible
-                    })
-                
-                deck_data = {
-                    'user_auth_id': auth_id,
-                    'user_object_id': user['_id'],
-                    'name': deck.name,
-                    'experience': deck.experience,
-                    'flashcards': flashcards_data,
-                    'updated_at': datetime.datetime.utcnow()
-                }
-                
-                # If deck has an existing ID, update it
-                if hasattr(deck, '_id') and deck._id and deck._id in existing_deck_ids:
-                    try:
-                        result = db.decks.update_one(
-                            {"_id": ObjectId(deck._id)},
-                            {"$set": deck_data}
-                        )
-                        if result.modified_count > 0:
-                            processed_deck_ids.append(deck._id)
-                        print(f"Updated deck: {deck.name}")
-                    except Exception as e:
-                        print(f"Error updating deck {deck.name}: {e}")
-                        # If update fails, create new deck
-                        deck_data['created_at'] = datetime.datetime.utcnow()
-                        result = db.decks.insert_one(deck_data)
-                        deck._id = str(result.inserted_id)
-                        processed_deck_ids.append(deck._id)
-                else:
-                    # Create new deck
-                    deck_data['created_at'] = datetime.datetime.utcnow()
-                    result = db.decks.insert_one(deck_data)
-                    deck._id = str(result.inserted_id)
-                    processed_deck_ids.append(deck._id)
-                    print(f"Created new deck: {deck.name}")
-            
-            # Remove decks that are no longer in the list
-            decks_to_delete = [deck_id for deck_id in existing_deck_ids if deck_id not in processed_deck_ids]
-            if decks_to_delete:
-                db.decks.delete_many({"_id": {"$in": [ObjectId(deck_id) for deck_id in decks_to_delete]}})
-                print(f"Deleted {len(decks_to_delete)} removed decks")
-            
-            return True
-        except Exception as ex:
-            print(f"Error saving decks to MongoDB: {ex}")
-            return False
+    cached = deck_cache.get(auth_id, version)
+    if cached is not None:
+        return clone_decks(cached)
     
-    # Fallback to in-memory storage (using auth_id as key)
-    user_decks[auth_id] = decks
-    return True
+    decks = store.load_decks(auth_id)
+    for deck in decks:
+        deck._version = version
+    deck_cache.put(auth_id, version, decks)
+    return clone_decks(decks)
 
-def generate_ai_cards(deck, num_cards=5):
-    print("Got here first tho")
-    """Generate AI cards for a deck, avoiding duplicates with existing cards."""
-    existing_questions = [card.question.lower() for card in deck.flashcards]
-    existing_answers = [card.answer.lower() for card in deck.flashcards]
+def get_user_deck(auth_id, deck_id):
+    """Get one of a user's decks by its ID, or None if the user has no such deck"""
+    if not ObjectId.is_valid(deck_id):
+        return None
+    # Reuse the user's cached deck when it is still current
+    version = store.get_deck_version(auth_id)
+    if version is None:
+        return None
+    cached = deck_cache.get((auth_id, deck_id), version)
+    if cached is not None:
+        return clone_decks(cached)[0]
     
+    deck = store.load_deck(auth_id, deck_id)
+    if deck is None:
+        return None
+    deck._version = version
+    deck_cache.put((auth_id, deck_id), version, DeckList([deck], [deck._id]))
+    return clone_decks(DeckList([deck], [deck._id]))[0]
+
+def get_user_card(auth_id, deck_id, card_id):
+    """Get a single card of one of a user's decks without loading the rest of the deck"""
+    if not ObjectId.is_valid(deck_id):
+        return None
+    return store.get_card(auth_id, deck_id, card_id)
+
+def get_user_card_id(auth_id, deck_id, card_index):
+    """Look up the ID of the card at a position, fetching only that card"""
+    return store.get_card_id(auth_id, deck_id, card_index)
+
+def create_user_deck(auth_id, name, experience=0):
+    """Create an empty deck for a user and return its ID"""
+    # Saving a list with no loaded IDs only inserts; nothing else is touched
+    decks = DeckList([Deck(name, [], experience)])
+    if not save_user_decks(auth_id, decks):
+        return None
+    return decks[0]._id
+
+def add_user_cards(auth_id, deck_id, cards):
+    """Append cards to one of a user's decks in a single write"""
+    if not cards:
+        return True
+    added = store.add_cards(auth_id, deck_id, cards)
+    if added:
+        forget_cached_decks(auth_id, deck_id)
+    return added
+
+def delete_user_card(auth_id, deck_id, card_id):
+    """Remove one card from one of a user's decks in a single write"""
+    deleted = store.delete_card(auth_id, deck_id, card_id)
+    if deleted:
+        forget_cached_decks(auth_id, deck_id)
+    return deleted
+
+def delete_user_deck(auth_id, deck_id):
+    """Delete one of a user's decks"""
+    answer_indexes.invalidate((auth_id, deck_id))
+    answer_indexes.invalidate((auth_id, deck_id, 'questions'))
+    dedup_indexes.invalidate((auth_id, deck_id))
+    deleted = store.delete_deck(auth_id, deck_id)
+    if deleted:
+        forget_cached_decks(auth_id, deck_id)
+    return deleted
+
+def get_user_deck_page(auth_id, deck_id, offset, limit):
+    """Get a deck's summary and one page of its cards, or (None, []) if the user has no such deck"""
+    if not ObjectId.is_valid(deck_id):
+        return None, []
+    return store.get_deck_page(auth_id, deck_id, offset, limit)
+
+def get_user_deck_summaries(auth_id):
+    """Get name, experience and card count of each of a user's decks without loading any cards"""
+    return store.get_deck_summaries(auth_id)
+
+def save_user_decks(auth_id, decks):
+    """Save the changes made to a user's decks since they were loaded"""
+    loaded_ids = set(getattr(decks, 'loaded_ids', None) or ())
+    saved = store.save_decks(auth_id, decks)
+    # Even a failed save may have changed some decks
+    forget_cached_decks(auth_id)
+    for deck_id in loaded_ids | {getattr(deck, '_id', None) for deck in decks}:
+        deck_cache.invalidate((auth_id, deck_id))
+    return saved
+
+def record_answers(auth_id, deck_id, correct_counts):
+    """Atomically add correct answers to several cards of one deck, and those to cards it has to its experience
+
+    correct_counts maps card_id -> number of new correct answers; everything goes out in one update.
+    """
+    correct_counts = {card_id: count for card_id, count in correct_counts.items() if count > 0}
+    if not correct_counts:
+        return True
+    recorded = store.record_answers(auth_id, deck_id, correct_counts)
+    if recorded:
+        forget_cached_decks(auth_id, deck_id)
+    return recorded
+
+def record_correct_answer(auth_id, deck_id, card_id):
+    """Atomically add one correct answer to a card and one experience point to its deck"""
+    recorded = store.record_correct_answer(auth_id, deck_id, card_id)
+    if recorded:
+        forget_cached_decks(auth_id, deck_id)
+    return recorded
+
+def publish_user_deck(auth_id, deck_id):
+    """Publish the current cards of one of a user's decks as a new public version; the public deck, or None"""
+    if not ObjectId.is_valid(deck_id):
+        return None
+    return store.publish_deck(auth_id, deck_id)
+
+def subscribe_user(auth_id, public_id):
+    """Give a user a deck that follows a public deck, sharing its cards; the new deck's ID, or None"""
+    if not ObjectId.is_valid(public_id):
+        return None
+    deck_id = store.subscribe(auth_id, public_id)
+    if deck_id is not None:
+        forget_cached_decks(auth_id)
+    return deck_id
+
+def update_user_subscription(auth_id, deck_id):
+    """Move a subscribed deck to the latest public version, keeping the user's progress and edits"""
+    updated = ObjectId.is_valid(deck_id) and store.update_subscription(auth_id, deck_id)
+    if updated:
+        forget_cached_decks(auth_id, deck_id)
+    return updated
+
+def get_deck_sharing(auth_id, deck_id):
+    """What the deck page shows about sharing: the public deck it was published as, and the one it follows"""
+    source = store.get_deck_source(auth_id, deck_id)
+    following = store.get_public_deck(source['public_id']) if source else None
+    return {
+        "published": store.get_published_deck(auth_id, deck_id),
+        "source": source,
+        "following": following,
+        "update_available": bool(following and following['version'] != source['version'])
+    }
+
+def expansion_parts(num_cards):
+    """Sizes of the prompts a num_cards expansion is split into, as even as possible"""
+    parts = -(-num_cards // AI_CARDS_PER_PROMPT)
+    return [num_cards // parts + (1 if part < num_cards % parts else 0) for part in range(parts)]
+
+def expansion_prompt(deck, num_cards, part=0, parts=1, first_card=1, total_cards=None):
+    """Prompt for num_cards new cards; part/parts give this prompt its own slice of a larger expansion"""
     # Create context about existing cards
     existing_cards_text = ""
     if deck.flashcards:
         existing_cards_text = "\n\nExisting cards in this deck (DO NOT create duplicates):\n"
         for card in deck.flashcards[:10]:  # Show up to 10 existing cards for context
             existing_cards_text += f"Q: {card.question} | A: {card.answer}\n"
-    
-    prompt = f"""Generate {num_cards} flashcards for the deck "{deck.name}".
+
+    # Each part covers a different stretch of one ordered set, so parallel prompts don't repeat each other
+    part_text = ""
+    if parts > 1:
+        last_card = first_card + num_cards - 1
+        part_text = (f"\n- This is part {part + 1} of {parts} of a {total_cards}-card set that goes from the basics "
+                     f"(part 1) to the most advanced details (part {parts}). Write only cards {first_card}-{last_card} "
+                     f"of that set, on topics the other parts would not cover.")
+
+    return f"""Generate {num_cards} flashcards for the deck "{deck.name}".
 Each line should be formatted EXACTLY as:
 Q: <question> | A: <answer>
 
@@ -225,109 +299,177 @@ Requirements:
 - Questions and answers must be in the same style as the existing cards.
 - Answers should be accurate and brief
 - DO NOT create any duplicates of existing cards.
-- DO NOT add any filler text to your response. Respond only with the formatted text.
+- DO NOT add any filler text to your response. Respond only with the formatted text.{part_text}
 
 Here are the existing cards: {existing_cards_text}
 
 Generate {num_cards} new unique flashcards now:"""
 
-    try:
-        response = getResponseFromPrompt(prompt)
-        print("Got it!")
-        return parse_ai_response(response, existing_questions, existing_answers)
-    except Exception as e:
-        print(f"Error generating AI cards: {e}")
-        return []
-
-def parse_ai_response(response, existing_questions, existing_answers):
-    """Parse AI response and return list of Flashcard objects."""
-    cards = []
-    lines = response.strip().split('\n')
-    
-    for line in lines:
-        line = line.strip()
-        if not line or not ('Q:' in line and 'A:' in line and '|' in line):
-            continue
-            
-        try:
-            # Split on | to get question and answer parts
-            parts = line.split('|', 1)
-            if len(parts) != 2:
-                continue
-                
-            question_part = parts[0].strip()
-            answer_part = parts[1].strip()
-            
-            # Remove Q: and A: prefixes
-            if question_part.startswith('Q:'):
-                question = question_part[2:].strip()
-            else:
+def expansion_filter(deck, dedup_index=None):
+    """Filter for AI cards, which must not repeat the deck's questions (even reworded) or its answers"""
+    if dedup_index is None:
+        dedup_index = DedupIndex(card_pairs(deck))
+    return NewCardFilter(dedup_index, match_answers=True)
+
+def deck_dedup_index(auth_id, deck_id, deck):
+    """The duplicate card index of one of a user's decks, synced with the deck as loaded"""
+    return dedup_indexes.get((auth_id, deck_id), getattr(deck, '_version', None), card_pairs(deck))
+
+def expansion_prompts(deck, num_cards):
+    """One prompt per part of a num_cards expansion"""
+    sizes = expansion_parts(num_cards)
+    prompts = []
+    first_card = 1
+    for part, size in enumerate(sizes):
+        prompts.append(expansion_prompt(deck, size, part, len(sizes), first_card, num_cards))
+        first_card += size
+    return prompts
+
+def generate_ai_cards(deck, num_cards=5, dedup_index=None):
+    """Generate AI cards for a deck, avoiding duplicates with existing cards.
+
+    Expansions larger than AI_CARDS_PER_PROMPT are split into parts sent in parallel.
+    """
+    new_cards_filter = expansion_filter(deck, dedup_index)
+
+    prompts = expansion_prompts(deck, num_cards)
+    new_cards = []
+    error = None
+    refresh = False
+    while prompts:
+        responses = {ai_expansion_pool.submit(getResponseFromPrompt, prompt, refresh=refresh): prompt for prompt in prompts}
+        prompts = []
+        # Parts are merged as they finish; the shared sets drop cards another part already produced
+        for future in as_completed(responses):
+            try:
+                response = future.result()
+            except Exception as ex:
+                print(f"Error generating AI cards: {ex}")
+                error = error or ex
                 continue
-                
-            if answer_part.startswith('A:'):
-                answer = answer_part[2:].strip()
+            cards = parse_ai_response(response, new_cards_filter)
+            if not cards and not refresh:
+                # A cached response may only hold cards the deck already has; ask upstream for fresh ones
+                prompts.append(responses[future])
+            new_cards.extend(cards)
+        refresh = True
+
+    # Errors reach the caller when nothing came back, so a failed expansion job is reported as failed
+    if error is not None and not new_cards:
+        raise error
+    return new_cards[:num_cards]
+
+def stream_ai_cards(deck, num_cards=5, dedup_index=None):
+    """Yield new AI cards for a deck as soon as the AI has written each one
+
+    Parts of a large expansion stream in parallel; their cards come out in the order they are finished.
+    """
+    new_cards_filter = expansion_filter(deck, dedup_index)
+    arrived = queue.Queue()
+    stopped = threading.Event()
+
+    def stream_part(prompt):
+        try:
+            refresh = False
+            while True:
+                new = 0
+                pieces = streamResponseFromPrompt(prompt, refresh=refresh)
+                try:
+                    for question, answer in iter_card_lines(pieces):
+                        if stopped.is_set():
+                            return
+                        if not new_cards_filter.accept(question, answer):
+                            continue
+                        arrived.put(Flashcard(question, answer, 0, False))
+                        new += 1
+                finally:
+                    pieces.close()  # hangs up on the AI if this part stopped early
+                if new or refresh:
+                    return
+                # A cached response may only hold cards the deck already has; ask upstream for fresh ones
+                refresh = True
+        except Exception as ex:
+            arrived.put(ex)
+        finally:
+            arrived.put(None)
+
+    prompts = expansion_prompts(deck, num_cards)
+    for prompt in prompts:
+        ai_expansion_pool.submit(stream_part, prompt)
+
+    parts_left = len(prompts)
+    produced = 0
+    error = None
+    try:
+        while parts_left and produced < num_cards:
+            item = arrived.get()
+            if item is None:
+                parts_left -= 1
+            elif isinstance(item, Exception):
+                print(f"Error generating AI cards: {item}")
+                error = error or item
             else:
-                continue
-            
-            # Check for duplicates (case insensitive)
-            if question.lower() not in existing_questions and answer.lower() not in existing_answers:
-                cards.append(Flashcard(question, answer, 0, False))
-                existing_questions.append(question.lower())
-                existing_answers.append(answer.lower())
-                
-        except Exception as e:
-            print(f"Error parsing line '{line}': {e}")
-            continue
-    
-    return cards
+                produced += 1
+                yield item
+    finally:
+        # Parts still streaming (the reader left, or enough cards came in) stop at their next line
+        stopped.set()
+    if error is not None and not produced:
+        raise error
 
-def generate_study_session(deck):
-    """Generate study session data with answer choices for each card."""
-    study_data = []
-    all_answers = [card.answer for card in deck.flashcards]
-    
-    for i, card in enumerate(deck.flashcards):
-        card_data = {
-            'question': card.question,
-            'correct_answer': card.answer,
-            'correct_count': card.correct_answers,
-            'reversible': card.reversible
-        }
-        
-        # Determine answer mode based on correct answers and deck size
-        if card.correct_answers > 5:
-            # Guaranteed typed answer if >5 correct answers
-            card_data['answer_mode'] = 'typed'
-            card_data['choices'] = []
-        elif len(deck.flashcards) < 4:
-            # True/False mode for small decks
-            card_data['answer_mode'] = 'true_false'
-            # Generate a false answer by picking a random different answer
-            false_answers = [ans for ans in all_answers if ans != card.answer]
-            false_answer = random.choice(false_answers) if false_answers else "False answer"
-            
-            choices = [card.answer, false_answer]
-            random.shuffle(choices)
-            card_data['choices'] = choices
-        else:
-            # Multiple choice mode
-            card_data['answer_mode'] = 'multiple_choice'
-            # Get 3 wrong answers from other cards
-            wrong_answers = [ans for ans in all_answers if ans != card.answer]
-            selected_wrong = random.sample(wrong_answers, min(3, len(wrong_answers)))
-            
-            # If we don't have enough wrong answers, generate some generic ones
-            while len(selected_wrong) < 3:
-                selected_wrong.append(f"Option {len(selected_wrong) + 1}")
-            
-            choices = [card.answer] + selected_wrong[:3]
-            random.shuffle(choices)
-            card_data['choices'] = choices
+def run_deck_expansion(auth_id, deck_id, num_cards):
+    """Background job: generate AI cards for one of a user's decks and save them"""
+    deck = get_user_deck(auth_id, deck_id)
+    if deck is None:
+        raise LookupError("deck not found")
+    new_cards = generate_ai_cards(deck, num_cards, deck_dedup_index(auth_id, deck_id, deck))
+    if not add_user_cards(auth_id, deck_id, new_cards):
+        raise RuntimeError("could not save the generated cards")
+    return {"added": len(new_cards), "cards": [card_to_document(card) for card in new_cards]}
+
+def parse_card_line(line):
+    """The (question, answer) of a "Q: <question> | A: <answer>" line, or None if the line isn't one"""
+    line = line.strip()
+    if not line or not ('Q:' in line and 'A:' in line and '|' in line):
+        return None
+
+    # Split on | to get question and answer parts
+    question_part, answer_part = (part.strip() for part in line.split('|', 1))
+
+    # Remove Q: and A: prefixes
+    if not question_part.startswith('Q:') or not answer_part.startswith('A:'):
+        return None
+    return question_part[2:].strip(), answer_part[2:].strip()
+
+def parse_ai_response(response, new_cards_filter):
+    """Parse AI response and return list of Flashcard objects that new_cards_filter accepts."""
+    cards = []
+    for line in response.strip().split('\n'):
+        parsed = parse_card_line(line)
+        if parsed is None:
+            continue
+        question, answer = parsed
         
-        study_data.append(card_data)
+        if new_cards_filter.accept(question, answer):
+            cards.append(Flashcard(question, answer, 0, False))
     
-    return study_data
+    return cards
 
+def iter_card_lines(pieces):
+    """Yield (question, answer) pairs from a reply arriving piece by piece, each as soon as its line is complete"""
+    pending = ""
+    for piece in pieces:
+        pending += piece
+        if '\n' not in piece:
+            continue
+        *lines, pending = pending.split('\n')
+        for line in lines:
+            parsed = parse_card_line(line)
+            if parsed is not None:
+                yield parsed
+    parsed = parse_card_line(pending)
+    if parsed is not None:
+        yield parsed
 
 oauth = OAuth(app)
 
@@ -426,7 +568,7 @@ def study():
         return redirect('/login')
     
     auth_id = user['userinfo']['sub']
-    decks = get_user_decks(auth_id)
+    decks = get_user_deck_summaries(auth_id)
     return render_template('study.html', user=user, decks=decks)
 
 @app.route('/study/select', methods=['POST'])
@@ -434,100 +576,236 @@ def study_select():
     user = session.get('user')
     if not user:
         return redirect('/login')
-
-    idx = request.form.get('selected_deck_index')
-    if idx is None:
-        return redirect('/study')
-    try:
-        deck_index = int(idx)
-    except (TypeError, ValueError):
-        return redirect('/study')
     
-    # Validate deck has enough cards
     auth_id = user['userinfo']['sub']
-    decks = get_user_decks(auth_id)
+    decks = get_user_deck_summaries(auth_id)
+    
+    deck_id = request.form.get('selected_deck_id')
+    if deck_id is None:
+        # Older pages post the deck's position instead of its ID
+        try:
+            deck_index = int(request.form.get('selected_deck_index'))
+        except (TypeError, ValueError):
+            return redirect('/study')
+        if deck_index >= len(decks):
+            return redirect('/study')
+        deck_id = decks[deck_index]._id
     
-    if deck_index >= len(decks) or len(decks[deck_index].flashcards) < 2:
+    # Validate deck has enough cards
+    summary = next((deck for deck in decks if deck._id == deck_id), None)
+    if summary is None or summary.card_count < 2:
         return redirect('/study')
     
-    return redirect(f'/study/{deck_index}')
+    return redirect(f'/decks/{deck_id}/study')
+
+# Configuration for different study modes
+GAME_CONFIG = {
+    'normal': {
+        'player_hp_multiplier': 20,
+        'monster_hp_ratio': 2/3,
+        'monster_hp_base': 10,
+        'monster_attack_min': 5,
+        'monster_attack_max': 10,
+        'spell_charge_requirement': 3,
+        'spell_damage': 20,
+        'spell_healing': 20
+    },
+    'exam_prep': {
+        'player_hp_multiplier': 20,  # Same as normal for now
+        'monster_hp_ratio': 4/5,     # Same as normal for now
+        'monster_hp_base': 30,       # Same as normal for now
+        'monster_attack_min': 10,     # Different monster attack
+        'monster_attack_max': 15,    # Different monster attack
+        'spell_charge_requirement': 3, # Requires 5 correct answers
+        'spell_damage': 30,          # Higher spell damage for exam prep
+        'spell_healing': 50          # Higher spell healing for exam prep
+    }
+}
+
+def plan_deck_session(auth_id, deck_id, deck):
+    """Plan a study session of one of a user's loaded decks lazily, card by card"""
+    version = getattr(deck, '_version', None)
+    # Wrong answers are picked among the ones that look like the right answers (or questions,
+    # for reversed cards, whose index is only loaded once a reversed card comes up)
+    answer_index = answer_indexes.get((auth_id, deck_id), version, deck_answers(deck))
+    return iter_session_plan(
+        deck,
+        answer_index=answer_index,
+        load_question_index=lambda: answer_indexes.get((auth_id, deck_id, 'questions'), version, deck_questions(deck))
+    )
+
+def get_session_plan(auth_id, deck_id, version=None):
+    """Get the study session plan of one of a user's decks, reusing the cached one while the deck is unchanged
+
+    version is the user's deck_version if the caller already read it. Returns (plan, version),
+    or (None, None) if there is no such deck.
+    """
+    if version is not None:
+        plan = session_plans.get((auth_id, deck_id), version)
+        if plan is not None:
+            return plan, version
+    
+    deck = get_user_deck(auth_id, deck_id)
+    if deck is None:
+        return None, None
+    version = getattr(deck, '_version', None)
+    plan = list(plan_deck_session(auth_id, deck_id, deck))
+    if version is not None:
+        session_plans.put((auth_id, deck_id), version, plan, estimate_plan_size(plan))
+    return plan, version
 
-@app.route('/study/<int:deck_index>')
-def study_deck(deck_index):
+@app.route('/decks/<deck_id>/study')
+def study_deck(deck_id):
     user = session.get('user')
     if not user:
         return redirect('/login')
     
     auth_id = user['userinfo']['sub']
-    decks = get_user_decks(auth_id)
+    # The page only needs the deck's name and size; the cards come from /decks/<deck_id>/session
+    deck, _ = get_user_deck_page(auth_id, deck_id, 0, 1)
     
     # Get mode parameter (normal or exam_prep)
     mode = request.args.get('mode', 'normal')
     
-    if deck_index < len(decks):
-        deck = decks[deck_index]
-        if not deck.flashcards or len(deck.flashcards) < 2:
-            return redirect('/study')
-        
-        # Generate study session data with answer choices
-        study_data = generate_study_session(deck)
-        
-        # Configuration for different modes
-        game_config = {
-            'normal': {
-                'player_hp_multiplier': 20,
-                'monster_hp_ratio': 2/3,
-                'monster_hp_base': 10,
-                'monster_attack_min': 5,
-                'monster_attack_max': 10,
-                'spell_charge_requirement': 3,
-                'spell_damage': 20,
-                'spell_healing': 20
-            },
-            'exam_prep': {
-                'player_hp_multiplier': 20,  # Same as normal for now
-                'monster_hp_ratio': 4/5,     # Same as normal for now
-                'monster_hp_base': 30,       # Same as normal for now
-                'monster_attack_min': 10,     # Different monster attack
-                'monster_attack_max': 15,    # Different monster attack
-                'spell_charge_requirement': 3, # Requires 5 correct answers
-                'spell_damage': 30,          # Higher spell damage for exam prep
-                'spell_healing': 50          # Higher spell healing for exam prep
-            }
-        }
-        
-        config = game_config.get(mode, game_config['normal'])
-        
-        return render_template('study-session.html', 
-                             user=user, 
-                             deck=deck, 
-                             deck_index=deck_index, 
-                             study_data=study_data,
-                             mode=mode,
-                             game_config=config)
-    
-    return redirect('/study')
-
-@app.route('/study/<int:deck_index>/answer', methods=['POST'])
-def submit_answer(deck_index):
+    if deck is None or deck.card_count < 2:
+        return redirect('/study')
+    
+    config = GAME_CONFIG.get(mode, GAME_CONFIG['normal'])
+    
+    return render_template('study-session.html', 
+                         user=user, 
+                         deck=deck, 
+                         mode=mode,
+                         game_config=config,
+                         max_answers=MAX_ANSWER_EVENTS)
+
+@app.route('/decks/<deck_id>/session')
+def study_session_data(deck_id):
+    """The study session plan of a deck as JSON, revalidated by ETag; the page deals each card's choices itself"""
+    user = session.get('user')
+    if not user:
+        return jsonify({"error": "not logged in"}), 401
+    if not ObjectId.is_valid(deck_id):
+        return jsonify({"error": "deck not found"}), 404
+    
+    auth_id = user['userinfo']['sub']
+    version = get_user_deck_version(auth_id)
+    if session_not_modified(deck_id, version):
+        return session_cache_headers(Response(status=304), deck_id, version)
+    
+    plan, version = get_session_plan(auth_id, deck_id, version)
+    if plan is None:
+        return jsonify({"error": "deck not found"}), 404
+    
+    return session_cache_headers(jsonify({"deck_id": deck_id, "cards": plan}), deck_id, version)
+
+# Cards planned before the rest of the stream is sent in batches of this many lines
+SESSION_STREAM_BATCH = 50
+
+@app.route('/decks/<deck_id>/session.ndjson')
+def stream_study_session(deck_id):
+    """The study session plan as newline-delimited JSON: a header line with the total, then one card per line
+
+    Cards are planned as they are sent, so the first one goes out before the rest of the
+    deck is looked at. A fully sent plan is cached like the one /decks/<deck_id>/session builds.
+    """
+    user = session.get('user')
+    if not user:
+        return jsonify({"error": "not logged in"}), 401
+    if not ObjectId.is_valid(deck_id):
+        return jsonify({"error": "deck not found"}), 404
+    
+    auth_id = user['userinfo']['sub']
+    version = get_user_deck_version(auth_id)
+    if session_not_modified(deck_id, version):
+        return session_cache_headers(Response(status=304), deck_id, version)
+    
+    plan = session_plans.get((auth_id, deck_id), version) if version is not None else None
+    if plan is not None:
+        planned, total, finished_plan = iter(plan), len(plan), None
+    else:
+        deck = get_user_deck(auth_id, deck_id)
+        if deck is None:
+            return jsonify({"error": "deck not found"}), 404
+        version = getattr(deck, '_version', None)
+        planned, total, finished_plan = plan_deck_session(auth_id, deck_id, deck), count_session_cards(deck), []
+    
+    def generate():
+        yield json.dumps({"deck_id": deck_id, "total": total}) + "\n"
+        lines = []
+        for sent, card_data in enumerate(planned):
+            if finished_plan is not None:
+                finished_plan.append(card_data)
+            lines.append(json.dumps(card_data))
+            # The first card goes out on its own so the page can start right away
+            if sent == 0 or len(lines) >= SESSION_STREAM_BATCH:
+                yield "\n".join(lines) + "\n"
+                lines = []
+        if lines:
+            yield "\n".join(lines) + "\n"
+        if finished_plan is not None and version is not None:
+            session_plans.put((auth_id, deck_id), version, finished_plan, estimate_plan_size(finished_plan))
+    
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    return session_cache_headers(response, deck_id, version)
+
+def session_not_modified(deck_id, version):
+    """Whether the browser's copy of a deck's session plan (by If-None-Match) is still current"""
+    return version is not None and request.if_none_match.contains_weak(f"{deck_id}.{version}")
+
+def session_cache_headers(response, deck_id, version):
+    """Let browsers keep a session plan but revalidate it by deck version; plans of in-memory decks aren't cached"""
+    if version is not None:
+        # Weak: a plan rebuilt after eviction may pick other candidates, but is just as good
+        response.set_etag(f"{deck_id}.{version}", weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    else:
+        response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/decks/<deck_id>/answer', methods=['POST'])
+def submit_answer(deck_id):
     user = session.get('user')
     if not user:
         return redirect('/login')
     
     auth_id = user['userinfo']['sub']
-    decks = get_user_decks(auth_id)
+    card_id = request.form.get('card_id')
+    if request.form.get('correct') == 'true' and card_id:
+        record_correct_answer(auth_id, deck_id, card_id)
     
-    if deck_index < len(decks):
-        card_index = int(request.form.get('card_index', 0))
-        correct = request.form.get('correct') == 'true'
-        
-        # Update card's correct answers if answered correctly
-        if correct and card_index < len(decks[deck_index].flashcards):
-            decks[deck_index].flashcards[card_index].correct_answers += 1
-            decks[deck_index].experience += 1
-            save_user_decks(auth_id, decks)
+    return redirect(f'/decks/{deck_id}/study')
+
+# Upper bound on answers per batch, keeps the single update document small and caps the experience one request can add
+MAX_ANSWER_EVENTS = 500
+
+@app.route('/decks/<deck_id>/answers', methods=['POST'])
+def submit_answers(deck_id):
+    """Record a batch of answers sent as JSON (by fetch or navigator.sendBeacon)"""
+    user = session.get('user')
+    if not user:
+        return jsonify({"error": "not logged in"}), 401
+    if not ObjectId.is_valid(deck_id):
+        return jsonify({"error": "deck not found"}), 404
+    
+    auth_id = user['userinfo']['sub']
+    # sendBeacon can't set headers reliably, so don't insist on the JSON content type
+    data = request.get_json(force=True, silent=True) or {}
+    answers = data.get('answers')
+    if not isinstance(answers, list):
+        return jsonify({"error": "answers must be a list"}), 400
+    if len(answers) > MAX_ANSWER_EVENTS:
+        return jsonify({"error": f"at most {MAX_ANSWER_EVENTS} answers per batch"}), 400
+    
+    correct_counts = {}
+    for answer in answers:
+        if isinstance(answer, dict) and answer.get('correct') is True and isinstance(answer.get('card_id'), str):
+            correct_counts[answer['card_id']] = correct_counts.get(answer['card_id'], 0) + 1
     
-    return redirect(f'/study/{deck_index}')
+    if not record_answers(auth_id, deck_id, correct_counts):
+        return jsonify({"error": "could not record answers"}), 500
+    # Answers to cards the deck no longer has are received but not recorded
+    return jsonify({"received": sum(correct_counts.values())})
 
 @app.route('/manage-decks')
 def manage_decks():
@@ -536,7 +814,7 @@ def manage_decks():
         return redirect('/login')
     
     auth_id = user['userinfo']['sub']
-    decks = get_user_decks(auth_id)
+    decks = get_user_deck_summaries(auth_id)
     return render_template('manage-decks.html', user=user, decks=decks)
 
 @app.route('/create-deck', methods=['POST'])
@@ -549,117 +827,426 @@ def create_deck():
     deck_name = request.form.get('deck_name')
     
     if deck_name:
-        decks = get_user_decks(auth_id)
-        new_deck = Deck(deck_name, [])
-        decks.append(new_deck)
-        save_user_decks(auth_id, decks)
-        # Auto-redirect to the newly created deck's manager
-        new_deck_index = len(decks) - 1
-        return redirect(f'/deck/{new_deck_index}')
+        deck_id = create_user_deck(auth_id, deck_name)
+        if deck_id:
+            # Auto-redirect to the newly created deck's manager
+            return redirect(f'/decks/{deck_id}')
     
     return redirect('/manage-decks')
 
-@app.route('/deck/<int:deck_index>')
-def view_deck(deck_index):
+# Cards rendered with the deck page, and the most the cards API returns at once
+CARDS_PAGE_SIZE = 50
+MAX_CARDS_PAGE_SIZE = 200
+
+def wants_json():
+    """True when the client asked for a JSON response instead of a redirect"""
+    return request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json'
+
+@app.route('/decks/<deck_id>')
+def view_deck(deck_id):
     user = session.get('user')
     if not user:
         return redirect('/login')
     
     auth_id = user['userinfo']['sub']
-    decks = get_user_decks(auth_id)
+    deck, cards = get_user_deck_page(auth_id, deck_id, 0, CARDS_PAGE_SIZE)
     
-    if deck_index < len(decks):
-        deck = decks[deck_index]
-        return render_template('deck-detail.html', user=user, deck=deck, deck_index=deck_index)
+    if deck is not None:
+        return render_template('deck-detail.html', user=user, deck=deck, cards=cards, page_size=CARDS_PAGE_SIZE,
+                               job_id=request.args.get('job'), max_expansion_cards=AI_MAX_EXPANSION_CARDS,
+                               duplicate=request.args.get('duplicate'), sharing=get_deck_sharing(auth_id, deck_id))
     
     return redirect('/manage-decks')
 
-@app.route('/deck/<int:deck_index>/add-card', methods=['POST'])
-def add_card(deck_index):
+@app.route('/decks/<deck_id>/cards')
+def list_cards(deck_id):
+    """One page of a deck's cards as JSON, for incremental loading"""
+    user = session.get('user')
+    if not user:
+        return jsonify({"error": "not logged in"}), 401
+    
+    try:
+        offset = max(0, int(request.args.get('offset', 0)))
+        limit = max(1, min(int(request.args.get('limit', CARDS_PAGE_SIZE)), MAX_CARDS_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return jsonify({"error": "offset and limit must be integers"}), 400
+    
+    auth_id = user['userinfo']['sub']
+    deck, cards = get_user_deck_page(auth_id, deck_id, offset, limit)
+    if deck is None:
+        return jsonify({"error": "deck not found"}), 404
+    
+    next_offset = offset + len(cards)
+    return jsonify({
+        "cards": [card_to_document(card) for card in cards],
+        "offset": offset,
+        "total": deck.card_count,
+        "next_offset": next_offset if next_offset < deck.card_count else None
+    })
+
+@app.route('/decks/<deck_id>/export.csv')
+def export_deck(deck_id):
     user = session.get('user')
     if not user:
         return redirect('/login')
     
     auth_id = user['userinfo']['sub']
-    decks = get_user_decks(auth_id)
+    deck = get_user_deck(auth_id, deck_id)
+    if deck is None:
+        return redirect('/manage-decks')
     
-    if deck_index < len(decks):
-        question = request.form.get('question')
-        answer = request.form.get('answer')
-        reversible = 'reversible' in request.form
-        
-        if question and answer:
-            new_card = Flashcard(question, answer, 0, reversible)
-            decks[deck_index].flashcards.append(new_card)
-            save_user_decks(auth_id, decks)
+    # progress=0 gives a copy to share, so others don't download it already completed
+    include_progress = request.args.get('progress', '1') != '0'
+    filename = ''.join(ch for ch in deck.name if ch.isalnum() or ch in ' -_').strip() or 'deck'
+    return Response(
+        stream_with_context(iter_encoded_deck(deck, include_progress)),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename="{filename}.csv"'}
+    )
+
+@app.route('/decks/<deck_id>/export.ssdk')
+def export_deck_binary(deck_id):
+    user = session.get('user')
+    if not user:
+        return redirect('/login')
+    
+    auth_id = user['userinfo']['sub']
+    deck = get_user_deck(auth_id, deck_id)
+    if deck is None:
+        return redirect('/manage-decks')
     
-    return redirect(f'/deck/{deck_index}')
+    include_progress = request.args.get('progress', '1') != '0'
+    filename = ''.join(ch for ch in deck.name if ch.isalnum() or ch in ' -_').strip() or 'deck'
+    return Response(
+        pack_deck(deck, include_progress),
+        mimetype='application/octet-stream',
+        headers={'Content-Disposition': f'attachment; filename="{filename}.ssdk"'}
+    )
 
-@app.route('/deck/<int:deck_index>/expand', methods=['POST'])
-def expand_deck(deck_index):
+# Cards are written to the new deck in batches of this size while the upload is parsed
+IMPORT_BATCH_SIZE = 500
+
+@app.route('/import-deck', methods=['POST'])
+def import_deck():
     user = session.get('user')
     if not user:
         return redirect('/login')
     
     auth_id = user['userinfo']['sub']
-    decks = get_user_decks(auth_id)
+    upload = request.files.get('deck_file')
+    if upload is None:
+        return redirect('/manage-decks')
     
-    if deck_index < len(decks):
-        deck = decks[deck_index]
-        
-        # Get number of cards to generate (default 5)
-        num_cards = request.form.get('num_cards', 5)
-        try:
-            num_cards = int(num_cards)
-            num_cards = max(1, min(num_cards, 10))  # Limit between 1-10 cards
-        except (ValueError, TypeError):
-            num_cards = 5
-        
-        # Generate AI cards
-        new_cards = generate_ai_cards(deck, num_cards)
+    deck_id = None
+    try:
+        if is_packed_deck(upload.stream.read(4)):
+            upload.stream.seek(0)
+            packed = unpack_deck(upload.stream.read())
+            # The file's card IDs are untrusted (duplicates, or '.' and '$' that break Mongo update paths), so cards get new ones
+            name, experience = packed.name, packed.experience
+            cards = (Flashcard(card.question, card.answer, card.correct_answers, card.reversible) for card in packed.flashcards)
+        else:
+            upload.stream.seek(0)
+            text = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+            name, experience, cards = read_deck_lazily(text)
+        deck_id = create_user_deck(auth_id, request.form.get('deck_name') or name, experience)
+        if deck_id is None:
+            return redirect('/manage-decks')
         
-        # Add generated cards to the deck
-        deck.flashcards.extend(new_cards)
-        save_user_decks(auth_id, decks)
+        # Cards repeating an earlier card of the file (even reworded) are left out
+        new_cards_filter = NewCardFilter(DedupIndex())
+        batch = []
+        for card in cards:
+            if not new_cards_filter.accept(card.question, card.answer):
+                continue
+            batch.append(card)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                add_user_cards(auth_id, deck_id, batch)
+                batch = []
+        add_user_cards(auth_id, deck_id, batch)
+        if new_cards_filter.skipped:
+            print(f"Skipped {new_cards_filter.skipped} duplicate cards importing deck {deck_id}")
+    except (ValueError, UnicodeDecodeError, csv.Error, zlib.error, lzma.LZMAError, struct.error) as ex:
+        print(f"Error importing deck: {ex}")
+        # CSV rows are parsed as they are added, so a bad row can come after the deck was created
+        if deck_id is not None:
+            delete_user_deck(auth_id, deck_id)
+        return redirect('/manage-decks')
     
-    return redirect(f'/deck/{deck_index}')
+    return redirect(f'/decks/{deck_id}')
 
-@app.route('/deck/<int:deck_index>/delete-card/<int:card_index>', methods=['POST'])
-def delete_card(deck_index, card_index):
+@app.route('/decks/<deck_id>/cards/<card_id>')
+def view_card(deck_id, card_id):
+    user = session.get('user')
+    if not user:
+        return jsonify({"error": "not logged in"}), 401
+    
+    auth_id = user['userinfo']['sub']
+    card = get_user_card(auth_id, deck_id, card_id)
+    if card is None:
+        return jsonify({"error": "card not found"}), 404
+    return jsonify(card_to_document(card))
+
+@app.route('/decks/<deck_id>/cards', methods=['POST'])
+def add_card(deck_id):
     user = session.get('user')
     if not user:
         return redirect('/login')
     
     auth_id = user['userinfo']['sub']
-    decks = get_user_decks(auth_id)
+    question = request.form.get('question')
+    answer = request.form.get('answer')
+    reversible = 'reversible' in request.form
     
-    if deck_index < len(decks) and card_index < len(decks[deck_index].flashcards):
-        decks[deck_index].flashcards.pop(card_index)
-        save_user_decks(auth_id, decks)
+    if question and answer and ObjectId.is_valid(deck_id):
+        deck = get_user_deck(auth_id, deck_id)
+        if deck is None:
+            return redirect('/manage-decks')
+        duplicate = deck_dedup_index(auth_id, deck_id, deck).find_duplicate(question, answer)
+        if duplicate is not None:
+            return redirect(f'/decks/{deck_id}?' + urlencode({'duplicate': duplicate[0]}))
+        new_card = Flashcard(question, answer, 0, reversible)
+        add_user_cards(auth_id, deck_id, [new_card])
     
-    return redirect(f'/deck/{deck_index}')
+    return redirect(f'/decks/{deck_id}')
 
-@app.route('/delete-deck/<int:deck_index>', methods=['POST'])
-def delete_deck(deck_index):
+@app.route('/decks/<deck_id>/expand', methods=['POST'])
+def expand_deck(deck_id):
     user = session.get('user')
     if not user:
         return redirect('/login')
     
     auth_id = user['userinfo']['sub']
-    decks = get_user_decks(auth_id)
+    deck, _ = get_user_deck_page(auth_id, deck_id, 0, 1)
+    if deck is None:
+        if wants_json():
+            return jsonify({"error": "deck not found"}), 404
+        return redirect('/manage-decks')
     
-    if deck_index < len(decks):
-        decks.pop(deck_index)
-        save_user_decks(auth_id, decks)
+    # Get number of cards to generate (default 5)
+    num_cards = request.form.get('num_cards', 5)
+    try:
+        num_cards = int(num_cards)
+        num_cards = max(1, min(num_cards, AI_MAX_EXPANSION_CARDS))
+    except (ValueError, TypeError):
+        num_cards = 5
+    
+    # The AI call can take tens of seconds, so it runs as a background job
+    try:
+        job_id = expansion_jobs.submit(run_deck_expansion, auth_id, deck_id, num_cards, owner=auth_id, kind="expand_deck")
+    except QueueFull:
+        if wants_json():
+            return jsonify({"error": "too many expansions are waiting, try again shortly"}), 503, {"Retry-After": "10"}
+        return redirect(f'/decks/{deck_id}')
+    
+    if wants_json():
+        return jsonify({"job_id": job_id, "status_url": f"/jobs/{job_id}"}), 202, {"Location": f"/jobs/{job_id}"}
+    return redirect(f'/decks/{deck_id}?job={job_id}')
+
+@app.route('/decks/<deck_id>/expand/stream', methods=['POST'])
+def stream_deck_expansion(deck_id):
+    """AI expansion as server-sent events: each card is saved and sent as soon as the AI has written it
+
+    Events are "card" (the saved card), then "done" with the number added, or "error".
+    """
+    user = session.get('user')
+    if not user:
+        return jsonify({"error": "not logged in"}), 401
+    
+    auth_id = user['userinfo']['sub']
+    deck = get_user_deck(auth_id, deck_id)
+    if deck is None:
+        return jsonify({"error": "deck not found"}), 404
+    
+    try:
+        num_cards = max(1, min(int(request.form.get('num_cards', 5)), AI_MAX_EXPANSION_CARDS))
+    except (ValueError, TypeError):
+        num_cards = 5
+    
+    def event(name, data):
+        return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+    
+    def generate():
+        added = 0
+        try:
+            for card in stream_ai_cards(deck, num_cards, deck_dedup_index(auth_id, deck_id, deck)):
+                if not add_user_cards(auth_id, deck_id, [card]):
+                    raise RuntimeError("could not save the generated cards")
+                added += 1
+                yield event("card", card_to_document(card))
+        except Exception as ex:
+            print(f"Error streaming AI cards: {ex}")
+            yield event("error", {"error": str(ex), "added": added})
+            return
+        yield event("done", {"added": added})
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-store'
+    # Proxies like nginx would otherwise hold the events back until the response ends
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Status of one of the user's background jobs, with its result once it is done"""
+    user = session.get('user')
+    if not user:
+        return jsonify({"error": "not logged in"}), 401
+    
+    job = expansion_jobs.get(job_id, owner=user['userinfo']['sub'])
+    if job is None:
+        return jsonify({"error": "job not found"}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/decks/<deck_id>/cards/<card_id>/delete', methods=['POST'])
+def delete_card(deck_id, card_id):
+    user = session.get('user')
+    if not user:
+        return redirect('/login')
+    
+    auth_id = user['userinfo']['sub']
+    deleted = ObjectId.is_valid(deck_id) and delete_user_card(auth_id, deck_id, card_id)
+    
+    if wants_json():
+        return jsonify({"deleted": bool(deleted)}), 200 if deleted else 404
+    return redirect(f'/decks/{deck_id}')
+
+@app.route('/decks/<deck_id>/delete', methods=['POST'])
+def delete_deck(deck_id):
+    user = session.get('user')
+    if not user:
+        return redirect('/login')
+    
+    auth_id = user['userinfo']['sub']
+    if ObjectId.is_valid(deck_id):
+        delete_user_deck(auth_id, deck_id)
     
     return redirect('/manage-decks')
 
+@app.route('/decks/<deck_id>/publish', methods=['POST'])
+def publish_deck(deck_id):
+    user = session.get('user')
+    if not user:
+        return redirect('/login')
+    
+    public = publish_user_deck(user['userinfo']['sub'], deck_id)
+    if wants_json():
+        return jsonify({"public_deck": public}) if public else (jsonify({"error": "deck not found"}), 404)
+    return redirect(f'/decks/{deck_id}')
+
+@app.route('/decks/<deck_id>/update-source', methods=['POST'])
+def update_deck_source(deck_id):
+    user = session.get('user')
+    if not user:
+        return redirect('/login')
+    
+    updated = update_user_subscription(user['userinfo']['sub'], deck_id)
+    if wants_json():
+        return jsonify({"updated": bool(updated)}), 200 if updated else 404
+    return redirect(f'/decks/{deck_id}')
+
+@app.route('/public-decks/<public_id>/subscribe', methods=['POST'])
+def subscribe_deck(public_id):
+    user = session.get('user')
+    if not user:
+        return redirect('/login')
+    
+    deck_id = subscribe_user(user['userinfo']['sub'], public_id)
+    if wants_json():
+        return jsonify({"deck_id": deck_id}) if deck_id else (jsonify({"error": "public deck not found"}), 404)
+    return redirect(f'/decks/{deck_id}' if deck_id else '/explore-decks')
+
+# Old index-based URLs, kept working by redirecting to the ID-based ones.
+# POSTs use 307 so the browser repeats the request with the same method and form.
+def resolve_deck_id(deck_index):
+    """Map a deck's position in the user's list to its ID, or None"""
+    decks = get_user_deck_summaries(session['user']['userinfo']['sub'])
+    if deck_index < len(decks):
+        return decks[deck_index]._id
+    return None
+
+# Legacy rule -> ID-based path it now lives at
+LEGACY_DECK_ROUTES = {
+    '/study/<int:deck_index>': '/decks/{}/study',
+    '/study/<int:deck_index>/answer': '/decks/{}/answer',
+    '/study/<int:deck_index>/answers': '/decks/{}/answers',
+    '/deck/<int:deck_index>': '/decks/{}',
+    '/deck/<int:deck_index>/add-card': '/decks/{}/cards',
+    '/deck/<int:deck_index>/expand': '/decks/{}/expand',
+    '/delete-deck/<int:deck_index>': '/decks/{}/delete',
+}
+
+def legacy_deck_route(deck_index):
+    user = session.get('user')
+    if not user:
+        return redirect('/login')
+    
+    deck_id = resolve_deck_id(deck_index)
+    if deck_id is None:
+        return redirect('/study' if request.path.startswith('/study') else '/manage-decks')
+    
+    new_path = LEGACY_DECK_ROUTES[request.url_rule.rule].format(deck_id)
+    if request.query_string:
+        new_path += '?' + request.query_string.decode()
+    return redirect(new_path, code=307 if request.method == 'POST' else 302)
+
+for legacy_rule in LEGACY_DECK_ROUTES:
+    app.add_url_rule(
+        legacy_rule,
+        endpoint='legacy_deck_route',
+        view_func=legacy_deck_route,
+        methods=['GET'] if legacy_rule in ('/study/<int:deck_index>', '/deck/<int:deck_index>') else ['POST']
+    )
+
+@app.route('/deck/<int:deck_index>/delete-card/<int:card_index>', methods=['POST'])
+def legacy_delete_card(deck_index, card_index):
+    user = session.get('user')
+    if not user:
+        return redirect('/login')
+    
+    deck_id = resolve_deck_id(deck_index)
+    if deck_id is None:
+        return redirect('/manage-decks')
+    card_id = get_user_card_id(user['userinfo']['sub'], deck_id, card_index)
+    if card_id is None:
+        return redirect(f'/decks/{deck_id}')
+    return redirect(f'/decks/{deck_id}/cards/{card_id}/delete', code=307)
+
+@app.route('/metrics')
+def metrics():
+    prompt_cache = get_prompt_cache()
+    return jsonify({
+        "deck_store": store.stats(),
+        "deck_cache": deck_cache.stats(),
+        "answer_indexes": answer_indexes.stats(),
+        "dedup_indexes": dedup_indexes.stats(),
+        "session_plans": session_plans.stats(),
+        "expansion_jobs": expansion_jobs.stats(),
+        "ai_client": get_client().stats(),
+        "prompt_cache": prompt_cache.stats() if prompt_cache is not None else None
+    })
+
+# Public decks listed per page of /explore-decks
+PUBLIC_DECKS_PAGE_SIZE = 20
+
 @app.route('/explore-decks')
 def explore_decks():
     user = session.get('user')
     if not user:
         return redirect('/login')
-    return render_template('explore-decks.html', user=user)
+    page = max(request.args.get('page', 0, type=int), 0)
+    query = request.args.get('q', '').strip()
+    # One extra tells whether there is a next page
+    if query:
+        public_decks = store.search_public_decks(query, page * PUBLIC_DECKS_PAGE_SIZE, PUBLIC_DECKS_PAGE_SIZE + 1)
+    else:
+        public_decks = store.list_public_decks(page * PUBLIC_DECKS_PAGE_SIZE, PUBLIC_DECKS_PAGE_SIZE + 1)
+    has_next = len(public_decks) > PUBLIC_DECKS_PAGE_SIZE
+    public_decks = public_decks[:PUBLIC_DECKS_PAGE_SIZE]
+    if wants_json():
+        return jsonify({"public_decks": public_decks, "next_page": page + 1 if has_next else None})
+    return render_template('explore-decks.html', user=user, public_decks=public_decks, query=query,
+                           page=page, has_next=has_next)
 
 if __name__ == '__main__':
     app.run(host="0.0.0.0", port=3000, debug=True)
@@ -0,0 +1,64 @@
+# Compares a fresh connection per call (bare requests.post) with the pooled, retrying CohereClient,
+# both against the local stub LLM server.
+#
+#     python benchmarks/bench_ai_client.py [number of calls] [--latency 0.0] [--error-rate 0.2]
+
+import argparse
+import os
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_cards import CohereClient
+from stub_llm_server import start_stub_server
+
+PAYLOAD = {"model": "command-r", "messages": [{"role": "user", "content": "Generate 3 flashcards for the deck \"Bench\"."}]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pooled CohereClient versus bare requests.post")
+    parser.add_argument("calls", type=int, nargs="?", default=200)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.2, help="share of stub replies that are 429/5xx")
+    options = parser.parse_args()
+
+    server = start_stub_server(latency=options.latency)
+    url = server.base_url + "/v2/chat"
+
+    started = time.perf_counter()
+    for _ in range(options.calls):
+        requests.post(url, json=PAYLOAD, timeout=45).raise_for_status()
+    bare = time.perf_counter() - started
+
+    client = CohereClient(base_url=server.base_url, api_key="stub")
+    started = time.perf_counter()
+    for _ in range(options.calls):
+        client.post(PAYLOAD)
+    pooled = time.perf_counter() - started
+
+    print(f"{options.calls} calls, {options.latency}s stub latency")
+    print(f"bare requests.post: {bare * 1000 / options.calls:8.2f} ms per call")
+    print(f"CohereClient:       {pooled * 1000 / options.calls:8.2f} ms per call")
+
+    # With failures: the bare call gives up on the first 429/5xx, the client backs off and retries
+    server.error_rate = options.error_rate
+    client = CohereClient(base_url=server.base_url, api_key="stub", backoff_base=0.01, backoff_max=0.05)
+    bare_failures = 0
+    for _ in range(options.calls):
+        if not requests.post(url, json=PAYLOAD, timeout=45).ok:
+            bare_failures += 1
+    client_failures = 0
+    for _ in range(options.calls):
+        try:
+            client.post(PAYLOAD)
+        except requests.HTTPError:
+            client_failures += 1
+    print(f"with {options.error_rate:.0%} stub errors: bare calls failed {bare_failures}, "
+          f"client calls failed {client_failures} after {client.stats()['retries']} retries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# Compares a big deck with its cards embedded in the deck document against the same deck after
+# migrate_cards.py moved them into the cards collection: recording one correct answer, adding a card,
+# reading a page of cards and loading the whole deck, plus how large the deck document is.
+# Needs a MongoDB server; it works in a throwaway database that is dropped afterwards.
+#
+#     python benchmarks/bench_card_layouts.py [--mongo-uri URI] [--cards 20000] [--repeats 200]
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bson
+import pymongo
+from bson.objectid import ObjectId
+
+from datacompression import Flashcard, new_card_id
+from indexes import ensure_indexes
+from migrate_cards import migrate_deck
+from mongo_deck_store import MongoDeckStore
+
+AUTH_ID = "layout-bench"
+
+
+def insert_embedded_deck(db, card_count):
+    """A deck the way older versions stored it: every card inside the deck document"""
+    cards = [{"card_id": new_card_id(), "question": f"Question number {i} about something", "answer": f"Answer {i}",
+              "correct_answers": 0, "reversible": False} for i in range(card_count)]
+    deck_object_id = db.decks.insert_one({"user_auth_id": AUTH_ID, "name": "Big deck", "experience": 0, "flashcards": cards}).inserted_id
+    return str(deck_object_id), [card["card_id"] for card in cards]
+
+
+def timed(repeats, action):
+    """Average milliseconds per call"""
+    started = time.perf_counter()
+    for _ in range(repeats):
+        action()
+    return (time.perf_counter() - started) / repeats * 1000
+
+
+def measure(store, deck_id, card_ids, repeats):
+    rng = random.Random(5)
+    card_count = len(card_ids)
+    deck_size = len(bson.encode(store.db.decks.find_one({"_id": ObjectId(deck_id)})))
+    return {
+        "record answer": timed(repeats, lambda: store.record_correct_answer(AUTH_ID, deck_id, rng.choice(card_ids))),
+        "add card": timed(repeats, lambda: store.add_cards(AUTH_ID, deck_id, [Flashcard("Added question", "Added answer", 0, False)])),
+        "read page": timed(repeats, lambda: store.get_deck_page(AUTH_ID, deck_id, rng.randrange(card_count - 50), 50)),
+        "load deck": timed(max(1, repeats // 20), lambda: store.load_deck(AUTH_ID, deck_id)),
+        "deck document KB": deck_size / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedded cards versus the cards collection")
+    parser.add_argument("--mongo-uri", default=os.environ.get("MONGO_URI", "mongodb://localhost:27017/"))
+    parser.add_argument("--cards", type=int, default=20000)
+    parser.add_argument("--repeats", type=int, default=200)
+    options = parser.parse_args()
+
+    try:
+        mongo = pymongo.MongoClient(options.mongo_uri, serverSelectionTimeoutMS=1000)
+        mongo.server_info()
+    except Exception as ex:
+        print(f"Cannot connect to MongoDB at {options.mongo_uri}: {str(ex).splitlines()[0][:80]}")
+        sys.exit(2)
+
+    db = mongo.get_database(f"studystack_bench_{os.getpid()}")
+    try:
+        ensure_indexes(db)
+        store = MongoDeckStore(db)
+        store.upsert_user(AUTH_ID, "bench@example.com")
+        deck_id, card_ids = insert_embedded_deck(db, options.cards)
+
+        embedded = measure(store, deck_id, card_ids, options.repeats)
+        started = time.perf_counter()
+        migrated = migrate_deck(db, db.decks.find_one({"_id": ObjectId(deck_id)}))
+        migration_seconds = time.perf_counter() - started
+        if not migrated:
+            print("Migration did not complete")
+            sys.exit(1)
+        separate = measure(store, deck_id, card_ids, options.repeats)
+
+        print(f"{options.cards} cards, migrated in {migration_seconds:.2f}s")
+        print(f"{'':>18} {'embedded':>10} {'separate':>10}")
+        for name in embedded:
+            print(f"{name:>18} {embedded[name]:>10.2f} {separate[name]:>10.2f}")
+        print("(times in ms per call)")
+    finally:
+        mongo.drop_database(db.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# Compares deck interchange formats by size and encode/decode speed.
+#
+#     python benchmarks/bench_deck_formats.py [number of cards]
+
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datacompression import Deck, Flashcard, decode_deck, encode_deck, pack_deck, unpack_deck
+
+
+def make_deck(card_count):
+    """A vocabulary-style deck where many cards share a small set of answers"""
+    random.seed(42)
+    answers = [f"answer {i}" for i in range(max(10, card_count // 20))]
+    flashcards = [
+        Flashcard(f"What is the meaning of word number {i}?", random.choice(answers), random.randint(0, 12), i % 3 == 0)
+        for i in range(card_count)
+    ]
+    return Deck("Benchmark Vocab", flashcards, 1234)
+
+
+def json_encode(deck):
+    return json.dumps({
+        "name": deck.name,
+        "experience": deck.experience,
+        "flashcards": [
+            {"card_id": card.card_id, "question": card.question, "answer": card.answer,
+             "correct_answers": card.correct_answers, "reversible": card.reversible}
+            for card in deck.flashcards
+        ],
+    }).encode("utf-8")
+
+
+def json_decode(data):
+    raw = json.loads(data)
+    return Deck(raw["name"], [
+        Flashcard(card["question"], card["answer"], card["correct_answers"], card["reversible"], card["card_id"])
+        for card in raw["flashcards"]
+    ], raw["experience"])
+
+
+def best_time(function, argument, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(argument)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    card_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    deck = make_deck(card_count)
+    formats = [
+        ("csv", lambda d: encode_deck(d).encode("utf-8"), lambda b: decode_deck(b.decode("utf-8"))),
+        ("json", json_encode, json_decode),
+        ("binary", lambda d: pack_deck(d, codec="none"), unpack_deck),
+        ("binary+zlib", lambda d: pack_deck(d, codec="zlib"), unpack_deck),
+        ("binary+lzma", lambda d: pack_deck(d, codec="lzma"), unpack_deck),
+        ("binary+zlib, no progress", lambda d: pack_deck(d, include_progress=False), unpack_deck),
+    ]
+
+    print(f"{card_count} cards")
+    print(f"{'format':<26}{'bytes':>12}{'encode ms':>12}{'decode ms':>12}")
+    for name, encode, decode in formats:
+        encode_time, data = best_time(encode, deck)
+        decode_time, decoded = best_time(decode, data)
+        assert len(decoded.flashcards) == card_count
+        print(f"{name:<26}{len(data):>12}{encode_time * 1000:>12.1f}{decode_time * 1000:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
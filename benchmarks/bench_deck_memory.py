@@ -0,0 +1,88 @@
+# Measures how much memory a hydrated deck takes with each card representation.
+#
+#     python benchmarks/bench_deck_memory.py [number of cards ...]
+
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datacompression import CardColumns, ColumnarDeck, Deck, Flashcard
+
+
+class DictFlashcard:
+    """The Flashcard class as it was before __slots__, for comparison"""
+    def __init__(self, question, answer, correct_answers=0, reversible=False, card_id=None):
+        self.question = question
+        self.answer = answer
+        self.correct_answers = correct_answers or 0
+        self.reversible = reversible or False
+        self.card_id = card_id
+
+
+def card_documents(card_count):
+    """Card dicts as they come back from MongoDB"""
+    return [
+        {
+            "card_id": f"{i:016x}",
+            "question": f"What is the meaning of word number {i}?",
+            "answer": f"meaning {i % 500}",
+            "correct_answers": i % 7,
+            "reversible": i % 3 == 0,
+        }
+        for i in range(card_count)
+    ]
+
+
+def fresh(text):
+    """A new copy of a string, so it counts towards the deck like a freshly decoded BSON reply would"""
+    return text.encode("utf-8").decode("utf-8")
+
+
+def measure(build, documents):
+    """Bytes still allocated by whatever build() returns (the documents themselves are not counted)"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    deck = build(documents)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del deck
+    return after - before
+
+
+def objects(card_class):
+    def build(documents):
+        return Deck("bench", [
+            card_class(fresh(doc["question"]), fresh(doc["answer"]), doc["correct_answers"], doc["reversible"], fresh(doc["card_id"]))
+            for doc in documents
+        ])
+    return build
+
+
+def columnar(documents):
+    copied = [
+        {"question": fresh(doc["question"]), "answer": fresh(doc["answer"]), "card_id": fresh(doc["card_id"]),
+         "correct_answers": doc["correct_answers"], "reversible": doc["reversible"]}
+        for doc in documents
+    ]
+    deck = ColumnarDeck("bench", CardColumns.from_documents(copied))
+    del copied
+    return deck
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 50000]
+    print(f"{'cards':>8}{'dict objects':>16}{'slotted':>16}{'columnar':>16}   (bytes per card)")
+    for card_count in sizes:
+        documents = card_documents(card_count)
+        results = [
+            measure(objects(DictFlashcard), documents),
+            measure(objects(Flashcard), documents),
+            measure(columnar, documents),
+        ]
+        print(f"{card_count:>8}" + "".join(f"{total:>10} ({total // card_count:>3})" for total in results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+# Measures each deck store backend's throughput under a study-like mix of reads and writes, from
+# threads and, for SQLite, from several worker processes sharing one database file. That the backends
+# behave the same is checked by tests/test_deck_stores.py.
+#
+#     python benchmarks/bench_deck_stores.py [--backends memory,sqlite,mongo] [--mongo-uri URI]
+#                                            [--threads 8] [--processes 4] [--seconds 3]
+
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datacompression import Deck, Flashcard
+from deck_store import DeckList, MemoryDeckStore
+
+USERS = 20
+DECKS_PER_USER = 3
+CARDS_PER_DECK = 200
+
+
+def open_store(backend, options, directory):
+    if backend == "memory":
+        return MemoryDeckStore(options.columnar_threshold)
+    if backend == "sqlite":
+        from sqlite_deck_store import SQLiteDeckStore
+        return SQLiteDeckStore(os.path.join(directory, "decks.sqlite3"), options.columnar_threshold)
+    if backend == "mongo":
+        from mongo_deck_store import MongoDeckStore
+        store = MongoDeckStore.connect(options.mongo_uri, options.columnar_threshold)
+        # Work in a throwaway database next to the real one
+        store.db = store.db.client.get_database(f"studystack_bench_{os.getpid()}")
+        return store
+    raise ValueError(f"Unknown backend: {backend}")
+
+
+def close_store(backend, store):
+    if backend == "mongo":
+        store.db.client.drop_database(store.db.name)
+
+
+def cards(prefix, count):
+    return [Flashcard(f"{prefix} question {i}", f"{prefix} answer {i}", 0, i % 2 == 0) for i in range(count)]
+
+
+def seed(store):
+    deck_ids = []
+    for user in range(USERS):
+        auth_id = f"user-{user}"
+        store.upsert_user(auth_id, f"{auth_id}@example.com")
+        decks = DeckList([Deck(f"Deck {i}", cards(f"{auth_id} deck {i}", CARDS_PER_DECK)) for i in range(DECKS_PER_USER)])
+        store.save_decks(auth_id, decks)
+        deck_ids.extend((auth_id, deck._id, [card.card_id for card in deck.flashcards]) for deck in decks)
+    return deck_ids
+
+
+def operation(store, rng, deck_ids):
+    """One request's worth of storage work: mostly reads and answers, some edits"""
+    auth_id, deck_id, card_ids = rng.choice(deck_ids)
+    roll = rng.random()
+    if roll < 0.3:
+        store.get_deck_page(auth_id, deck_id, rng.randrange(0, CARDS_PER_DECK, 50), 50)
+    elif roll < 0.5:
+        store.get_card(auth_id, deck_id, rng.choice(card_ids))
+    elif roll < 0.6:
+        store.get_deck_summaries(auth_id)
+    elif roll < 0.7:
+        store.load_deck(auth_id, deck_id)
+    elif roll < 0.9:
+        store.record_answers(auth_id, deck_id, {card_id: 1 for card_id in rng.sample(card_ids, 5)})
+    elif roll < 0.95:
+        store.record_correct_answer(auth_id, deck_id, rng.choice(card_ids))
+    else:
+        store.add_cards(auth_id, deck_id, cards(f"new {rng.random()}", 1))
+
+
+def run_threads(store, deck_ids, threads, seconds):
+    counts = [0] * threads
+    deadline = time.perf_counter() + seconds
+
+    def work(index):
+        rng = random.Random(index)
+        while time.perf_counter() < deadline:
+            operation(store, rng, deck_ids)
+            counts[index] += 1
+
+    workers = [threading.Thread(target=work, args=(index,)) for index in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sum(counts) / seconds
+
+
+def sqlite_process(path, columnar_threshold, deck_ids, index, seconds, results):
+    from sqlite_deck_store import SQLiteDeckStore
+    store = SQLiteDeckStore(path, columnar_threshold)
+    rng = random.Random(1000 + index)
+    count = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        operation(store, rng, deck_ids)
+        count += 1
+    results.put(count)
+
+
+def run_processes(path, columnar_threshold, deck_ids, processes, seconds):
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=sqlite_process, args=(path, columnar_threshold, deck_ids, index, seconds, results))
+               for index in range(processes)]
+    for worker in workers:
+        worker.start()
+    total = sum(results.get() for _ in workers)
+    for worker in workers:
+        worker.join()
+    return total / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of the deck store backends")
+    parser.add_argument("--backends", default="memory,sqlite,mongo")
+    parser.add_argument("--mongo-uri", default=os.environ.get("MONGO_URI", "mongodb://localhost:27017/"))
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--columnar-threshold", type=int, default=1000)
+    options = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="deck_stores_")
+    try:
+        print(f"{'backend':>8} {'1 thread ops/s':>15} {f'{options.threads} threads ops/s':>17} {f'{options.processes} processes ops/s':>19}")
+        for backend in options.backends.split(","):
+            try:
+                store = open_store(backend, options, directory)
+            except Exception as ex:
+                print(f"{backend:>8} skipped: {str(ex).splitlines()[0][:80]}")
+                continue
+            try:
+                deck_ids = seed(store)
+                single = run_threads(store, deck_ids, 1, options.seconds)
+                threaded = run_threads(store, deck_ids, options.threads, options.seconds)
+                processes = "-"
+                if backend == "sqlite":
+                    processes = f"{run_processes(store.path, options.columnar_threshold, deck_ids, options.processes, options.seconds):.0f}"
+                print(f"{backend:>8} {single:>15.0f} {threaded:>17.0f} {processes:>19}")
+            finally:
+                close_store(backend, store)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
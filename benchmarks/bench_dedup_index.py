@@ -0,0 +1,70 @@
+# Times duplicate checks for decks of growing size: the old case-insensitive scan of every
+# question, versus the dedup index (exact normalized match plus MinHash/LSH). Also reports
+# how many reworded copies of existing cards each approach catches.
+#
+#     python benchmarks/bench_dedup_index.py [number of cards ...]
+
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dedup_index import DedupIndex
+
+CHECKS = 500
+
+
+def made_up_words(rng, count):
+    return " ".join("".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9))) for _ in range(count))
+
+
+def make_pairs(card_count):
+    rng = random.Random(42)
+    return [(f"What is the {made_up_words(rng, 3)}?", made_up_words(rng, 2)) for _ in range(card_count)]
+
+
+def reworded(rng, question, answer):
+    """The same card with a different case, punctuation, article or an extra word"""
+    changes = [
+        lambda q: q.upper(),
+        lambda q: q.replace("What is the", "What's"),
+        lambda q: q.rstrip("?") + " exactly?",
+        lambda q: "  " + q.replace(" ", "  ").rstrip("?") + " ?",
+    ]
+    return rng.choice(changes)(question), answer
+
+
+def old_is_duplicate(question, existing_questions):
+    """How generate_ai_cards checked questions before: a list of lowercased questions"""
+    return question.lower() in existing_questions
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 50000]
+    print(f"{'cards':>8} {'old check':>12} {'index build':>12} {'index check':>12} {'old caught':>11} {'index caught':>13}")
+    for card_count in sizes:
+        pairs = make_pairs(card_count)
+        rng = random.Random(7)
+        probes = [reworded(rng, *rng.choice(pairs)) for _ in range(CHECKS)]
+
+        existing_questions = [question.lower() for question, _ in pairs]
+        started = time.perf_counter()
+        old_caught = sum(old_is_duplicate(question, existing_questions) for question, _ in probes)
+        old_time = (time.perf_counter() - started) / CHECKS
+
+        started = time.perf_counter()
+        index = DedupIndex(pairs)
+        build_time = time.perf_counter() - started
+        started = time.perf_counter()
+        caught = sum(index.find_duplicate(question, answer) is not None for question, answer in probes)
+        check_time = (time.perf_counter() - started) / CHECKS
+
+        print(f"{card_count:>8} {old_time * 1000:>9.3f} ms {build_time:>10.2f} s {check_time * 1000:>9.3f} ms "
+              f"{old_caught / CHECKS:>10.0%} {caught / CHECKS:>12.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# Generates one large AI expansion against the local stub LLM server, first as one prompt after another
+# then split into parts sent in parallel, then streamed, and reports the wall time of each
+# (and, when streamed, how long the first card takes).
+#
+#     python benchmarks/bench_expansion_fanout.py [number of cards] [--latency 1.0] [--max-concurrent 8]
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stub_llm_server import start_stub_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel AI expansion parts against the stub LLM server")
+    parser.add_argument("cards", type=int, nargs="?", default=100)
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--max-concurrent", type=int, default=10, help="COHERE_MAX_CONCURRENT")
+    options = parser.parse_args()
+
+    server = start_stub_server(latency=options.latency)
+    os.environ["COHERE_BASE_URL"] = server.base_url
+    os.environ.setdefault("COHERE_API_KEY", "stub")
+    os.environ["COHERE_MAX_CONCURRENT"] = str(options.max_concurrent)
+    os.environ["AI_MAX_EXPANSION_CARDS"] = str(options.cards)
+    os.environ["PROMPT_CACHE_PATH"] = ""
+
+    # Imported after the environment points at the stub
+    import app
+    from ai_cards import get_client, getResponseFromPrompt
+    from datacompression import Deck, Flashcard
+    from dedup_index import DedupIndex, NewCardFilter
+
+    deck = Deck("Bench", [Flashcard("What is 2 + 2?", "4")])
+    sizes = app.expansion_parts(options.cards)
+
+    started = time.perf_counter()
+    serial = 0
+    for part, size in enumerate(sizes):
+        response = getResponseFromPrompt(app.expansion_prompt(deck, size, part, len(sizes), 1, options.cards))
+        serial += len(app.parse_ai_response(response, NewCardFilter(DedupIndex())))
+    serial_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    parallel = len(app.generate_ai_cards(deck, options.cards))
+    parallel_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    first_card_time = None
+    streamed = 0
+    for _ in app.stream_ai_cards(deck, options.cards):
+        if first_card_time is None:
+            first_card_time = time.perf_counter() - started
+        streamed += 1
+    streamed_time = time.perf_counter() - started
+
+    print(f"{options.cards} cards in {len(sizes)} parts, {options.latency}s stub latency, "
+          f"at most {options.max_concurrent} calls at once")
+    print(f"one part after another: {serial:4d} cards in {serial_time:.2f} s")
+    print(f"parts in parallel:      {parallel:4d} cards in {parallel_time:.2f} s")
+    print(f"streamed in parallel:   {streamed:4d} cards in {streamed_time:.2f} s, first card after {first_card_time:.2f} s")
+    print(f"peak calls in flight:   {get_client().stats()['peak_in_flight']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# Runs AI deck expansions through the background job queue against the local stub LLM server,
+# and reports how long a request waits to get its job ID versus how long the work takes.
+#
+#     python benchmarks/bench_expansion_jobs.py [number of jobs] [--latency 0.5] [--workers 2] [--error-rate 0.1]
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stub_llm_server import start_stub_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI expansion jobs against the stub LLM server")
+    parser.add_argument("jobs", type=int, nargs="?", default=20)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--queue-size", type=int, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    options = parser.parse_args()
+
+    server = start_stub_server(latency=options.latency, error_rate=options.error_rate)
+    os.environ["COHERE_BASE_URL"] = server.base_url
+    os.environ.setdefault("COHERE_API_KEY", "stub")
+
+    # Imported after the environment points at the stub
+    from ai_cards import getResponseFromPrompt
+    from job_queue import JobQueue, QueueFull
+
+    def expand(card_count):
+        response = getResponseFromPrompt(f"Generate {card_count} flashcards for the deck \"Bench\".")
+        return {"added": sum(1 for line in response.splitlines() if line.startswith("Q:"))}
+
+    jobs = JobQueue(workers=options.workers, max_queued=options.queue_size)
+    job_ids = []
+    submit_times = []
+    started = time.perf_counter()
+    for _ in range(options.jobs):
+        before = time.perf_counter()
+        try:
+            job_ids.append(jobs.submit(expand, 5))
+        except QueueFull:
+            pass
+        submit_times.append(time.perf_counter() - before)
+    for job_id in job_ids:
+        jobs.wait(job_id)
+    elapsed = time.perf_counter() - started
+
+    stats = jobs.stats()
+    print(f"{options.jobs} jobs, {options.workers} workers, {options.latency}s stub latency")
+    print(f"slowest submit:       {max(submit_times) * 1000:.2f} ms (what a web request waits)")
+    print(f"all jobs finished in: {elapsed:.2f} s (serial calls would take about {options.jobs * options.latency:.1f} s)")
+    for key in ("completed", "failed", "rejected", "run_seconds_p50", "run_seconds_p95", "wait_seconds_p50", "wait_seconds_p95"):
+        value = stats[key]
+        print(f"{key + ':':<22}{value:.3f}" if isinstance(value, float) else f"{key + ':':<22}{value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# Sends repeated and concurrent identical prompts through getResponseFromPrompt against the local stub
+# LLM server, and reports how many reached the stub with and without the prompt cache.
+#
+#     python benchmarks/bench_prompt_cache.py [number of prompts] [--distinct 5] [--threads 8] [--latency 0.3]
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stub_llm_server import start_stub_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt cache hits and coalescing against the stub LLM server")
+    parser.add_argument("prompts", type=int, nargs="?", default=80)
+    parser.add_argument("--distinct", type=int, default=5, help="different prompts among them")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.3)
+    options = parser.parse_args()
+
+    server = start_stub_server(latency=options.latency)
+    os.environ["COHERE_BASE_URL"] = server.base_url
+    os.environ.setdefault("COHERE_API_KEY", "stub")
+    os.environ["PROMPT_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "prompt_cache.sqlite3")
+
+    # Imported after the environment points at the stub and a scratch cache file
+    import ai_cards
+
+    prompts = [f"Generate 5 flashcards for the deck \"Bench {i % options.distinct}\"." for i in range(options.prompts)]
+
+    def run(send):
+        before = server.requests
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options.threads) as pool:
+            list(pool.map(send, prompts))
+        return time.perf_counter() - started, server.requests - before
+
+    uncached_time, uncached_calls = run(lambda prompt: ai_cards.get_client().chat(prompt))
+    cached_time, cached_calls = run(ai_cards.getResponseFromPrompt)
+
+    print(f"{options.prompts} prompts ({options.distinct} distinct), {options.threads} threads, {options.latency}s stub latency")
+    print(f"no cache:   {uncached_calls:4d} upstream calls in {uncached_time:.2f} s")
+    print(f"with cache: {cached_calls:4d} upstream calls in {cached_time:.2f} s")
+    stats = ai_cards.get_prompt_cache().stats()
+    for key in ("hits", "misses", "hit_rate", "coalesced", "upstream_saved", "entries", "bytes"):
+        value = stats[key]
+        print(f"{key + ':':<16}{value:.3f}" if isinstance(value, float) else f"{key + ':':<16}{value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# Compares what a popular deck costs when every learner gets their own copy of it against learners
+# subscribing to the published deck: database size, and rows written while everyone studies a bit.
+# Runs on SQLite in a temporary directory, so no server is needed.
+#
+#     python benchmarks/bench_public_decks.py [--learners 500] [--cards 500] [--answers 20]
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datacompression import Deck, Flashcard
+from deck_store import DeckList
+from sqlite_deck_store import SQLiteDeckStore
+
+OWNER = "deck-owner"
+
+
+def database_size(store):
+    store._connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return os.path.getsize(store.path)
+
+
+def run(mode, directory, options):
+    store = SQLiteDeckStore(os.path.join(directory, f"{mode}.sqlite3"))
+    store.upsert_user(OWNER, "owner@example.com")
+    decks = DeckList([Deck("Popular deck", [
+        Flashcard(f"Popular question number {i} with some context", f"Popular answer {i}", 0, False)
+        for i in range(options.cards)
+    ])])
+    store.save_decks(OWNER, decks)
+    public = store.publish_deck(OWNER, decks[0]._id)
+    empty_size = database_size(store)
+
+    started = time.perf_counter()
+    learners = []
+    for learner in range(options.learners):
+        auth_id = f"learner-{learner}"
+        store.upsert_user(auth_id, f"{auth_id}@example.com")
+        if mode == "copies":
+            copy = DeckList([Deck("Popular deck", [Flashcard(card.question, card.answer, 0, card.reversible)
+                                                   for card in decks[0].flashcards])])
+            store.save_decks(auth_id, copy)
+            deck_id = copy[0]._id
+        else:
+            deck_id = store.subscribe(auth_id, public["public_id"])
+        learners.append((auth_id, deck_id))
+    adopt_seconds = time.perf_counter() - started
+
+    rng = random.Random(3)
+    started = time.perf_counter()
+    for auth_id, deck_id in learners:
+        card_ids = [card.card_id for card in store.get_deck_page(auth_id, deck_id, 0, options.cards)[1]]
+        store.record_answers(auth_id, deck_id, {card_id: 1 for card_id in rng.sample(card_ids, options.answers)})
+    study_seconds = time.perf_counter() - started
+    return {
+        "adopt s": adopt_seconds,
+        "study s": study_seconds,
+        "MB added": (database_size(store) - empty_size) / 1024 / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copied decks against subscriptions to a public deck")
+    parser.add_argument("--learners", type=int, default=500)
+    parser.add_argument("--cards", type=int, default=500)
+    parser.add_argument("--answers", type=int, default=20, help="cards each learner answers")
+    options = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="public_decks_")
+    try:
+        results = {mode: run(mode, directory, options) for mode in ("copies", "subscriptions")}
+        print(f"{options.learners} learners of one {options.cards}-card deck, {options.answers} answers each")
+        print(f"{'':>10} {'copies':>10} {'subscriptions':>14}")
+        for name in results["copies"]:
+            print(f"{name:>10} {results['copies'][name]:>10.2f} {results['subscriptions'][name]:>14.2f}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# Publishes a large catalog of public decks (names and cards drawn from a Zipf-distributed vocabulary,
+# so some words are everywhere and most are rare), then times searches against each backend's index:
+# the in-memory inverted index, SQLite's FTS5 table and MongoDB's text index. A regex scan over every
+# deck's text is timed on the same catalog for comparison.
+#
+#     python benchmarks/bench_public_search.py [--backends memory,sqlite,mongo] [--decks 200000]
+#                                              [--cards 8] [--queries 300] [--mongo-uri URI]
+
+import argparse
+import itertools
+import os
+import random
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from deck_store import MemoryDeckStore, new_deck_id
+from search_index import deck_search_text, search_words
+
+VOCABULARY = 30000
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "ta", "vo", "shi", "ben", "dar", "gel", "pon", "qui", "sta", "zor", "fe"]
+OWNERS = 1000
+
+
+def vocabulary(rng):
+    """Distinct made-up words, most frequent first"""
+    words = set()
+    while len(words) < VOCABULARY:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words, key=lambda word: rng.random())
+
+
+def catalog(options):
+    """(name, card documents) of every deck to publish"""
+    rng = random.Random(11)
+    words = vocabulary(rng)
+    cumulative = list(itertools.accumulate(1 / rank for rank in range(1, VOCABULARY + 1)))
+
+    def phrase(length):
+        return " ".join(rng.choices(words, cum_weights=cumulative, k=length))
+
+    decks = []
+    for _ in range(options.decks):
+        cards = [{'card_id': f"{i}", 'question': phrase(6), 'answer': phrase(3), 'correct_answers': 0, 'reversible': False}
+                 for i in range(options.cards)]
+        decks.append((phrase(3).title(), cards))
+    return words, decks
+
+
+def queries(words, count):
+    """Searches as people type them: mostly one or two fairly rare words, sometimes a very common one"""
+    rng = random.Random(12)
+    mixes = [
+        ("rare word", lambda: rng.choice(words[5000:])),
+        ("medium word", lambda: rng.choice(words[100:5000])),
+        ("two words", lambda: f"{rng.choice(words[100:5000])} {rng.choice(words[1000:])}"),
+        ("common word", lambda: rng.choice(words[:20])),
+    ]
+    return [(name, [make() for _ in range(count)]) for name, make in mixes]
+
+
+def open_store(backend, options, directory):
+    if backend == "memory":
+        return MemoryDeckStore()
+    if backend == "sqlite":
+        from sqlite_deck_store import SQLiteDeckStore
+        return SQLiteDeckStore(os.path.join(directory, "catalog.sqlite3"))
+    if backend == "mongo":
+        from mongo_deck_store import MongoDeckStore
+        store = MongoDeckStore.connect(options.mongo_uri)
+        # Work in a throwaway database next to the real one
+        from indexes import ensure_indexes
+        store.db = store.db.client.get_database(f"studystack_bench_{os.getpid()}")
+        ensure_indexes(store.db)
+        return store
+    raise ValueError(f"Unknown backend: {backend}")
+
+
+def close_store(backend, store):
+    if backend == "mongo":
+        store.db.client.drop_database(store.db.name)
+
+
+def publish_catalog(store, decks):
+    """Publish every deck straight from its card documents; the average milliseconds per publish"""
+    started = time.perf_counter()
+    for number, (name, cards) in enumerate(decks):
+        store._publish(f"owner-{number % OWNERS}", new_deck_id(), name, cards)
+    return (time.perf_counter() - started) / len(decks) * 1000
+
+
+def percentiles(search, query_list):
+    """p50 and p99 milliseconds of running every query, and the share that found something"""
+    times = []
+    found = 0
+    for query in query_list:
+        started = time.perf_counter()
+        results = search(query)
+        times.append((time.perf_counter() - started) * 1000)
+        found += bool(results)
+    times.sort()
+    return statistics.median(times), times[min(len(times) - 1, int(len(times) * 0.99))], found / len(query_list)
+
+
+def regex_scan(texts):
+    """The search a catalog without an index needs: a regex over every deck, then sorting the matches"""
+    def search(query):
+        pattern = re.compile(r"\b(?:" + "|".join(map(re.escape, search_words(query))) + r")\b", re.IGNORECASE)
+        matches = [(len(pattern.findall(text)), number) for number, text in enumerate(texts) if pattern.search(text)]
+        return sorted(matches, reverse=True)[:20]
+    return search
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Public deck search latency on a large catalog")
+    parser.add_argument("--backends", default="memory,sqlite,mongo")
+    parser.add_argument("--mongo-uri", default=os.environ.get("MONGO_URI", "mongodb://localhost:27017/"))
+    parser.add_argument("--decks", type=int, default=200000)
+    parser.add_argument("--cards", type=int, default=8, help="cards per deck")
+    parser.add_argument("--queries", type=int, default=300, help="queries of each kind")
+    parser.add_argument("--scan-queries", type=int, default=20, help="queries of each kind for the regex scan")
+    options = parser.parse_args()
+
+    words, decks = catalog(options)
+    query_mixes = queries(words, options.queries)
+    print(f"{options.decks} public decks of {options.cards} cards; p50 / p99 ms per search (share of searches with results)")
+    print(f"{'backend':>12} {'publish ms':>11} " + " ".join(f"{name:>24}" for name, _ in query_mixes))
+
+    texts = [f"{name} {deck_search_text(cards)}" for name, cards in decks]
+    scan = regex_scan(texts)
+    row = [percentiles(scan, query_list[:options.scan_queries]) for _, query_list in query_mixes]
+    print(f"{'regex scan':>12} {'-':>11} " + " ".join(f"{p50:>9.2f} / {p99:>7.2f} ({hits:>3.0%})" for p50, p99, hits in row))
+    del texts
+
+    directory = tempfile.mkdtemp(prefix="public_search_")
+    try:
+        for backend in options.backends.split(","):
+            try:
+                store = open_store(backend, options, directory)
+            except Exception as ex:
+                print(f"{backend:>12} skipped: {str(ex).splitlines()[0][:80]}")
+                continue
+            try:
+                publish_ms = publish_catalog(store, decks)
+                row = [percentiles(lambda query: store.search_public_decks(query, 0, 20), query_list)
+                       for _, query_list in query_mixes]
+                print(f"{backend:>12} {publish_ms:>11.3f} " + " ".join(f"{p50:>9.2f} / {p99:>7.2f} ({hits:>3.0%})" for p50, p99, hits in row))
+            finally:
+                close_store(backend, store)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# Times building a study session for decks of growing size: random distractors (with and
+# without NumPy) and similarity-ranked ones (first session builds the answer index and
+# ranks every answer, later ones reuse the rankings).
+#
+#     python benchmarks/bench_study_session.py [number of cards ...]
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import study_session
+from answer_index import AnswerIndex
+from datacompression import Deck, Flashcard
+from study_session import generate_study_session
+
+
+def make_deck(card_count):
+    """A deck of new cards (all multiple choice) where answers repeat now and then"""
+    random.seed(42)
+    return Deck("Benchmark", [
+        Flashcard(f"Question {i}", f"answer {random.randrange(max(10, card_count // 2))}", random.randint(0, 5))
+        for i in range(card_count)
+    ])
+
+
+def old_wrong_answers(deck):
+    """How distractors were picked before the answer pool: a filtered copy of every answer, per card"""
+    all_answers = [card.answer for card in deck.flashcards]
+    for card in deck.flashcards:
+        wrong_answers = [ans for ans in all_answers if ans != card.answer]
+        random.sample(wrong_answers, min(3, len(wrong_answers)))
+
+
+def best_time(function, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 5000, 20000, 100000]
+    columns = ["pool", "pool+numpy" if study_session.numpy is not None else "pool+numpy (n/a)",
+               "similar, first", "similar, again", "old (<=5000)"]
+    print(f"{'cards':>8}" + "".join(f"{column:>20}" for column in columns) + "   (ms)")
+    for card_count in sizes:
+        deck = make_deck(card_count)
+        results = [best_time(lambda: generate_study_session(deck, use_numpy=False))]
+        if study_session.numpy is not None:
+            results.append(best_time(lambda: generate_study_session(deck, use_numpy=True)))
+        else:
+            results.append(None)
+        answers = [card.answer for card in deck.flashcards]
+
+        def first_similar_session():
+            index = AnswerIndex(answers)
+            generate_study_session(deck, answer_index=index)
+            return index
+
+        results.append(best_time(first_similar_session, repeat=1))
+        index = first_similar_session()
+        results.append(best_time(lambda: generate_study_session(deck, answer_index=index)))
+        # The old way is quadratic; past a few thousand cards it takes minutes
+        results.append(best_time(lambda: old_wrong_answers(deck), repeat=1) if card_count <= 5000 else None)
+        print(f"{card_count:>8}" + "".join(f"{result:>20.1f}" if result is not None else f"{'-':>20}" for result in results))
+
+
+if __name__ == "__main__":
+    main()
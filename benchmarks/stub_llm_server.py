@@ -0,0 +1,117 @@
+# A local stand-in for Cohere's v2/chat endpoint, for exercising AI deck expansion without the real API.
+# It answers "Generate N flashcards" prompts with N made-up "Q: ... | A: ..." lines after a delay
+# (spread over the lines when the request asks for a stream), and can be told to fail a share of requests.
+#
+#     python benchmarks/stub_llm_server.py [--port 8765] [--latency 2.0] [--error-rate 0.0]
+#     COHERE_BASE_URL=http://127.0.0.1:8765 COHERE_API_KEY=stub python app.py
+
+import argparse
+import json
+import random
+import re
+import string
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CARD_COUNT_PATTERN = re.compile(r"Generate (\d+) (?:new unique )?flashcards")
+
+
+def made_up_words(count):
+    """Random letter strings, so the stub's cards don't look like duplicates of each other"""
+    return " ".join("".join(random.choices(string.ascii_lowercase, k=random.randint(4, 9))) for _ in range(count))
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    """Answers every POST like v2/chat would; settings live on the server object"""
+
+    # Keep connections open between requests, like the real API does
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; don't let Nagle hold the body back
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        prompt = payload.get("messages", [{}])[-1].get("content", "")
+        with server.lock:
+            server.requests += 1
+
+        stream = payload.get("stream", False)
+        if not stream:
+            time.sleep(server.latency)
+        if random.random() < server.error_rate:
+            status = random.choice([429, 500, 503])
+            body = json.dumps({"message": "stub failure"})
+            self.send_response(status)
+            if status == 429:
+                self.send_header("Retry-After", "1")
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body.encode("utf-8"))
+            return
+
+        match = CARD_COUNT_PATTERN.search(prompt)
+        card_count = int(match.group(1)) if match else 5
+        lines = [f"Q: What is {made_up_words(3)}? | A: {made_up_words(2)}" for _ in range(card_count)]
+        if stream:
+            try:
+                self.stream_lines(lines, server.latency)
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True  # the client stopped reading
+            return
+        body = json.dumps({"message": {"role": "assistant", "content": [{"type": "text", "text": "\n".join(lines)}]}})
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body.encode("utf-8"))
+
+    def stream_lines(self, lines, latency):
+        """Send the lines as v2/chat server-sent events, a few pieces per line, spread over latency seconds"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self.send_event({"type": "message-start"})
+        for line in lines:
+            time.sleep(latency / len(lines))
+            text = line + "\n"
+            # Split mid-line, like tokens are, so clients have to put lines back together
+            for start in range(0, len(text), 16):
+                self.send_event({"type": "content-delta", "delta": {"message": {"content": {"text": text[start:start + 16]}}}})
+        self.send_event({"type": "message-end"})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def send_event(self, event):
+        data = f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(port=0, latency=0.5, error_rate=0.0):
+    """Serve the stub on a background thread; returns the server (its address is server.base_url)"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubLLMHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.error_rate = error_rate
+    server.requests = 0
+    server.lock = threading.Lock()
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for Cohere's v2/chat endpoint")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=2.0, help="seconds before each reply")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 429/5xx")
+    options = parser.parse_args()
+    server = start_stub_server(options.port, options.latency, options.error_rate)
+    print(f"Stub LLM listening on {server.base_url}")
+    threading.Event().wait()
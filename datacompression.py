@@ -1,16 +1,38 @@
 # File used for 
 #     - storing flashcards as structs with question, answer, number of correct answers
 #     - storing decks as structs with name, flashcard list, and overall experience of the deck
+#     - storing big decks column by column (ColumnarDeck) so they take far less memory
 #     - encoding decks to csv and decoding csv to decks
 #     - also encoding without exp, so others who download the deck don't already have it completed
+#     - packing decks into a compact compressed binary format for storage and interchange
+
+import csv
+import io
+import lzma
+import secrets
+import struct
+import sys
+import weakref
+import zlib
+from array import array
+from collections.abc import MutableSequence
+
+
+def new_card_id():
+    """Return a short random identifier that stays with a card for its whole life"""
+    return secrets.token_hex(8)
 
 
 class Flashcard:
-    def __init__(self, question, answer, correct_answers=0, reversible=False):
+    # No per-instance __dict__: decks can hold tens of thousands of these
+    __slots__ = ('question', 'answer', 'correct_answers', 'reversible', 'card_id')
+
+    def __init__(self, question, answer, correct_answers=0, reversible=False, card_id=None):
         self.question = question
         self.answer = answer
         self.correct_answers = correct_answers or 0
         self.reversible = reversible or False
+        self.card_id = card_id or new_card_id()
 
 
 class Deck:
@@ -19,26 +41,501 @@ class Deck:
         self.flashcards = flashcards or []
         self.experience = experience or 0
 
-def encode_deck(deck):
-    deckAsString = deck.name + "," + str(deck.experience) + "\n"
+    def copy(self):
+        """Copy the deck and its card list (the cards themselves are shared)"""
+        return Deck(self.name, list(self.flashcards), self.experience)
+
+
+class ColumnCard:
+    """A card of a CardColumns: reads and writes go straight to its row of the columns
+
+    Like a Flashcard taken out of a list, it keeps its values but stops changing the deck once
+    its row is deleted or replaced, until it is stored in the deck again.
+    """
+    __slots__ = ('_columns', '_position', '_detached', '__weakref__')
+
+    def __init__(self, columns, position):
+        self._columns = columns
+        self._position = position
+        self._detached = None
+
+    def _detach(self):
+        columns, position = self._columns, self._position
+        self._detached = Flashcard(columns._questions[position], columns._answers[position], columns._correct[position],
+                                   bool(columns._reversible[position]), columns._card_ids[position])
+        self._columns = None
+
+    def _get(self, column, field):
+        if self._columns is None:
+            return getattr(self._detached, field)
+        return getattr(self._columns, column)[self._position]
+
+    def _set(self, column, field, value):
+        if self._columns is None:
+            setattr(self._detached, field, value)
+        else:
+            getattr(self._columns, column)[self._position] = value
+
+    question = property(lambda self: self._get('_questions', 'question'),
+                        lambda self, value: self._set('_questions', 'question', value))
+    answer = property(lambda self: self._get('_answers', 'answer'),
+                      lambda self, value: self._set('_answers', 'answer', value))
+    card_id = property(lambda self: self._get('_card_ids', 'card_id'),
+                       lambda self, value: self._set('_card_ids', 'card_id', value))
+    correct_answers = property(lambda self: self._get('_correct', 'correct_answers'),
+                               lambda self, value: self._set('_correct', 'correct_answers', value or 0))
+    reversible = property(lambda self: bool(self._get('_reversible', 'reversible')),
+                          lambda self, value: self._set('_reversible', 'reversible', bool(value)))
+
+
+class CardColumns(MutableSequence):
+    """A list of flashcards stored as one column per field instead of one object per card
+
+    Questions, answers and card IDs live in plain lists; correct answers and reversible flags
+    live in typed arrays. Reading a card gives a ColumnCard, so changing it changes the deck
+    just like changing a Flashcard in a list would.
+    """
+
+    def __init__(self, flashcards=()):
+        self._questions = []
+        self._answers = []
+        self._card_ids = []
+        self._correct = array('I')
+        self._reversible = array('b')
+        # position -> the ColumnCard handed out for it, while something still holds it
+        self._cards = weakref.WeakValueDictionary()
+        for card in flashcards:
+            self.append(card)
+
+    @classmethod
+    def from_documents(cls, documents):
+        """Build columns straight from card dicts, without creating Flashcard objects"""
+        columns = cls()
+        # Equal answers (common in vocabulary decks) share one string object
+        answers = {}
+        for document in documents:
+            columns._questions.append(document['question'])
+            columns._answers.append(answers.setdefault(document['answer'], document['answer']))
+            columns._card_ids.append(document.get('card_id') or new_card_id())
+            columns._correct.append(document.get('correct_answers', 0) or 0)
+            columns._reversible.append(bool(document.get('reversible', False)))
+        return columns
+
+
+    def _card(self, position):
+        card = self._cards.get(position)
+        if card is None:
+            card = self._cards[position] = ColumnCard(self, position)
+        return card
+
+    def _detach(self, positions):
+        for position in positions:
+            card = self._cards.pop(position, None)
+            if card is not None:
+                card._detach()
+
+    def _adopt(self, card, position):
+        """Make a ColumnCard just stored at position read and write that row, as a list would keep the object itself"""
+        if not isinstance(card, ColumnCard) or card._columns not in (None, self):
+            return
+        if card._columns is self and self._cards.get(card._position) is card:
+            del self._cards[card._position]
+        card._columns, card._position, card._detached = self, position, None
+        self._cards[position] = card
+
+    def _shift(self, start, step):
+        """Move the cards handed out at start and after by step positions"""
+        moved = [(position, card) for position, card in list(self._cards.items()) if position >= start]
+        for position, _ in moved:
+            del self._cards[position]
+        for position, card in moved:
+            card._position = position + step
+            self._cards[position + step] = card
+
+    def __len__(self):
+        return len(self._questions)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self._card(i) for i in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("card index out of range")
+        return self._card(position)
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self._card(position)
+
+    def __setitem__(self, position, card):
+        if isinstance(position, slice):
+            cards = list(self)
+            cards[position] = card
+            self._replace(cards)
+            return
+        if position < 0:
+            position += len(self)
+        if self._cards.get(position) is card:
+            return
+        # Read every field first: card may be a ColumnCard of these very columns
+        question, answer, card_id, correct, reversible = card.question, card.answer, card.card_id, card.correct_answers, card.reversible
+        self._detach([position])
+        self._questions[position] = question
+        self._answers[position] = answer
+        self._card_ids[position] = card_id
+        self._correct[position] = correct
+        self._reversible[position] = bool(reversible)
+        self._adopt(card, position)
+
+    def __delitem__(self, position):
+        if isinstance(position, slice):
+            cards = list(self)
+            del cards[position]
+            self._replace(cards)
+            return
+        if position < 0:
+            position += len(self)
+        self._detach([position])
+        del self._questions[position]
+        del self._answers[position]
+        del self._card_ids[position]
+        del self._correct[position]
+        del self._reversible[position]
+        self._shift(position + 1, -1)
+
+    def insert(self, position, card):
+        question, answer, card_id, correct, reversible = card.question, card.answer, card.card_id, card.correct_answers, card.reversible
+        # Clamp like list.insert, so the cards after it move by exactly one
+        position = max(0, min(len(self), position + len(self) if position < 0 else position))
+        if position < len(self):
+            self._shift(position, 1)
+        self._questions.insert(position, question)
+        self._answers.insert(position, answer)
+        self._card_ids.insert(position, card_id)
+        self._correct.insert(position, correct)
+        self._reversible.insert(position, bool(reversible))
+        self._adopt(card, position)
+
+    def _replace(self, cards):
+        fresh = CardColumns(cards)
+        # Every row changes hands; the cards that stay in the deck are adopted again below
+        self._detach(list(self._cards.keys()))
+        self._questions, self._answers, self._card_ids = fresh._questions, fresh._answers, fresh._card_ids
+        self._correct, self._reversible = fresh._correct, fresh._reversible
+        for position, card in enumerate(cards):
+            self._adopt(card, position)
+
+    @property
+    def questions(self):
+        return self._questions
+
+    @property
+    def answers(self):
+        return self._answers
+
+    def reversible_count(self):
+        """How many cards are reversible, without building them"""
+        return sum(self._reversible)
+
+    def copy(self):
+        """Copy the columns; the strings in them are shared"""
+        columns = CardColumns()
+        columns._questions = list(self._questions)
+        columns._answers = list(self._answers)
+        columns._card_ids = list(self._card_ids)
+        columns._correct = array('I', self._correct)
+        columns._reversible = array('b', self._reversible)
+        return columns
+
+    def estimate_size(self):
+        """Rough bytes held by the columns, including their strings"""
+        size = sum(sys.getsizeof(column) for column in (self._questions, self._answers, self._card_ids, self._correct, self._reversible))
+        for column in (self._questions, self._card_ids):
+            size += sum(sys.getsizeof(text) for text in column)
+        size += sum(sys.getsizeof(text) for text in {id(text): text for text in self._answers}.values())
+        return size
+
+
+class ColumnarDeck(Deck):
+    """A Deck whose flashcards are kept in CardColumns; behaves like a Deck everywhere else, edits to its cards included"""
+
+    @property
+    def flashcards(self):
+        return self._columns
+
+    @flashcards.setter
+    def flashcards(self, flashcards):
+        self._columns = flashcards if isinstance(flashcards, CardColumns) else CardColumns(flashcards)
+
+    def copy(self):
+        return ColumnarDeck(self.name, self._columns.copy(), self.experience)
+
+class DeckSummary:
+    """What list pages need to know about a deck, without its cards"""
+    def __init__(self, name, card_count, experience=0, deck_id=None):
+        self.name = name
+        self.card_count = card_count or 0
+        self.experience = experience or 0
+        self._id = deck_id
+
+# Row layout (RFC 4180 CSV, one record per line):
+#     name,experience
+#     question,answer,correct_answers,reversible
+#     ...
+
+def deck_rows(deck, include_progress=True):
+    """Yield the CSV records of a deck one at a time, header first"""
+    yield [deck.name, deck.experience if include_progress else 0]
     for flashcard in deck.flashcards:
-        deckAsString += flashcard.question + "," + flashcard.answer + "," + str(flashcard.correct_answers) + "," + str(flashcard.reversible) + "\n"
-    return deckAsString
+        yield [
+            flashcard.question,
+            flashcard.answer,
+            flashcard.correct_answers if include_progress else 0,
+            flashcard.reversible
+        ]
+
+def write_deck(deck, fileobj, include_progress=True):
+    """Write a deck as CSV to a text file object (open it with newline='')"""
+    writer = csv.writer(fileobj)
+    for row in deck_rows(deck, include_progress):
+        writer.writerow(row)
+
+def iter_encoded_deck(deck, include_progress=True):
+    """Yield a deck's CSV text one record at a time, e.g. for a streamed HTTP response"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in deck_rows(deck, include_progress):
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+
+def parse_bool(text):
+    return text.strip().lower() in ("true", "1", "yes")
+
+# Counts are stored as unsigned 32-bit numbers (in packed decks and in CardColumns)
+MAX_COUNT = 2**32 - 1
+
+def parse_count(text, what):
+    """A correct-answer or experience count from a CSV field; 0 if it is blank"""
+    if not text.strip():
+        return 0
+    count = int(text)
+    if not 0 <= count <= MAX_COUNT:
+        raise ValueError(f"{what} must be between 0 and {MAX_COUNT}: {text!r}")
+    return count
+
+def iter_flashcards(reader):
+    """Turn the card records of a csv.reader into Flashcards, one at a time"""
+    for parts in reader:
+        if not parts or not any(part.strip() for part in parts):
+            continue  # Skip empty lines
+        if len(parts) < 2:
+            raise ValueError(f"Card record needs a question and an answer: {parts!r}")
+        correct_answers = parse_count(parts[2], "Correct answers") if len(parts) > 2 else 0
+        reversible = parse_bool(parts[3]) if len(parts) > 3 else False
+        yield Flashcard(parts[0], parts[1], correct_answers, reversible)
+
+def read_deck_lazily(fileobj):
+    """Read a CSV deck header and return (name, experience, generator of Flashcards)
+
+    Cards are parsed only as the generator is consumed, so huge exports can be imported in constant memory.
+    """
+    reader = csv.reader(fileobj)
+    header = next(reader, None)
+    if not header:
+        raise ValueError("Deck file is empty")
+    experience = parse_count(header[1], "Experience") if len(header) > 1 else 0
+    return header[0], experience, iter_flashcards(reader)
+
+def read_deck(fileobj):
+    """Read a whole CSV deck from a text file object"""
+    name, experience, flashcards = read_deck_lazily(fileobj)
+    return Deck(name, list(flashcards), experience)
+
+def encode_deck(deck, include_progress=True):
+    buffer = io.StringIO()
+    write_deck(deck, buffer, include_progress)
+    return buffer.getvalue()
 
 def decode_deck(deckAsString):
-    lines = deckAsString.strip().split("\n")
-    header = lines[0].split(",")
-    deck = Deck(header[0], [], int(header[1]))
-    
-    for line in lines[1:]:
-        if line.strip():  # Skip empty lines
-            parts = line.split(",")
-            deck.flashcards.append(Flashcard(parts[0], parts[1], int(parts[2]), bool(parts[3])))
-    return deck
-
-
-#create new deck to test. 
-deck = Deck("Spanish Vocab", [Flashcard("Hola", "Hello",2), Flashcard("Adios", "Goodbye", 1)],12)
-
-print(encode_deck(deck))
-print(encode_deck(decode_deck(encode_deck(deck))))
+    return read_deck(io.StringIO(deckAsString, newline=''))
+
+
+# Binary layout. A fixed header, then the body, compressed as a whole by the codec in the header:
+#     header  magic "SSDK" | version u8 | codec u8 | flags u8 | reserved u8
+#     body    string count u32 | string byte lengths u32[] | UTF-8 string bytes
+#             card count u32 | name string u32 | experience u32
+#             question strings u32[cards] | answer strings u32[cards] | reversible bitset
+#             correct_answers u32[cards]  (only with FLAG_PROGRESS)
+#             card id strings u32[cards]  (only with FLAG_CARD_IDS)
+# Every string is stored once in the string table and referred to by index, so answers
+# repeated across cards cost 4 bytes each. All integers are little-endian.
+BINARY_MAGIC = b"SSDK"
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct("<4sBBBx")
+CODECS = {"none": 0, "zlib": 1, "lzma": 2}
+FLAG_PROGRESS = 1
+FLAG_CARD_IDS = 2
+
+def _u32_array(values):
+    column = array("I", values)
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column
+
+def _compress(codec, body):
+    if codec == CODECS["zlib"]:
+        return zlib.compress(body)
+    if codec == CODECS["lzma"]:
+        return lzma.compress(body)
+    return bytes(body)
+
+def _decompress(codec, payload):
+    if codec == CODECS["zlib"]:
+        return zlib.decompress(payload)
+    if codec == CODECS["lzma"]:
+        return lzma.decompress(payload)
+    if codec == CODECS["none"]:
+        return payload
+    raise ValueError(f"Unknown deck codec {codec}")
+
+def pack_deck(deck, include_progress=True, codec="zlib"):
+    """Encode a deck in the compact binary format
+
+    include_progress=False leaves out experience, correct answers and card IDs, giving a copy to share.
+    """
+    strings = {}
+    def intern(text):
+        index = strings.get(text)
+        if index is None:
+            index = strings[text] = len(strings)
+        return index
+
+    name_index = intern(deck.name)
+    questions = _u32_array([intern(card.question) for card in deck.flashcards])
+    answers = _u32_array([intern(card.answer) for card in deck.flashcards])
+    card_ids = _u32_array([intern(card.card_id) for card in deck.flashcards]) if include_progress else array("I")
+    card_count = len(questions)
+
+    reversible = bytearray((card_count + 7) // 8)
+    for position, card in enumerate(deck.flashcards):
+        if card.reversible:
+            reversible[position >> 3] |= 1 << (position & 7)
+    progress = _u32_array([card.correct_answers for card in deck.flashcards]) if include_progress else array("I")
+
+    encoded = [text.encode("utf-8") for text in strings]
+    lengths = _u32_array([len(chunk) for chunk in encoded])
+    sections = [
+        struct.pack("<I", len(encoded)), lengths, b"".join(encoded),
+        struct.pack("<III", card_count, name_index, deck.experience if include_progress else 0),
+        questions, answers, reversible, progress, card_ids,
+    ]
+
+    # Copy each section straight into one preallocated buffer
+    views = [memoryview(section).cast("B") for section in sections]
+    body = bytearray(sum(view.nbytes for view in views))
+    target = memoryview(body)
+    offset = 0
+    for view in views:
+        target[offset:offset + view.nbytes] = view
+        offset += view.nbytes
+
+    flags = (FLAG_PROGRESS | FLAG_CARD_IDS) if include_progress else 0
+    header = BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, CODECS[codec], flags)
+    return header + _compress(CODECS[codec], body)
+
+def unpack_deck(data):
+    """Decode a deck written by pack_deck"""
+    data = memoryview(data)
+    if data.nbytes < BINARY_HEADER.size:
+        raise ValueError("Not a binary deck: too short")
+    magic, version, codec, flags = BINARY_HEADER.unpack_from(data)
+    if magic != BINARY_MAGIC:
+        raise ValueError("Not a binary deck: bad magic")
+    if version > BINARY_VERSION:
+        raise ValueError(f"Binary deck version {version} is newer than supported ({BINARY_VERSION})")
+    try:
+        body = memoryview(_decompress(codec, data[BINARY_HEADER.size:]))
+    except (zlib.error, lzma.LZMAError) as ex:
+        raise ValueError(f"Binary deck body cannot be decompressed: {ex}") from None
+
+    def section(offset, size, what):
+        """Bounds of a section, after checking the body really holds it"""
+        if offset + size > body.nbytes:
+            raise ValueError(f"Binary deck is truncated: {what} needs {size} bytes at offset {offset}, body has {body.nbytes}")
+        return offset + size
+
+    def u32_column(offset, count, what):
+        end = section(offset, 4 * count, what)
+        column = array("I")
+        column.frombytes(body[offset:end])
+        if sys.byteorder == "big":
+            column.byteswap()
+        return column, end
+
+    def string_indexes(column, what):
+        if column and max(column) >= len(strings):
+            raise ValueError(f"Binary deck {what} refer to string {max(column)} of {len(strings)}")
+        return column
+
+    section(0, 4, "string count")
+    (string_count,) = struct.unpack_from("<I", body, 0)
+    lengths, offset = u32_column(4, string_count, "string lengths")
+    strings = []
+    for length in lengths:
+        end = section(offset, length, "string table")
+        strings.append(str(body[offset:end], "utf-8"))
+        offset = end
+
+    section(offset, 12, "card count")
+    card_count, name_index, experience = struct.unpack_from("<III", body, offset)
+    offset += 12
+    string_indexes([name_index], "name")
+    questions, offset = u32_column(offset, card_count, "questions")
+    answers, offset = u32_column(offset, card_count, "answers")
+    string_indexes(questions, "questions")
+    string_indexes(answers, "answers")
+    end = section(offset, (card_count + 7) // 8, "reversible flags")
+    reversible = body[offset:end]
+    offset = end
+    if flags & FLAG_PROGRESS:
+        progress, offset = u32_column(offset, card_count, "correct answers")
+    else:
+        progress = [0] * card_count
+    if flags & FLAG_CARD_IDS:
+        card_ids, offset = u32_column(offset, card_count, "card IDs")
+        card_ids = [strings[index] for index in string_indexes(card_ids, "card IDs")]
+    else:
+        card_ids = [None] * card_count
+    if offset != body.nbytes:
+        raise ValueError(f"Binary deck has {body.nbytes - offset} unexpected bytes after its cards")
+
+    flashcards = [
+        Flashcard(
+            strings[questions[position]],
+            strings[answers[position]],
+            progress[position],
+            bool(reversible[position >> 3] & (1 << (position & 7))),
+            card_ids[position]
+        )
+        for position in range(card_count)
+    ]
+    return Deck(strings[name_index], flashcards, experience)
+
+def is_packed_deck(data):
+    """True if data starts like a pack_deck() output"""
+    return bytes(data[:len(BINARY_MAGIC)]) == BINARY_MAGIC
+
+
+if __name__ == "__main__":
+    #create new deck to test. 
+    deck = Deck("Spanish Vocab", [Flashcard("Hola", "Hello",2), Flashcard("Adios, amigo", "Goodbye, \"friend\"", 1, True)],12)
+
+    print(encode_deck(deck))
+    print(encode_deck(decode_deck(encode_deck(deck))))
+    print(encode_deck(deck, include_progress=False))
+
+    packed = pack_deck(deck)
+    print(len(packed), "bytes packed:", encode_deck(unpack_deck(packed)))
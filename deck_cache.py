@@ -0,0 +1,100 @@
+# File used for
+#     - caching each user's hydrated decks (all of them, or one deck at a time) between requests
+#     - invalidating cached decks with a per-user version counter that every save bumps
+#     - bounding the cache by number of users and by estimated memory (least recently used goes first)
+
+import sys
+import threading
+from collections import OrderedDict
+
+# Rough per-object overhead of a Deck / Flashcard instance and its attributes, in bytes
+DECK_OVERHEAD = 600
+CARD_OVERHEAD = 400
+
+
+def estimate_decks_size(decks):
+    """Estimate how many bytes a list of hydrated decks keeps alive"""
+    size = sys.getsizeof(decks)
+    for deck in decks:
+        size += DECK_OVERHEAD + len(deck.name)
+        if hasattr(deck.flashcards, 'estimate_size'):
+            # Columnar decks know their own size and would build a Flashcard per card if iterated
+            size += deck.flashcards.estimate_size()
+            continue
+        for card in deck.flashcards:
+            size += CARD_OVERHEAD + len(card.question) + len(card.answer)
+    return size
+
+
+class DeckCache:
+    """Thread-safe LRU cache of deck lists keyed by auth_id (or (auth_id, deck_id)) and tagged with the version they were loaded at"""
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (version, decks, size)
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, version):
+        """Return the cached decks for key if they were loaded at this version, else None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version, decks, size=None):
+        """Cache decks for key at version, evicting least recently used entries to stay in budget"""
+        if size is None:
+            size = estimate_decks_size(decks)
+        if size > self.max_bytes:
+            # A single entry larger than the whole budget would just flush everyone else
+            self.invalidate(key)
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (version, decks, size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """Drop whatever is cached for key"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[2]
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Counters for monitoring how well the cache is doing"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,706 @@
+# File used for
+#     - the interface every deck storage backend implements (users, decks, cards, progress, versions)
+#     - helpers the backends share: card documents, deck snapshots and working out what changed in a deck
+#     - shared public decks: immutable published versions, and the small per-user overlay (progress and local
+#       edits) that a subscribed deck keeps instead of a copy of the cards
+#     - searching public decks by name and card text (each backend keeps its own inverted index)
+#     - the in-memory backend, for tests, benchmarks and running without any database
+#     - picking a backend from configuration (MongoDB, SQLite or memory)
+
+import datetime
+import threading
+
+from bson.objectid import ObjectId
+
+from datacompression import CardColumns, ColumnarDeck, Deck, DeckSummary, Flashcard
+from deck_cache import CARD_OVERHEAD, DeckCache
+from search_index import SearchIndex, deck_search_text
+
+# Decks with at least this many cards are loaded column by column to save memory
+DEFAULT_COLUMNAR_THRESHOLD = 1000
+
+# Published versions never change, so every subscriber in a process shares one cached copy of their cards
+PUBLIC_CARD_CACHE_VERSIONS = 256
+PUBLIC_CARD_CACHE_BYTES = 32 * 1024 * 1024
+
+# Card fields a subscriber can change locally; anything else about a public card is shared
+EDITABLE_FIELDS = ('question', 'answer', 'reversible')
+
+
+class DeckList(list):
+    """List of a user's decks that remembers which deck IDs were in the database when it was loaded"""
+    def __init__(self, decks=(), loaded_ids=None):
+        super().__init__(decks)
+        self.loaded_ids = set(loaded_ids or ())
+
+
+def card_to_document(card):
+    """Convert a Flashcard to the dict embedded in a deck document"""
+    return {
+        'card_id': card.card_id,
+        'question': card.question,
+        'answer': card.answer,
+        'correct_answers': card.correct_answers,
+        'reversible': card.reversible
+    }
+
+
+def card_from_document(card_data):
+    """Convert a card dict embedded in a deck document to a Flashcard"""
+    return Flashcard(
+        card_data['question'],
+        card_data['answer'],
+        card_data.get('correct_answers', 0),
+        card_data.get('reversible', False),
+        card_data.get('card_id')
+    )
+
+
+def card_fingerprint(card):
+    """A hash that changes whenever a card's stored fields change"""
+    return hash((card.question, card.answer, card.correct_answers, card.reversible))
+
+
+def take_deck_snapshot(deck):
+    """Remember a deck's persisted state so later saves only send what changed"""
+    cards = {card.card_id: card_fingerprint(card) for card in deck.flashcards}
+    deck._snapshot = {
+        'name': deck.name,
+        'experience': deck.experience,
+        'card_ids': list(cards),
+        'cards': cards
+    }
+
+
+def build_deck(deck_id, name, experience, card_documents, columnar_threshold=DEFAULT_COLUMNAR_THRESHOLD):
+    """A loaded deck (a ColumnarDeck for big decks) with its ID and a snapshot for later saves"""
+    if len(card_documents) >= columnar_threshold:
+        deck = ColumnarDeck(name, CardColumns.from_documents(card_documents))
+    else:
+        deck = Deck(name, [card_from_document(card_data) for card_data in card_documents])
+    deck.experience = experience or 0
+    deck._id = deck_id
+    take_deck_snapshot(deck)
+    return deck
+
+
+class DeckChanges:
+    """What changed in a loaded deck since its snapshot was taken"""
+
+    def __init__(self, deck):
+        snapshot = deck._snapshot
+        current_ids = [card.card_id for card in deck.flashcards]
+        current_id_set = set(current_ids)
+        kept_ids = [card_id for card_id in current_ids if card_id in snapshot['cards']]
+
+        self.name = deck.name if deck.name != snapshot['name'] else None
+        self.experience_delta = deck.experience - snapshot['experience']
+        # Reordered, or cards inserted mid-deck: backends rewrite the whole card list
+        self.reordered = (kept_ids != current_ids[:len(kept_ids)]
+                          or kept_ids != [card_id for card_id in snapshot['card_ids'] if card_id in current_id_set])
+        if self.reordered:
+            self.removed_ids, self.changed_cards, self.added_cards = [], [], []
+        else:
+            self.removed_ids = [card_id for card_id in snapshot['card_ids'] if card_id not in current_id_set]
+            self.changed_cards = [card for card in deck.flashcards[:len(kept_ids)]
+                                  if card_fingerprint(card) != snapshot['cards'][card.card_id]]
+            self.added_cards = deck.flashcards[len(kept_ids):]
+
+    def __bool__(self):
+        return bool(self.name is not None or self.experience_delta or self.reordered
+                    or self.removed_ids or self.changed_cards or self.added_cards)
+
+
+def new_deck_id():
+    """Deck IDs are ObjectId strings in every backend, so URLs look the same whatever stores them"""
+    return str(ObjectId())
+
+
+def public_card_document(card):
+    """A card as it is published: progress is personal, so it stays behind"""
+    document = card_to_document(card)
+    document['correct_answers'] = 0
+    return document
+
+
+class PublicCards:
+    """The cards of one published version, in order and by card ID"""
+
+    def __init__(self, documents):
+        self.documents = tuple(documents)
+        self.by_id = {card_data['card_id']: card_data for card_data in self.documents}
+
+    def __len__(self):
+        return len(self.documents)
+
+    def estimate_size(self):
+        return sum(CARD_OVERHEAD + len(card_data['question']) + len(card_data['answer']) for card_data in self.documents)
+
+
+# A subscribed deck stores only an overlay on top of the public version it follows:
+#     progress: card_id -> correct answers     edits: card_id -> {field: local value}
+#     removed: [card_id] hidden locally        added: [card documents] of the subscriber's own cards
+
+def empty_overlay():
+    return {'progress': {}, 'edits': {}, 'removed': [], 'added': []}
+
+
+def merge_overlay(public_cards, overlay):
+    """A subscriber's card documents: the public cards with their progress, edits and removals, then their own"""
+    progress = overlay['progress']
+    edits = overlay['edits']
+    removed = set(overlay['removed'])
+    merged = []
+    for card_data in public_cards.documents:
+        card_id = card_data['card_id']
+        if card_id in removed:
+            continue
+        card = dict(card_data, **edits.get(card_id, {}))
+        card['correct_answers'] = progress.get(card_id, 0)
+        merged.append(card)
+    merged.extend(dict(card_data) for card_data in overlay['added'])
+    return merged
+
+
+def overlay_card_count(public_cards, overlay):
+    removed = sum(1 for card_id in overlay['removed'] if card_id in public_cards.by_id)
+    return len(public_cards) - removed + len(overlay['added'])
+
+
+def overlay_record_answers(overlay, correct_counts, public_cards):
+    """Add correct answers to an overlay; returns how many answers went to cards it found"""
+    removed = set(overlay['removed'])
+    added = {card_data['card_id']: card_data for card_data in overlay['added']}
+    recorded = 0
+    for card_id, count in correct_counts.items():
+        if card_id in public_cards.by_id and card_id not in removed:
+            overlay['progress'][card_id] = overlay['progress'].get(card_id, 0) + count
+        elif card_id in added:
+            added[card_id]['correct_answers'] = added[card_id].get('correct_answers', 0) + count
+        else:
+            continue
+        recorded += count
+    return recorded
+
+
+def overlay_delete_card(overlay, card_id, public_cards):
+    """Hide a public card or drop one of the subscriber's own; False if the deck has no such card"""
+    if card_id in public_cards.by_id:
+        if card_id in overlay['removed']:
+            return False
+        overlay['removed'].append(card_id)
+        overlay['progress'].pop(card_id, None)
+        overlay['edits'].pop(card_id, None)
+        return True
+    kept = [card_data for card_data in overlay['added'] if card_data['card_id'] != card_id]
+    found = len(kept) < len(overlay['added'])
+    overlay['added'] = kept
+    return found
+
+
+def overlay_apply_changes(overlay, changes, public_cards):
+    """Fold a save's DeckChanges into an overlay (a reordered deck can't be expressed as one)"""
+    added_positions = {card_data['card_id']: position for position, card_data in enumerate(overlay['added'])}
+    for card in changes.changed_cards:
+        document = card_to_document(card)
+        public_card = public_cards.by_id.get(card.card_id)
+        if public_card is None:
+            if card.card_id in added_positions:
+                overlay['added'][added_positions[card.card_id]] = document
+            continue
+        edit = {field: document[field] for field in EDITABLE_FIELDS if document[field] != public_card[field]}
+        if edit:
+            overlay['edits'][card.card_id] = edit
+        else:
+            overlay['edits'].pop(card.card_id, None)
+        if card.correct_answers:
+            overlay['progress'][card.card_id] = card.correct_answers
+        else:
+            overlay['progress'].pop(card.card_id, None)
+    for card_id in changes.removed_ids:
+        overlay_delete_card(overlay, card_id, public_cards)
+    overlay['added'].extend(card_to_document(card) for card in changes.added_cards)
+    return overlay
+
+
+class DeckStore:
+    """Where users, their decks and their progress are kept
+
+    Every change to a user's decks bumps the user's deck version, which callers use to tell
+    whether what they cached is still current. Methods report failures by returning False,
+    None or an empty result, never by raising.
+    """
+
+    backend = None
+
+    def __init__(self, columnar_threshold=DEFAULT_COLUMNAR_THRESHOLD):
+        self.columnar_threshold = columnar_threshold
+        self.public_cards = DeckCache(max_entries=PUBLIC_CARD_CACHE_VERSIONS, max_bytes=PUBLIC_CARD_CACHE_BYTES)
+
+    def upsert_user(self, auth_id, email, name=None, picture=None):
+        """Create the user, or update their details and last login; False if it could not be saved"""
+        raise NotImplementedError
+
+    def get_user(self, auth_id):
+        """The user's record as a dict, or None"""
+        raise NotImplementedError
+
+    def get_deck_version(self, auth_id):
+        """The counter every change to a user's decks bumps, or None if there is no such user"""
+        raise NotImplementedError
+
+    def load_decks(self, auth_id):
+        """All of a user's decks in creation order, as a DeckList of Decks with snapshots"""
+        raise NotImplementedError
+
+    def load_deck(self, auth_id, deck_id):
+        """One of a user's decks with all its cards, or None"""
+        raise NotImplementedError
+
+    def get_card(self, auth_id, deck_id, card_id):
+        """One card of one of a user's decks, without loading the rest of the deck"""
+        raise NotImplementedError
+
+    def get_card_id(self, auth_id, deck_id, card_index):
+        """The ID of the card at a position in a deck, or None"""
+        raise NotImplementedError
+
+    def get_deck_page(self, auth_id, deck_id, offset, limit):
+        """A deck's summary and one page of its cards, or (None, [])"""
+        raise NotImplementedError
+
+    def get_deck_summaries(self, auth_id):
+        """Name, experience and card count of each of a user's decks, in creation order"""
+        raise NotImplementedError
+
+    def save_decks(self, auth_id, decks):
+        """Write what changed in a user's decks since they were loaded; decks missing from the list are deleted
+
+        New decks get their _id set; every deck gets a fresh snapshot.
+        """
+        raise NotImplementedError
+
+    def add_cards(self, auth_id, deck_id, cards):
+        """Append cards to one of a user's decks"""
+        raise NotImplementedError
+
+    def delete_card(self, auth_id, deck_id, card_id):
+        """Remove one card from one of a user's decks; False if the deck has no such card"""
+        raise NotImplementedError
+
+    def delete_deck(self, auth_id, deck_id):
+        """Delete one of a user's decks with its cards"""
+        raise NotImplementedError
+
+    def record_answers(self, auth_id, deck_id, correct_counts):
+        """Add correct answers to cards of one deck (card_id -> count), and those that went to existing cards to its experience"""
+        raise NotImplementedError
+
+    def record_correct_answer(self, auth_id, deck_id, card_id):
+        """Add one correct answer to a card and one experience point to its deck"""
+        return self.record_answers(auth_id, deck_id, {card_id: 1})
+
+    def publish_deck(self, auth_id, deck_id):
+        """Publish the current cards of one of a user's decks as the next version of its public deck
+
+        Returns the public deck (see get_public_deck), or None. Earlier versions stay as they were,
+        so subscribers keep what they subscribed to until they update.
+        """
+        deck = self.load_deck(auth_id, deck_id)
+        if deck is None:
+            return None
+        return self._publish(auth_id, deck_id, deck.name, [public_card_document(card) for card in deck.flashcards])
+
+    def _publish(self, auth_id, deck_id, name, card_documents):
+        raise NotImplementedError
+
+    def get_public_deck(self, public_id):
+        """A public deck's latest version as a dict (public_id, name, version, card_count, owner_auth_id,
+        source_deck_id, subscriptions, created_at, updated_at), or None"""
+        raise NotImplementedError
+
+    def list_public_decks(self, offset=0, limit=20):
+        """Public decks, most recently published first"""
+        raise NotImplementedError
+
+    def get_published_deck(self, auth_id, deck_id):
+        """The public deck one of a user's decks was published as, or None"""
+        raise NotImplementedError
+
+    def search_public_decks(self, query, offset=0, limit=20):
+        """Public decks whose name or latest cards contain any word of the query, best matches first"""
+        raise NotImplementedError
+
+    def get_public_cards(self, public_id, version):
+        """PublicCards of one version of a public deck, or None; cached, since versions never change"""
+        key = (public_id, version)
+        public_cards = self.public_cards.get(key, 0)
+        if public_cards is None:
+            documents = self._load_public_cards(public_id, version)
+            if documents is None:
+                return None
+            public_cards = PublicCards(documents)
+            self.public_cards.put(key, 0, public_cards, size=public_cards.estimate_size())
+        return public_cards
+
+    def _load_public_cards(self, public_id, version):
+        raise NotImplementedError
+
+    def subscribe(self, auth_id, public_id):
+        """Give a user a deck that follows the latest version of a public deck; its ID, or None
+
+        The deck stores only the user's overlay; its cards are read from the public version.
+        """
+        raise NotImplementedError
+
+    def get_deck_source(self, auth_id, deck_id):
+        """{"public_id", "version"} of the public deck a subscribed deck follows, or None"""
+        raise NotImplementedError
+
+    def update_subscription(self, auth_id, deck_id):
+        """Move a subscribed deck to the latest version of its public deck, keeping the user's overlay"""
+        raise NotImplementedError
+
+    def stats(self):
+        """What monitoring should know about the backend"""
+        return {"backend": self.backend, "public_cards": self.public_cards.stats()}
+
+
+class MemoryDeckStore(DeckStore):
+    """Keeps everything in this process's memory; lost on restart and not shared between workers"""
+
+    backend = "memory"
+
+    def __init__(self, columnar_threshold=DEFAULT_COLUMNAR_THRESHOLD):
+        super().__init__(columnar_threshold)
+        self._users = {}   # auth_id -> user dict, including deck_version
+        # auth_id -> {deck_id: {"name", "experience", "cards": [card documents], "source", "overlay"}}, in creation order;
+        # subscribed decks have a source and an overlay instead of cards
+        self._decks = {}
+        self._public = {}           # public_id -> public deck dict
+        self._published = {}        # (owner auth_id, deck_id) -> public_id
+        self._public_versions = {}  # (public_id, version) -> tuple of card documents
+        self._public_search = SearchIndex()  # over public decks' names and latest cards
+        self._lock = threading.RLock()
+
+    def _bump(self, auth_id):
+        user = self._users.get(auth_id)
+        if user is not None:
+            user['deck_version'] += 1
+
+    def _deck(self, auth_id, deck_id):
+        return self._decks.get(auth_id, {}).get(deck_id)
+
+    def _source_cards(self, record):
+        source = record['source']
+        return self.get_public_cards(source['public_id'], source['version']) or PublicCards(())
+
+    def _card_documents(self, record):
+        if record.get('source') is None:
+            return record['cards']
+        return merge_overlay(self._source_cards(record), record['overlay'])
+
+    def _build(self, deck_id, record):
+        return build_deck(deck_id, record['name'], record['experience'], self._card_documents(record), self.columnar_threshold)
+
+    def upsert_user(self, auth_id, email, name=None, picture=None):
+        now = datetime.datetime.utcnow()
+        with self._lock:
+            user = self._users.get(auth_id)
+            if user is None:
+                user = self._users[auth_id] = {"auth_id": auth_id, "created_at": now, "deck_version": 0}
+                print(f"Created new user: {email}")
+            else:
+                print(f"Updated existing user: {email}")
+            user.update({"email": email, "name": name, "picture": picture, "last_login": now})
+        return True
+
+    def get_user(self, auth_id):
+        with self._lock:
+            user = self._users.get(auth_id)
+            return dict(user) if user is not None else None
+
+    def get_deck_version(self, auth_id):
+        with self._lock:
+            user = self._users.get(auth_id)
+            return user['deck_version'] if user is not None else None
+
+    def load_decks(self, auth_id):
+        with self._lock:
+            decks = DeckList(self._build(deck_id, record) for deck_id, record in self._decks.get(auth_id, {}).items())
+        decks.loaded_ids = {deck._id for deck in decks}
+        return decks
+
+    def load_deck(self, auth_id, deck_id):
+        with self._lock:
+            record = self._deck(auth_id, deck_id)
+            return self._build(deck_id, record) if record is not None else None
+
+    def get_card(self, auth_id, deck_id, card_id):
+        with self._lock:
+            record = self._deck(auth_id, deck_id)
+            for card_data in self._card_documents(record) if record is not None else ():
+                if card_data['card_id'] == card_id:
+                    return card_from_document(card_data)
+        return None
+
+    def get_card_id(self, auth_id, deck_id, card_index):
+        with self._lock:
+            record = self._deck(auth_id, deck_id)
+            card_documents = self._card_documents(record) if record is not None else []
+            if not 0 <= card_index < len(card_documents):
+                return None
+            return card_documents[card_index]['card_id']
+
+    def get_deck_page(self, auth_id, deck_id, offset, limit):
+        with self._lock:
+            record = self._deck(auth_id, deck_id)
+            if record is None:
+                return None, []
+            card_documents = self._card_documents(record)
+            summary = DeckSummary(record['name'], len(card_documents), record['experience'], deck_id)
+            return summary, [card_from_document(card_data) for card_data in card_documents[offset:offset + limit]]
+
+    def get_deck_summaries(self, auth_id):
+        with self._lock:
+            return [
+                DeckSummary(record['name'], self._card_count(record), record['experience'], deck_id)
+                for deck_id, record in self._decks.get(auth_id, {}).items()
+            ]
+
+    def _card_count(self, record):
+        if record.get('source') is None:
+            return len(record['cards'])
+        return overlay_card_count(self._source_cards(record), record['overlay'])
+
+    def save_decks(self, auth_id, decks):
+        with self._lock:
+            if auth_id not in self._users:
+                print(f"Cannot save decks: User with auth_id {auth_id} not found")
+                return False
+            stored = self._decks.setdefault(auth_id, {})
+            loaded_ids = getattr(decks, 'loaded_ids', None)
+            if loaded_ids is None:
+                loaded_ids = set(stored)
+            kept_ids = set()
+            changed = False
+            for deck in decks:
+                deck_id = getattr(deck, '_id', None)
+                record = stored.get(deck_id)
+                if deck_id in loaded_ids and hasattr(deck, '_snapshot') and record is not None:
+                    changes = DeckChanges(deck)
+                    if changes:
+                        self._apply(record, deck, changes)
+                        changed = True
+                else:
+                    deck._id = new_deck_id()
+                    stored[deck._id] = {
+                        "name": deck.name,
+                        "experience": deck.experience,
+                        "cards": [card_to_document(card) for card in deck.flashcards],
+                        "source": None,
+                        "overlay": None
+                    }
+                    changed = True
+                kept_ids.add(deck._id)
+            for deck_id in set(loaded_ids) - kept_ids:
+                if stored.pop(deck_id, None) is not None:
+                    changed = True
+            if changed:
+                self._bump(auth_id)
+        for deck in decks:
+            take_deck_snapshot(deck)
+        if isinstance(decks, DeckList):
+            decks.loaded_ids = kept_ids
+        return True
+
+    def _apply(self, record, deck, changes):
+        if changes.name is not None:
+            record['name'] = changes.name
+        record['experience'] += changes.experience_delta
+        if record.get('source') is not None:
+            if not changes.reordered:
+                overlay_apply_changes(record['overlay'], changes, self._source_cards(record))
+                return
+            # An overlay can't reorder public cards, so the deck becomes a copy of its own
+            record['source'] = record['overlay'] = None
+        if changes.reordered:
+            record['cards'] = [card_to_document(card) for card in deck.flashcards]
+            return
+        changed = {card.card_id: card_to_document(card) for card in changes.changed_cards}
+        removed = set(changes.removed_ids)
+        record['cards'] = [changed.get(card_data['card_id'], card_data)
+                           for card_data in record['cards'] if card_data['card_id'] not in removed]
+        record['cards'].extend(card_to_document(card) for card in changes.added_cards)
+
+    def add_cards(self, auth_id, deck_id, cards):
+        if not cards:
+            return True
+        with self._lock:
+            record = self._deck(auth_id, deck_id)
+            if record is None:
+                return False
+            own_cards = record['cards'] if record.get('source') is None else record['overlay']['added']
+            own_cards.extend(card_to_document(card) for card in cards)
+            self._bump(auth_id)
+        return True
+
+    def delete_card(self, auth_id, deck_id, card_id):
+        with self._lock:
+            record = self._deck(auth_id, deck_id)
+            if record is None:
+                return False
+            if record.get('source') is not None:
+                found = overlay_delete_card(record['overlay'], card_id, self._source_cards(record))
+            else:
+                kept = [card_data for card_data in record['cards'] if card_data['card_id'] != card_id]
+                found = len(kept) < len(record['cards'])
+                record['cards'] = kept
+            if not found:
+                return False
+            self._bump(auth_id)
+        return True
+
+    def delete_deck(self, auth_id, deck_id):
+        with self._lock:
+            if self._decks.get(auth_id, {}).pop(deck_id, None) is None:
+                return False
+            self._bump(auth_id)
+        return True
+
+    def record_answers(self, auth_id, deck_id, correct_counts):
+        with self._lock:
+            record = self._deck(auth_id, deck_id)
+            if record is None:
+                return False
+            record['experience'] += self._record(record, correct_counts)
+            self._bump(auth_id)
+        return True
+
+    def record_correct_answer(self, auth_id, deck_id, card_id):
+        with self._lock:
+            record = self._deck(auth_id, deck_id)
+            if record is None or not self._record(record, {card_id: 1}):
+                return False
+            record['experience'] += 1
+            self._bump(auth_id)
+        return True
+
+    def _record(self, record, correct_counts):
+        """Add correct answers to a deck's cards; how many answers went to cards that were found"""
+        if record.get('source') is not None:
+            return overlay_record_answers(record['overlay'], correct_counts, self._source_cards(record))
+        recorded = 0
+        for card_data in record['cards']:
+            count = correct_counts.get(card_data['card_id'])
+            if count:
+                card_data['correct_answers'] += count
+                recorded += count
+        return recorded
+
+    def _publish(self, auth_id, deck_id, name, card_documents):
+        now = datetime.datetime.utcnow()
+        with self._lock:
+            public = self._public.get(self._published.get((auth_id, deck_id)))
+            if public is None:
+                public_id = self._published[(auth_id, deck_id)] = new_deck_id()
+                public = self._public[public_id] = {
+                    "public_id": public_id, "owner_auth_id": auth_id, "source_deck_id": deck_id,
+                    "version": 0, "subscriptions": 0, "created_at": now
+                }
+            version = public['version'] + 1
+            self._public_versions[(public['public_id'], version)] = tuple(card_documents)
+            public.update(name=name, version=version, card_count=len(card_documents), updated_at=now)
+            self._public_search.update(public['public_id'], name, deck_search_text(card_documents))
+            return dict(public)
+
+    def get_public_deck(self, public_id):
+        with self._lock:
+            public = self._public.get(public_id)
+            return dict(public) if public is not None else None
+
+    def list_public_decks(self, offset=0, limit=20):
+        with self._lock:
+            public_decks = sorted(self._public.values(), key=lambda public: public['updated_at'], reverse=True)
+            return [dict(public) for public in public_decks[offset:offset + limit]]
+
+    def get_published_deck(self, auth_id, deck_id):
+        with self._lock:
+            public = self._public.get(self._published.get((auth_id, deck_id)))
+            return dict(public) if public is not None else None
+
+    def search_public_decks(self, query, offset=0, limit=20):
+        matches = self._public_search.search(query, offset, limit)
+        with self._lock:
+            return [dict(self._public[public_id]) for public_id, _ in matches]
+
+    def _load_public_cards(self, public_id, version):
+        with self._lock:
+            return self._public_versions.get((public_id, version))
+
+    def subscribe(self, auth_id, public_id):
+        with self._lock:
+            public = self._public.get(public_id)
+            if auth_id not in self._users or public is None:
+                return None
+            deck_id = new_deck_id()
+            self._decks.setdefault(auth_id, {})[deck_id] = {
+                "name": public['name'],
+                "experience": 0,
+                "cards": [],
+                "source": {"public_id": public_id, "version": public['version']},
+                "overlay": empty_overlay()
+            }
+            public['subscriptions'] += 1
+            self._bump(auth_id)
+            return deck_id
+
+    def get_deck_source(self, auth_id, deck_id):
+        with self._lock:
+            record = self._deck(auth_id, deck_id)
+            return dict(record['source']) if record is not None and record.get('source') else None
+
+    def update_subscription(self, auth_id, deck_id):
+        with self._lock:
+            record = self._deck(auth_id, deck_id)
+            if record is None or record.get('source') is None:
+                return False
+            public = self._public.get(record['source']['public_id'])
+            if public is not None and public['version'] != record['source']['version']:
+                record['source'] = {"public_id": public['public_id'], "version": public['version']}
+                self._bump(auth_id)
+            return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "users": len(self._users),
+                "decks": sum(len(decks) for decks in self._decks.values()),
+                "public_decks": len(self._public),
+                "public_cards": self.public_cards.stats(),
+                "public_search": self._public_search.stats(),
+            }
+
+
+def open_deck_store(backend="auto", mongo_uri="mongodb://localhost:27017/", sqlite_path="studystacks.sqlite3",
+                    columnar_threshold=DEFAULT_COLUMNAR_THRESHOLD):
+    """The configured deck store; "auto" uses MongoDB when it answers and SQLite otherwise"""
+    if backend in ("auto", "mongo"):
+        try:
+            from mongo_deck_store import MongoDeckStore
+            store = MongoDeckStore.connect(mongo_uri, columnar_threshold)
+            print("Connected to MongoDB successfully")
+            return store
+        except Exception as ex:
+            print(f"ERROR - Cannot connect to MongoDB: {ex}")
+            if backend == "mongo":
+                raise
+    if backend in ("auto", "sqlite"):
+        from sqlite_deck_store import SQLiteDeckStore
+        print(f"Storing decks in SQLite at {sqlite_path}")
+        return SQLiteDeckStore(sqlite_path, columnar_threshold)
+    if backend == "memory":
+        print("Storing decks in memory; they are lost on restart")
+        return MemoryDeckStore(columnar_threshold)
+    raise ValueError(f"Unknown deck store backend: {backend}")
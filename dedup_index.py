@@ -0,0 +1,289 @@
+# File used for
+#     - telling whether a card is already in a deck: exactly, once case, punctuation, whitespace and
+#       articles are normalized away, or nearly (small edits and rewordings of the same question),
+#       as long as the answers agree
+#     - finding near-duplicates with MinHash signatures of character shingles, bucketed by LSH bands
+#       so a check only looks at a handful of likely matches instead of the whole deck
+#     - keeping one index per deck, synced incrementally whenever the deck's version changes
+
+import operator
+import random
+import re
+import threading
+import zlib
+from array import array
+from collections import Counter
+
+from answer_index import AnswerIndexCache
+
+try:
+    import numpy
+except ImportError:  # NumPy is optional; without it signatures are computed in plain Python
+    numpy = None
+
+SHINGLE_SIZE = 4
+
+# Signature length is BANDS * ROWS; two questions become candidates when all rows of any band agree,
+# which happens with probability 1 - (1 - s^ROWS)^BANDS for similarity s (about 0.98 at s = 0.6)
+BANDS = 16
+ROWS = 3
+SIGNATURE_SIZE = BANDS * ROWS
+BAND_BYTES = ROWS * 4
+
+# Share of signature values two questions must share to count as the same question
+NEAR_DUPLICATE_SIMILARITY = 0.6
+
+# Questions, even identical ones, only make a duplicate card when the answers are alike too ("2 + 2" vs "2 + 3")
+ANSWER_SIMILARITY = 0.7
+
+# A check compares at most this many LSH candidates, so crowded buckets can't make it slow
+MAX_CANDIDATES = 64
+
+MERSENNE_PRIME = (1 << 31) - 1
+_permutations = random.Random(0x5EED).sample(range(1, MERSENNE_PRIME), 2 * SIGNATURE_SIZE)
+PERMUTATION_A = _permutations[:SIGNATURE_SIZE]
+PERMUTATION_B = _permutations[SIGNATURE_SIZE:]
+if numpy is not None:
+    NUMPY_A = numpy.array(PERMUTATION_A, dtype=numpy.uint64)[:, None]
+    NUMPY_B = numpy.array(PERMUTATION_B, dtype=numpy.uint64)[:, None]
+
+# Operators and decimal points change what a card asks ("5 + 3" vs "5 - 3", "1.5" vs "15"), so they are kept
+PUNCTUATION_PATTERN = re.compile(r"[^\w\s+\-*/=^%.]+|(?<!\d)\.|\.(?!\d)")
+OPERATOR_PATTERN = re.compile(r"[+\-*/=^%]")
+NUMBER_PATTERN = re.compile(r"\d+(?:\.\d+)?")
+ARTICLES = frozenset(("a", "an", "the"))
+
+
+def normalize_text(text):
+    """Lowercase text, turn punctuation other than operators into spaces and drop articles and extra whitespace"""
+    text = OPERATOR_PATTERN.sub(r" \g<0> ", PUNCTUATION_PATTERN.sub(" ", text.lower()))
+    return " ".join(word for word in text.split() if word not in ARTICLES)
+
+
+def same_numbers(first, second):
+    """Whether two normalized texts mention the same numbers; numbered and templated cards differ only there"""
+    return sorted(NUMBER_PATTERN.findall(first)) == sorted(NUMBER_PATTERN.findall(second))
+
+
+def similar_answers(first, second):
+    """Whether two normalized answers say the same thing"""
+    if first == second:
+        return True
+    return same_numbers(first, second) and jaccard(shingles(first), shingles(second)) >= ANSWER_SIMILARITY
+
+
+def shingles(normalized):
+    """The set of character shingles of normalized text (short text is its own single shingle)"""
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized}
+    return {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+
+
+def jaccard(first, second):
+    return len(first & second) / len(first | second) if first or second else 1.0
+
+
+def minhash_signature(normalized):
+    """MinHash signature of normalized text's shingles: SIGNATURE_SIZE 32-bit values packed into bytes"""
+    hashes = [zlib.crc32(shingle.encode("utf-8")) & MERSENNE_PRIME for shingle in shingles(normalized)]
+    if numpy is not None and len(hashes) > 4:
+        values = (NUMPY_A * numpy.array(hashes, dtype=numpy.uint64) + NUMPY_B) % MERSENNE_PRIME
+        return values.min(axis=1).astype(numpy.uint32).tobytes()
+    return array("I", (min((a * x + b) % MERSENNE_PRIME for x in hashes) for a, b in zip(PERMUTATION_A, PERMUTATION_B))).tobytes()
+
+
+def signature_similarity(first, second):
+    """Estimated Jaccard similarity of the shingles behind two signatures"""
+    return sum(map(operator.eq, memoryview(first).cast("I"), memoryview(second).cast("I"))) / SIGNATURE_SIZE
+
+
+def band_keys(signature):
+    """One bucket key per LSH band: the band's number and its rows of the signature"""
+    return [bytes((band,)) + signature[band * BAND_BYTES:(band + 1) * BAND_BYTES] for band in range(BANDS)]
+
+
+# Most keys of an index map to a single card, so groups hold a bare pair until a second one joins
+
+def _group_add(groups, key, pair):
+    group = groups.get(key)
+    if group is None:
+        groups[key] = pair
+    elif isinstance(group, list):
+        group.append(pair)
+    else:
+        groups[key] = [group, pair]
+
+
+def _group_remove(groups, key, pair):
+    group = groups[key]
+    if not isinstance(group, list):
+        del groups[key]
+        return
+    group.remove(pair)
+    if len(group) == 1:
+        groups[key] = group[0]
+
+
+def _group_members(groups, key):
+    group = groups.get(key)
+    if group is None:
+        return ()
+    return group if isinstance(group, list) else (group,)
+
+
+def card_pairs(deck):
+    """(question, answer) of every card, without building Flashcards for columnar decks"""
+    questions = getattr(deck.flashcards, 'questions', None)
+    answers = getattr(deck.flashcards, 'answers', None)
+    if questions is not None and answers is not None:
+        return zip(questions, answers)
+    return ((card.question, card.answer) for card in deck.flashcards)
+
+
+class DedupIndex:
+    """Exact and near-duplicate lookup over the (question, answer) pairs of one deck"""
+
+    def __init__(self, pairs=()):
+        self._counts = {}        # (question, answer) -> number of cards with it
+        self._features = {}      # (question, answer) -> (normalized question, normalized answer, signature)
+        self._questions = {}     # normalized question -> pair(s) with it
+        self._answers = {}       # normalized answer -> pair(s) with it
+        self._buckets = {}       # band key -> pair(s) whose signature has those rows in that band
+        self._lock = threading.Lock()
+        self.sync(pairs)
+
+    def __len__(self):
+        return len(self._counts)
+
+    def add(self, question, answer):
+        """Count one more card with this question and answer"""
+        with self._lock:
+            self._add((question, answer))
+
+    def remove(self, question, answer):
+        """Count one card fewer with this question and answer"""
+        with self._lock:
+            self._remove((question, answer))
+
+    def sync(self, pairs):
+        """Bring the index in line with a deck's current cards, re-indexing only what changed
+
+        Returns the number of distinct pairs added or dropped.
+        """
+        wanted = Counter(pairs)
+        changed = 0
+        with self._lock:
+            for pair in [pair for pair in self._counts if pair not in wanted]:
+                self._counts[pair] = 1
+                self._remove(pair)
+                changed += 1
+            for pair, count in wanted.items():
+                if pair not in self._counts:
+                    changed += 1
+                    self._add(pair)
+                self._counts[pair] = count
+        return changed
+
+    def find_duplicate(self, question, answer, match_answers=False):
+        """The (question, answer) of a card in the index that this card duplicates, or None
+
+        A card duplicates another that asks the same question once normalized, or nearly the same
+        question with the same numbers in it, when the answers are similar too. With match_answers,
+        any card with the same answer counts as well.
+        """
+        features = self.features(question, answer)
+        with self._lock:
+            return self._find(features, match_answers)
+
+    @staticmethod
+    def features(question, answer):
+        """What the index keeps about a card; computed outside the lock, so checks can pass it to _find"""
+        normalized_question = normalize_text(question)
+        return normalized_question, normalize_text(answer), minhash_signature(normalized_question)
+
+    def _find(self, features, match_answers=False):
+        normalized_question, normalized_answer, signature = features
+        for pair in _group_members(self._questions, normalized_question):
+            if similar_answers(normalized_answer, self._features[pair][1]):
+                return pair
+        if match_answers:
+            for pair in _group_members(self._answers, normalized_answer):
+                return pair
+
+        checked = 0
+        seen = set()
+        for key in band_keys(signature):
+            for pair in _group_members(self._buckets, key):
+                if pair in seen:
+                    continue
+                seen.add(pair)
+                other_question, other_answer, other_signature = self._features[pair]
+                if (signature_similarity(signature, other_signature) >= NEAR_DUPLICATE_SIMILARITY
+                        and same_numbers(normalized_question, other_question)
+                        and similar_answers(normalized_answer, other_answer)):
+                    return pair
+                checked += 1
+                if checked >= MAX_CANDIDATES:
+                    return None
+        return None
+
+    def _add(self, pair, features=None):
+        if pair in self._counts:
+            self._counts[pair] += 1
+            return
+        features = features or self.features(*pair)
+        normalized_question, normalized_answer, signature = features
+        self._counts[pair] = 1
+        self._features[pair] = features
+        _group_add(self._questions, normalized_question, pair)
+        _group_add(self._answers, normalized_answer, pair)
+        for key in band_keys(signature):
+            _group_add(self._buckets, key, pair)
+
+    def _remove(self, pair):
+        count = self._counts.get(pair)
+        if count is None:
+            return
+        if count > 1:
+            self._counts[pair] = count - 1
+            return
+        del self._counts[pair]
+        normalized_question, normalized_answer, signature = self._features.pop(pair)
+        _group_remove(self._questions, normalized_question, pair)
+        _group_remove(self._answers, normalized_answer, pair)
+        for key in band_keys(signature):
+            _group_remove(self._buckets, key, pair)
+
+
+class NewCardFilter:
+    """Lets through new cards that duplicate neither a deck's cards nor each other, leaving the deck's index alone
+
+    Safe to share between threads, like the parts of an AI expansion.
+    """
+
+    def __init__(self, index, match_answers=False):
+        self.index = index
+        self.match_answers = match_answers
+        self._accepted = DedupIndex()
+        self._lock = threading.Lock()
+        self.skipped = 0
+
+    def accept(self, question, answer):
+        """Whether the card is new; accepted cards count as part of the deck for later checks"""
+        features = DedupIndex.features(question, answer)
+        with self.index._lock:
+            duplicate = self.index._find(features, self.match_answers)
+        with self._lock:
+            if duplicate is None:
+                duplicate = self._accepted._find(features, self.match_answers)
+            if duplicate is not None:
+                self.skipped += 1
+                return False
+            self._accepted._add((question, answer), features)
+            return True
+
+
+class DedupIndexCache(AnswerIndexCache):
+    """LRU of DedupIndex objects, synced with a deck's (question, answer) pairs when its version changes"""
+
+    index_class = DedupIndex
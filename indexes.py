@@ -0,0 +1,126 @@
+# File used for
+#     - declaring every MongoDB index the app's queries depend on
+#     - creating those indexes at startup (safe to run any number of times)
+#     - checking with explain() that none of the hot queries falls back to a collection scan
+#
+# Run `python indexes.py` to create the indexes, or `python indexes.py --check` to also
+# verify the query plans (exits with status 1 if any hot query uses COLLSCAN).
+
+import sys
+
+import pymongo
+from bson.objectid import ObjectId
+
+from search_index import NAME_WEIGHT
+
+# collection -> list of (keys, options)
+INDEXES = {
+    "users": [
+        ([("auth_id", pymongo.ASCENDING)], {"name": "auth_id_unique", "unique": True}),
+    ],
+    "decks": [
+        # Listing a user's decks in creation order (ObjectIds grow with insertion time)
+        ([("user_auth_id", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)], {"name": "user_auth_id_order"}),
+    ],
+    "cards": [
+        # Reading a deck's cards in order, or a page of them; positions are handed out once per deck
+        ([("deck_id", pymongo.ASCENDING), ("position", pymongo.ASCENDING)], {"name": "deck_position_unique", "unique": True}),
+        # Reading or updating a single card
+        ([("deck_id", pymongo.ASCENDING), ("card_id", pymongo.ASCENDING)], {"name": "deck_card_id"}),
+    ],
+    "public_decks": [
+        # Publishing again finds the deck's existing public deck; also stops two publishes creating two
+        ([("owner_auth_id", pymongo.ASCENDING), ("source_deck_id", pymongo.ASCENDING)], {"name": "owner_source_unique", "unique": True}),
+        # Browsing public decks, most recently published first
+        ([("updated_at", pymongo.DESCENDING)], {"name": "updated_at_order"}),
+        # Searching public decks by name and card text; a word in the name counts as three on the cards
+        ([("name", pymongo.TEXT), ("search_text", pymongo.TEXT)],
+         {"name": "public_search", "weights": {"name": NAME_WEIGHT, "search_text": 1}, "default_language": "none"}),
+    ],
+    "public_cards": [
+        # Reading one published version's cards in order
+        ([("public_id", pymongo.ASCENDING), ("version", pymongo.ASCENDING), ("position", pymongo.ASCENDING)],
+         {"name": "public_version_position_unique", "unique": True}),
+    ],
+}
+
+
+def hot_queries():
+    """The queries run on every request, as (collection, filter, projection, sort)"""
+    auth_id = "index-check"
+    deck_id = ObjectId()
+    return [
+        ("users", {"auth_id": auth_id}, {"deck_version": 1}, None),
+        ("decks", {"user_auth_id": auth_id}, None, [("_id", pymongo.ASCENDING)]),
+        ("decks", {"user_auth_id": auth_id}, {"_id": 1}, None),
+        ("decks", {"_id": deck_id, "user_auth_id": auth_id, "flashcards.card_id": "x"}, None, None),
+        ("cards", {"deck_id": deck_id}, None, [("position", pymongo.ASCENDING)]),
+        ("cards", {"deck_id": deck_id, "card_id": "x"}, None, None),
+        ("public_decks", {"version": {"$gte": 1}}, None, [("updated_at", pymongo.DESCENDING)]),
+        ("public_decks", {"$text": {"$search": "index check"}, "version": {"$gte": 1}}, None, None),
+        ("public_cards", {"public_id": deck_id, "version": 1}, None, [("position", pymongo.ASCENDING)]),
+    ]
+
+
+def ensure_indexes(db):
+    """Create any missing indexes; existing identical indexes are left alone"""
+    for collection, specs in INDEXES.items():
+        models = [pymongo.IndexModel(keys, **options) for keys, options in specs]
+        try:
+            db[collection].create_indexes(models)
+        except Exception as ex:
+            # e.g. duplicate auth_ids blocking the unique index; the app still works, just slower
+            print(f"ERROR - Cannot create indexes on {collection}: {ex}")
+            return False
+    return True
+
+
+def plan_stages(plan):
+    """Yield every stage name in an explain() plan tree"""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from plan_stages(item)
+
+
+def check_query_plans(db):
+    """Return a description of every hot query whose winning plan scans a whole collection"""
+    problems = []
+    for collection, query, projection, sort in hot_queries():
+        cursor = db[collection].find(query, projection)
+        if sort:
+            cursor = cursor.sort(sort)
+        winning_plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        if "COLLSCAN" in set(plan_stages(winning_plan)):
+            problems.append(f"{collection}.find({query}) sort={sort} uses COLLSCAN")
+    return problems
+
+
+if __name__ == "__main__":
+    try:
+        mongo = pymongo.MongoClient(
+            host='localhost',
+            port=27017,
+            serverSelectionTimeoutMS = 1000
+        )
+        db = mongo.studystack
+        mongo.server_info() # Triggers the exception if connection to the database is unsuccessful
+    except Exception as ex:
+        print(f"ERROR - Cannot connect to MongoDB: {ex}")
+        sys.exit(2)
+
+    if not ensure_indexes(db):
+        sys.exit(1)
+    print("Indexes are in place")
+
+    if "--check" in sys.argv[1:]:
+        problems = check_query_plans(db)
+        for problem in problems:
+            print(f"ERROR - {problem}")
+        if problems:
+            sys.exit(1)
+        print("All hot queries use an index")
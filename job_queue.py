@@ -0,0 +1,190 @@
+# File used for
+#     - running slow work (like AI deck expansion) on background threads instead of in the web request
+#     - handing out a job ID right away and keeping each job's status and result around for polling
+#     - bounding how much work can pile up, and counting queue depth, run times and failures
+
+import queue
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+
+# How many recent run / wait times the percentiles in stats() are computed from
+RECENT_TIMINGS = 200
+
+
+class QueueFull(Exception):
+    """Raised by JobQueue.submit when as many jobs are waiting as the queue allows"""
+
+
+class Job:
+    """One piece of background work and what became of it"""
+
+    __slots__ = ('job_id', 'owner', 'kind', 'status', 'result', 'error',
+                 'created_at', 'started_at', 'finished_at', 'function', 'args', 'kwargs')
+
+    def __init__(self, job_id, owner, kind, function, args, kwargs):
+        self.job_id = job_id
+        self.owner = owner
+        self.kind = kind
+        self.status = 'queued'   # queued -> running -> done | failed
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed')
+
+    def to_dict(self):
+        """What a client polling for the job gets to see"""
+        return {
+            'job_id': self.job_id,
+            'kind': self.kind,
+            'status': self.status,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+def percentile(sorted_values, fraction):
+    """The value below which the given fraction of sorted_values lies (0.0 if there are none)"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class JobQueue:
+    """A bounded queue of jobs worked off by a fixed number of daemon threads
+
+    Threads start with the first submitted job. Finished jobs are kept for polling until
+    there are more than keep_finished of them or they are older than keep_seconds.
+    """
+
+    def __init__(self, workers=2, max_queued=20, keep_finished=1000, keep_seconds=3600):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.keep_finished = keep_finished
+        self.keep_seconds = keep_seconds
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._jobs = OrderedDict()  # job_id -> Job, oldest first
+        self._lock = threading.Lock()
+        self._threads = []
+        self._running = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self._run_times = deque(maxlen=RECENT_TIMINGS)
+        self._wait_times = deque(maxlen=RECENT_TIMINGS)
+
+    def submit(self, function, *args, owner=None, kind=None, **kwargs):
+        """Queue function(*args, **kwargs) and return the new job's ID, or raise QueueFull"""
+        job = Job(secrets.token_hex(8), owner, kind or function.__name__, function, args, kwargs)
+        self._start_workers()
+        with self._lock:
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                self.rejected += 1
+                raise QueueFull(f"{self.max_queued} jobs are already waiting")
+            self._jobs[job.job_id] = job
+            self.submitted += 1
+            self._forget_old_jobs()
+        return job.job_id
+
+    def get(self, job_id, owner=None):
+        """The job with this ID, or None if there is none (or it belongs to someone else)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or (owner is not None and job.owner != owner):
+            return None
+        return job
+
+    def wait(self, job_id, timeout=None):
+        """Block until the job has finished or timeout seconds have passed; returns the job"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        job = self.get(job_id)
+        while job is not None and not job.finished:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            time.sleep(0.05)
+        return job
+
+    def _start_workers(self):
+        with self._lock:
+            if self._threads:
+                return
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"job-worker-{number}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                self._running += 1
+            job.started_at = time.time()
+            job.status = 'running'
+            try:
+                job.result = job.function(*job.args, **job.kwargs)
+                job.status = 'done'
+            except Exception as ex:
+                print(f"Error running {job.kind} job {job.job_id}: {ex}")
+                job.error = str(ex) or ex.__class__.__name__
+                job.status = 'failed'
+            job.finished_at = time.time()
+            # The job's arguments may hold whole decks; they aren't needed for polling
+            job.function = job.args = job.kwargs = None
+            with self._lock:
+                self._running -= 1
+                if job.status == 'done':
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                self._run_times.append(job.finished_at - job.started_at)
+                self._wait_times.append(job.started_at - job.created_at)
+            self._queue.task_done()
+
+    def _forget_old_jobs(self):
+        """Drop the oldest finished jobs beyond the retention limits (call with the lock held)"""
+        cutoff = time.time() - self.keep_seconds
+        finished = [job for job in self._jobs.values() if job.finished]
+        excess = len(finished) - self.keep_finished
+        for job in finished:
+            if excess <= 0 and job.finished_at >= cutoff:
+                break
+            del self._jobs[job.job_id]
+            excess -= 1
+
+    def stats(self):
+        """Counters for monitoring the queue: depth, outcomes and recent timings in seconds"""
+        with self._lock:
+            run_times = sorted(self._run_times)
+            wait_times = sorted(self._wait_times)
+            finished = self.completed + self.failed
+            return {
+                "workers": self.workers,
+                "max_queued": self.max_queued,
+                "queued": self._queue.qsize(),
+                "running": self._running,
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "completed": self.completed,
+                "failed": self.failed,
+                "failure_rate": self.failed / finished if finished else 0.0,
+                "run_seconds_p50": percentile(run_times, 0.5),
+                "run_seconds_p95": percentile(run_times, 0.95),
+                "run_seconds_max": run_times[-1] if run_times else 0.0,
+                "wait_seconds_p50": percentile(wait_times, 0.5),
+                "wait_seconds_p95": percentile(wait_times, 0.95),
+            }
@@ -0,0 +1,170 @@
+# File used for
+#     - moving the cards embedded in older deck documents into the cards collection, one document per card
+#     - doing it online: decks stay usable throughout, and a deck whose cards change mid-copy is copied again
+#     - working through decks in batches with a checkpoint saved after each, so a stopped run resumes where it left off
+#
+# Run `python migrate_cards.py` to migrate every deck with embedded cards. Options:
+#     --batch-size N    decks per batch (default 100)
+#     --max-batches N   stop after N batches; the next run carries on from the checkpoint
+#     --restart         ignore the checkpoint and look at every deck again (e.g. to retry skipped decks)
+#     --status          print the checkpoint and how many decks still embed their cards, then exit
+
+import argparse
+import datetime
+import os
+import sys
+
+import pymongo
+
+from datacompression import new_card_id
+from indexes import ensure_indexes
+from mongo_deck_store import EMBEDDED, SEPARATE_CARDS
+
+MIGRATION_ID = "separate_cards"
+
+# Cards sent per insert_many while copying one deck
+CARD_INSERT_BATCH = 1000
+
+# Times a deck is copied again when its cards keep changing during the copy
+MAX_ATTEMPTS = 3
+
+
+def load_checkpoint(db):
+    """Where the last run stopped, and what it did so far"""
+    checkpoint = db.migrations.find_one({"_id": MIGRATION_ID})
+    if checkpoint is None:
+        checkpoint = {"_id": MIGRATION_ID, "last_deck_id": None, "migrated": 0, "cards": 0, "retried": 0, "skipped": 0, "done": False}
+    return checkpoint
+
+
+def save_checkpoint(db, checkpoint):
+    checkpoint["updated_at"] = datetime.datetime.utcnow()
+    db.migrations.replace_one({"_id": MIGRATION_ID}, checkpoint, upsert=True)
+
+
+def migrate_deck(db, deck_data):
+    """Copy one deck's embedded cards into the cards collection, then switch the deck over to them
+
+    Returns True once the deck reads its cards from the cards collection, and False if its cards
+    changed (or the deck was deleted) while they were being copied; the copies are removed then.
+    """
+    deck_object_id = deck_data['_id']
+    card_documents = deck_data.get('flashcards') or []
+
+    # Copies left by an interrupted attempt; nothing reads them while the deck still embeds its cards
+    db.cards.delete_many({"deck_id": deck_object_id})
+
+    rows = []
+    for position, card_data in enumerate(card_documents):
+        row = dict(card_data)
+        # Cards saved before card IDs existed only got one when their deck was loaded; give them one for good now
+        row['card_id'] = card_data.get('card_id') or new_card_id()
+        row.setdefault('correct_answers', 0)
+        row.setdefault('reversible', False)
+        row['deck_id'] = deck_object_id
+        row['position'] = position
+        rows.append(row)
+    for start in range(0, len(rows), CARD_INSERT_BATCH):
+        db.cards.insert_many(rows[start:start + CARD_INSERT_BATCH], ordered=False)
+
+    # Every write to embedded cards bumps card_revision, so this only matches if nothing changed meanwhile
+    result = db.decks.update_one(
+        {"_id": deck_object_id, "card_revision": deck_data.get('card_revision'), **EMBEDDED},
+        {
+            "$set": {"card_layout": SEPARATE_CARDS, "card_count": len(rows), "next_position": len(rows)},
+            "$unset": {"flashcards": "", "card_revision": ""}
+        }
+    )
+    if result.modified_count != 1:
+        db.cards.delete_many({"deck_id": deck_object_id})
+        return False
+    # Workers holding the deck in their caches reload it
+    db.users.update_one({"auth_id": deck_data.get('user_auth_id')}, {"$inc": {"deck_version": 1}})
+    return True
+
+
+def assign_missing_card_ids(db):
+    """Give an ID to copied cards that have none (left by runs before migrate_deck assigned them); how many were fixed"""
+    fixed = 0
+    deck_ids = set()
+    for card_data in db.cards.find({"card_id": {"$in": [None, ""]}}, {"deck_id": 1}):
+        result = db.cards.update_one({"_id": card_data['_id'], "card_id": {"$in": [None, ""]}}, {"$set": {"card_id": new_card_id()}})
+        fixed += result.modified_count
+        deck_ids.add(card_data['deck_id'])
+    # Workers holding these decks in their caches reload them
+    for auth_id in db.decks.distinct("user_auth_id", {"_id": {"$in": list(deck_ids)}}):
+        db.users.update_one({"auth_id": auth_id}, {"$inc": {"deck_version": 1}})
+    return fixed
+
+
+def migrate_decks(db, batch_size=100, max_batches=None, restart=False):
+    """Migrate decks in _id order, a batch at a time, saving the checkpoint after each batch"""
+    checkpoint = load_checkpoint(db)
+    if restart:
+        checkpoint.update(last_deck_id=None, done=False)
+
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        deck_filter = dict(EMBEDDED)
+        if checkpoint['last_deck_id'] is not None:
+            deck_filter["_id"] = {"$gt": checkpoint['last_deck_id']}
+        batch = list(db.decks.find(deck_filter).sort("_id", pymongo.ASCENDING).limit(batch_size))
+        if not batch:
+            fixed = assign_missing_card_ids(db)
+            if fixed:
+                print(f"Gave IDs to {fixed} copied cards that had none")
+            checkpoint['done'] = True
+            save_checkpoint(db, checkpoint)
+            break
+
+        for deck_data in batch:
+            for attempt in range(MAX_ATTEMPTS):
+                if attempt:
+                    checkpoint['retried'] += 1
+                    deck_data = db.decks.find_one({"_id": deck_data['_id'], **EMBEDDED})
+                    if deck_data is None:
+                        break  # deleted, or migrated by another run
+                if migrate_deck(db, deck_data):
+                    checkpoint['migrated'] += 1
+                    checkpoint['cards'] += len(deck_data.get('flashcards') or [])
+                    break
+            else:
+                checkpoint['skipped'] += 1
+                print(f"Skipped deck {deck_data['_id']}: its cards kept changing; run again with --restart to retry")
+
+        checkpoint['last_deck_id'] = batch[-1]['_id']
+        save_checkpoint(db, checkpoint)
+        batches += 1
+        print(f"Migrated {checkpoint['migrated']} decks ({checkpoint['cards']} cards), up to deck {checkpoint['last_deck_id']}")
+    return checkpoint
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move embedded deck cards into the cards collection")
+    parser.add_argument("--mongo-uri", default=os.environ.get("MONGO_URI", "mongodb://localhost:27017/"))
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--max-batches", type=int, default=None)
+    parser.add_argument("--restart", action="store_true")
+    parser.add_argument("--status", action="store_true")
+    options = parser.parse_args()
+
+    try:
+        mongo = pymongo.MongoClient(options.mongo_uri, serverSelectionTimeoutMS=1000)
+        db = mongo.studystack
+        mongo.server_info() # Triggers the exception if connection to the database is unsuccessful
+    except Exception as ex:
+        print(f"ERROR - Cannot connect to MongoDB: {ex}")
+        sys.exit(2)
+
+    if options.status:
+        print(load_checkpoint(db))
+        print(f"{db.decks.count_documents(EMBEDDED)} decks still embed their cards")
+        sys.exit(0)
+
+    # The cards collection's indexes must exist before decks start reading from it
+    if not ensure_indexes(db):
+        sys.exit(1)
+    checkpoint = migrate_decks(db, options.batch_size, options.max_batches, options.restart)
+    if checkpoint['done']:
+        print("Every deck reads its cards from the cards collection" if not checkpoint['skipped']
+              else f"Done, but {checkpoint['skipped']} decks were skipped")
@@ -0,0 +1,876 @@
+# File used for
+#     - storing users and decks in MongoDB
+#     - keeping cards either embedded in their deck's document (older decks) or one document per card in
+#       the cards collection (new and migrated decks), so big decks stay clear of the 16 MB document limit
+#     - sending only what changed in a deck (bulk writes, $push/$pull, array filters, single-card updates)
+#     - public decks: each published version's cards in the public_cards collection, and subscribed decks that
+#       keep only their overlay (progress and local edits) in the deck document
+#     - searching public decks through a text index over their names and latest cards
+#     - bumping each user's deck_version so every worker process notices changes
+
+import datetime
+
+import pymongo
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument
+
+from datacompression import DeckSummary, new_card_id
+from deck_store import (DEFAULT_COLUMNAR_THRESHOLD, EDITABLE_FIELDS, DeckChanges, DeckList, DeckStore, PublicCards,
+                        build_deck, card_from_document, card_to_document, empty_overlay, merge_overlay, new_deck_id,
+                        overlay_card_count, take_deck_snapshot)
+from indexes import ensure_indexes
+from search_index import deck_search_text, search_words
+
+# Decks with card_layout set to this keep their cards in the cards collection; decks without it embed them
+SEPARATE_CARDS = "separate"
+SEPARATE = {"card_layout": SEPARATE_CARDS}
+EMBEDDED = {"card_layout": {"$exists": False}}
+
+# Decks subscribed to a public deck have no cards of their own, just a source version and an overlay
+SUBSCRIPTION_CARDS = "subscription"
+SUBSCRIBED = {"card_layout": SUBSCRIPTION_CARDS}
+
+# What a subscribed deck's reads and writes need from its document
+SUBSCRIPTION_FIELDS = {"card_layout": 1, "source": 1, "overlay": 1}
+
+# Public deck reads leave out the card text kept only for the text index
+PUBLIC_DECK_FIELDS = {"search_text": 0}
+
+# What a read needs from a card document (cards also carry deck_id and position)
+CARD_FIELDS = {"_id": 0, "card_id": 1, "question": 1, "answer": 1, "correct_answers": 1, "reversible": 1}
+
+# Works for both layouts: separate decks keep a counter, embedded ones count their array
+CARD_COUNT = {"$ifNull": ["$card_count", {"$size": {"$ifNull": ["$flashcards", []]}}]}
+
+
+def card_row_document(deck_object_id, position, card):
+    """A card as its own document in the cards collection"""
+    document = card_to_document(card)
+    document['deck_id'] = deck_object_id
+    document['position'] = position
+    return document
+
+
+def is_separate(deck_data):
+    return deck_data.get('card_layout') == SEPARATE_CARDS
+
+
+def is_subscription(deck_data):
+    return deck_data.get('card_layout') == SUBSCRIPTION_CARDS
+
+
+def public_deck_from_document(public_data):
+    """A public_decks document in the shape DeckStore.get_public_deck returns"""
+    return {
+        "public_id": str(public_data['_id']),
+        "owner_auth_id": public_data['owner_auth_id'],
+        "source_deck_id": public_data['source_deck_id'],
+        "name": public_data['name'],
+        "version": public_data['version'],
+        "card_count": public_data['card_count'],
+        "subscriptions": public_data.get('subscriptions', 0),
+        "created_at": public_data.get('created_at'),
+        "updated_at": public_data.get('updated_at'),
+    }
+
+
+def deck_update_operations(auth_id, deck):
+    """Build the bulk write operations that bring a stored deck with embedded cards up to date with its in-memory copy"""
+    changes = DeckChanges(deck)
+    deck_filter = {"_id": ObjectId(deck._id), "user_auth_id": auth_id, **EMBEDDED}
+    operations = []
+
+    # card_revision tells the card migration that the embedded cards changed while it was copying them
+    update = {'$inc': {'card_revision': 1}}
+    set_fields = {}
+    array_filters = []
+    if changes.name is not None:
+        set_fields['name'] = changes.name
+    if changes.experience_delta:
+        # Increment by the delta so concurrent atomic progress updates are not overwritten
+        update['$inc']['experience'] = changes.experience_delta
+
+    if changes.reordered:
+        # $push/$pull cannot express a new order
+        set_fields['flashcards'] = [card_to_document(card) for card in deck.flashcards]
+    for card in changes.changed_cards:
+        name = f"c{len(array_filters)}"
+        set_fields[f"flashcards.$[{name}]"] = card_to_document(card)
+        array_filters.append({f"{name}.card_id": card.card_id})
+
+    if changes:
+        set_fields['updated_at'] = datetime.datetime.utcnow()
+        update['$set'] = set_fields
+        operations.append(pymongo.UpdateOne(deck_filter, update, array_filters=array_filters or None))
+    if changes.removed_ids:
+        operations.append(pymongo.UpdateOne(deck_filter, {"$pull": {"flashcards": {"card_id": {"$in": changes.removed_ids}}}}))
+    if changes.added_cards:
+        operations.append(pymongo.UpdateOne(deck_filter, {"$push": {"flashcards": {"$each": [card_to_document(card) for card in changes.added_cards]}}}))
+    return operations
+
+
+class MongoDeckStore(DeckStore):
+    """Decks as MongoDB documents, with their cards embedded or in the cards collection; shared by every worker"""
+
+    backend = "mongo"
+
+    def __init__(self, db, columnar_threshold=DEFAULT_COLUMNAR_THRESHOLD):
+        super().__init__(columnar_threshold)
+        self.db = db
+
+    @classmethod
+    def connect(cls, uri, columnar_threshold=DEFAULT_COLUMNAR_THRESHOLD):
+        """Connect and create the indexes; raises if the server does not answer within a second"""
+        mongo = pymongo.MongoClient(uri, serverSelectionTimeoutMS=1000)
+        mongo.server_info()  # Triggers the exception if connection to the database is unsuccessful
+        db = mongo.get_database("studystack")
+        ensure_indexes(db)
+        return cls(db, columnar_threshold)
+
+    def _bump(self, auth_id):
+        self.db.users.update_one({"auth_id": auth_id}, {"$inc": {"deck_version": 1}})
+
+    def _separate_cards(self, deck_object_id):
+        return self.db.cards.find({"deck_id": deck_object_id}, CARD_FIELDS).sort("position", pymongo.ASCENDING)
+
+    def _source_cards(self, deck_data):
+        source = deck_data['source']
+        return self.get_public_cards(source['public_id'], source['version']) or PublicCards(())
+
+    def _subscription_cards(self, deck_data):
+        return merge_overlay(self._source_cards(deck_data), deck_data['overlay'])
+
+    def _deck_from_document(self, deck_data, card_documents=None):
+        if is_subscription(deck_data):
+            card_documents = self._subscription_cards(deck_data)
+        elif is_separate(deck_data):
+            if card_documents is None:
+                card_documents = list(self._separate_cards(deck_data['_id']))
+        else:
+            card_documents = deck_data.get('flashcards', [])
+
+            # Cards saved before card IDs existed get one assigned once, in place
+            missing_ids = {}
+            for position, card_data in enumerate(card_documents):
+                if not card_data.get('card_id'):
+                    card_data['card_id'] = new_card_id()
+                    missing_ids[f"flashcards.{position}.card_id"] = card_data['card_id']
+            if missing_ids:
+                self.db.decks.update_one({"_id": deck_data['_id'], **EMBEDDED}, {"$set": missing_ids, "$inc": {"card_revision": 1}})
+
+        return build_deck(str(deck_data.get('_id', '')), deck_data['name'], deck_data.get('experience', 0),
+                          card_documents, self.columnar_threshold)
+
+    def upsert_user(self, auth_id, email, name=None, picture=None):
+        try:
+            # Check if user already exists
+            existing_user = self.db.users.find_one({"auth_id": auth_id}, {"_id": 1})
+
+            user_data = {
+                "auth_id": auth_id,
+                "email": email,
+                "name": name,
+                "picture": picture,
+                "last_login": datetime.datetime.utcnow()
+            }
+
+            if existing_user:
+                # Update existing user
+                self.db.users.update_one({"auth_id": auth_id}, {"$set": user_data})
+                print(f"Updated existing user: {email}")
+            else:
+                # Create new user
+                user_data["created_at"] = datetime.datetime.utcnow()
+                self.db.users.insert_one(user_data)
+                print(f"Created new user: {email}")
+            return True
+        except Exception as ex:
+            print(f"Error creating/updating user: {ex}")
+            return False
+
+    def get_user(self, auth_id):
+        try:
+            return self.db.users.find_one({"auth_id": auth_id})
+        except Exception as ex:
+            print(f"Error getting user: {ex}")
+            return None
+
+    def get_deck_version(self, auth_id):
+        try:
+            user = self.db.users.find_one({"auth_id": auth_id}, {"deck_version": 1})
+        except Exception as ex:
+            print(f"Error getting deck version from MongoDB: {ex}")
+            return None
+        return user.get('deck_version', 0) if user else None
+
+    def load_decks(self, auth_id):
+        try:
+            decks_data = list(self.db.decks.find({"user_auth_id": auth_id}).sort("_id", pymongo.ASCENDING))
+
+            # The cards of every separate deck come back in one query, grouped by deck
+            separate_ids = [deck_data['_id'] for deck_data in decks_data if is_separate(deck_data)]
+            cards_by_deck = {deck_object_id: [] for deck_object_id in separate_ids}
+            if separate_ids:
+                cards = self.db.cards.find({"deck_id": {"$in": separate_ids}}, {**CARD_FIELDS, "deck_id": 1})
+                for card_data in cards.sort([("deck_id", pymongo.ASCENDING), ("position", pymongo.ASCENDING)]):
+                    cards_by_deck[card_data.pop('deck_id')].append(card_data)
+
+            decks = DeckList(self._deck_from_document(deck_data, cards_by_deck.get(deck_data['_id'])) for deck_data in decks_data)
+            decks.loaded_ids = {deck._id for deck in decks}
+            return decks
+        except Exception as ex:
+            print(f"Error getting decks from MongoDB: {ex}")
+            return DeckList()
+
+    def load_deck(self, auth_id, deck_id):
+        try:
+            deck_data = self.db.decks.find_one({"_id": ObjectId(deck_id), "user_auth_id": auth_id})
+            return self._deck_from_document(deck_data) if deck_data else None
+        except Exception as ex:
+            print(f"Error getting deck from MongoDB: {ex}")
+            return None
+
+    def get_card(self, auth_id, deck_id, card_id):
+        try:
+            deck_data = self.db.decks.find_one(
+                {"_id": ObjectId(deck_id), "user_auth_id": auth_id},
+                {**SUBSCRIPTION_FIELDS, "flashcards": {"$elemMatch": {"card_id": card_id}}}
+            )
+            if not deck_data:
+                return None
+            if is_subscription(deck_data):
+                card_data = next((card_data for card_data in self._subscription_cards(deck_data) if card_data['card_id'] == card_id), None)
+            elif is_separate(deck_data):
+                card_data = self.db.cards.find_one({"deck_id": deck_data['_id'], "card_id": card_id}, CARD_FIELDS)
+            else:
+                card_data = (deck_data.get('flashcards') or [None])[0]
+            return card_from_document(card_data) if card_data else None
+        except Exception as ex:
+            print(f"Error getting card from MongoDB: {ex}")
+            return None
+
+    def get_card_id(self, auth_id, deck_id, card_index):
+        try:
+            deck_data = self.db.decks.find_one(
+                {"_id": ObjectId(deck_id), "user_auth_id": auth_id},
+                {**SUBSCRIPTION_FIELDS, "flashcards": {"$slice": [card_index, 1]}}
+            )
+            if not deck_data:
+                return None
+            if is_subscription(deck_data):
+                cards = self._subscription_cards(deck_data)[card_index:card_index + 1] if card_index >= 0 else []
+            elif is_separate(deck_data):
+                cards = list(self.db.cards.find({"deck_id": deck_data['_id']}, {"_id": 0, "card_id": 1})
+                             .sort("position", pymongo.ASCENDING).skip(card_index).limit(1))
+            else:
+                cards = deck_data.get('flashcards') or []
+            return cards[0].get('card_id') if cards else None
+        except Exception as ex:
+            print(f"Error getting card from MongoDB: {ex}")
+            return None
+
+    def get_deck_page(self, auth_id, deck_id, offset, limit):
+        try:
+            pipeline = [
+                {"$match": {"_id": ObjectId(deck_id), "user_auth_id": auth_id}},
+                {"$project": {
+                    "name": 1,
+                    "experience": 1,
+                    "card_layout": 1,
+                    "source": 1,
+                    "overlay": 1,
+                    "card_count": CARD_COUNT,
+                    "flashcards": {"$slice": [{"$ifNull": ["$flashcards", []]}, offset, limit]}
+                }}
+            ]
+            for deck_data in self.db.decks.aggregate(pipeline):
+                summary = DeckSummary(deck_data['name'], deck_data['card_count'], deck_data.get('experience', 0), deck_id)
+                if is_subscription(deck_data):
+                    card_documents = self._subscription_cards(deck_data)[offset:offset + limit]
+                elif is_separate(deck_data):
+                    # A range read over the (deck_id, position) index
+                    card_documents = self._separate_cards(deck_data['_id']).skip(offset).limit(limit)
+                else:
+                    card_documents = deck_data['flashcards']
+                return summary, [card_from_document(card_data) for card_data in card_documents]
+            return None, []
+        except Exception as ex:
+            print(f"Error getting deck page from MongoDB: {ex}")
+            return None, []
+
+    def get_deck_summaries(self, auth_id):
+        try:
+            pipeline = [
+                {"$match": {"user_auth_id": auth_id}},
+                {"$sort": {"_id": pymongo.ASCENDING}},
+                {"$project": {
+                    "name": 1,
+                    "experience": 1,
+                    "card_count": CARD_COUNT
+                }}
+            ]
+            return [
+                DeckSummary(deck_data['name'], deck_data['card_count'], deck_data.get('experience', 0), str(deck_data['_id']))
+                for deck_data in self.db.decks.aggregate(pipeline)
+            ]
+        except Exception as ex:
+            print(f"Error getting deck summaries from MongoDB: {ex}")
+            return []
+
+    def save_decks(self, auth_id, decks):
+        try:
+            loaded_ids = getattr(decks, 'loaded_ids', None)
+            if loaded_ids is None:
+                # Plain lists don't know what was loaded, so ask the database
+                existing_decks = self.db.decks.find({"user_auth_id": auth_id}, {"_id": 1})
+                loaded_ids = {str(deck["_id"]) for deck in existing_decks}
+
+            updated_decks = []
+            new_decks = []
+            kept_ids = set()
+            for deck in decks:
+                if getattr(deck, '_id', None) in loaded_ids and hasattr(deck, '_snapshot'):
+                    kept_ids.add(deck._id)
+                    updated_decks.append(deck)
+                else:
+                    new_decks.append(deck)
+
+            operations = []
+            separate_decks = []
+            subscribed_decks = []
+            if updated_decks:
+                # Ask the database rather than the deck: the card migration may have moved it since it was loaded
+                stored_decks = {
+                    str(deck_data['_id']): deck_data
+                    for deck_data in self.db.decks.find({"_id": {"$in": [ObjectId(deck._id) for deck in updated_decks]}},
+                                                        {"card_layout": 1, "source": 1, "overlay.added.card_id": 1})
+                }
+                for deck in updated_decks:
+                    deck_data = stored_decks.get(deck._id, {})
+                    if is_separate(deck_data):
+                        separate_decks.append(deck)
+                    elif is_subscription(deck_data):
+                        subscribed_decks.append((deck, deck_data))
+                    else:
+                        operations.extend(deck_update_operations(auth_id, deck))
+
+            if new_decks:
+                # Only inserts need the user's document
+                user = self.db.users.find_one({"auth_id": auth_id}, {"_id": 1})
+                if not user:
+                    print(f"Cannot save decks: User with auth_id {auth_id} not found")
+                    return False
+                now = datetime.datetime.utcnow()
+                for deck in new_decks:
+                    # IDs are assigned client-side because bulk_write doesn't report inserted IDs
+                    deck._id = new_deck_id()
+                    deck_object_id = ObjectId(deck._id)
+                    # Cards go in first: until the deck exists nothing reads them
+                    self._insert_cards(deck_object_id, 0, deck.flashcards)
+                    operations.append(pymongo.InsertOne({
+                        '_id': deck_object_id,
+                        'user_auth_id': auth_id,
+                        'user_object_id': user['_id'],
+                        'name': deck.name,
+                        'experience': deck.experience,
+                        'card_layout': SEPARATE_CARDS,
+                        'card_count': len(deck.flashcards),
+                        'next_position': len(deck.flashcards),
+                        'created_at': now,
+                        'updated_at': now
+                    }))
+                    kept_ids.add(deck._id)
+
+            # Remove decks that are no longer in the list
+            decks_to_delete = [ObjectId(deck_id) for deck_id in loaded_ids if deck_id not in kept_ids]
+            if decks_to_delete:
+                operations.append(pymongo.DeleteMany({"_id": {"$in": decks_to_delete}, "user_auth_id": auth_id}))
+
+            if not operations and not any(DeckChanges(deck) for deck in separate_decks + [deck for deck, _ in subscribed_decks]):
+                return True
+
+            try:
+                if operations:
+                    self.db.decks.bulk_write(operations, ordered=True)
+                for deck in separate_decks:
+                    self._update_separate_deck(auth_id, deck)
+                for deck, deck_data in subscribed_decks:
+                    self._update_subscribed_deck(auth_id, deck, deck_data)
+                if decks_to_delete:
+                    # Only after the decks are gone, so no deck is ever left without its cards
+                    self.db.cards.delete_many({"deck_id": {"$in": decks_to_delete}})
+            finally:
+                # Even a partial failure may have changed some decks
+                self._bump(auth_id)
+            for deck in decks:
+                take_deck_snapshot(deck)
+            if isinstance(decks, DeckList):
+                decks.loaded_ids = kept_ids
+            return True
+        except Exception as ex:
+            print(f"Error saving decks to MongoDB: {ex}")
+            return False
+
+    def _insert_cards(self, deck_object_id, first_position, cards):
+        if cards:
+            self.db.cards.insert_many(
+                [card_row_document(deck_object_id, first_position + offset, card) for offset, card in enumerate(cards)],
+                ordered=False
+            )
+
+    def _reserve_positions(self, auth_id, deck_object_id, count, update=None):
+        """Claim count positions at the end of a separate deck; the first one, or None if there is no such deck"""
+        update = update or {"$set": {"updated_at": datetime.datetime.utcnow()}}
+        if count:
+            update.setdefault("$inc", {}).update({"next_position": count, "card_count": count})
+        deck_data = self.db.decks.find_one_and_update(
+            {"_id": deck_object_id, "user_auth_id": auth_id, **SEPARATE},
+            update,
+            projection={"next_position": 1}
+        )
+        return deck_data.get('next_position', 0) if deck_data is not None else None
+
+    def _update_separate_deck(self, auth_id, deck):
+        """Write what changed in a deck whose cards are in the cards collection, touching only those cards"""
+        changes = DeckChanges(deck)
+        if not changes:
+            return
+        deck_object_id = ObjectId(deck._id)
+        update = {"$set": {"updated_at": datetime.datetime.utcnow()}}
+        if changes.name is not None:
+            update["$set"]["name"] = changes.name
+        if changes.experience_delta:
+            update["$inc"] = {"experience": changes.experience_delta}
+        new_cards = deck.flashcards if changes.reordered else changes.added_cards
+
+        first_position = self._reserve_positions(auth_id, deck_object_id, len(new_cards), update)
+        if first_position is None:
+            return
+        self._insert_cards(deck_object_id, first_position, new_cards)
+
+        if changes.reordered:
+            # The whole deck was written again after the old cards, which can now go
+            removed = self.db.cards.delete_many({"deck_id": deck_object_id, "position": {"$lt": first_position}}).deleted_count
+        else:
+            removed = 0
+            if changes.removed_ids:
+                removed = self.db.cards.delete_many({"deck_id": deck_object_id, "card_id": {"$in": changes.removed_ids}}).deleted_count
+            if changes.changed_cards:
+                self.db.cards.bulk_write([
+                    pymongo.UpdateOne({"deck_id": deck_object_id, "card_id": card.card_id}, {"$set": card_to_document(card)})
+                    for card in changes.changed_cards
+                ], ordered=False)
+        if removed:
+            self.db.decks.update_one({"_id": deck_object_id}, {"$inc": {"card_count": -removed}})
+
+    def _update_overlay(self, auth_id, deck_object_id, updates, condition=None):
+        """Apply (update, array_filters) pairs to a subscribed deck in order, then recount its cards
+
+        False if the user has no such subscribed deck, or it does not match condition. Each update is
+        atomic on its own, so progress recorded by other workers in between is kept.
+        """
+        deck_data = None
+        for update, array_filters in updates:
+            update.setdefault("$set", {})["updated_at"] = datetime.datetime.utcnow()
+            deck_data = self.db.decks.find_one_and_update(
+                {"_id": deck_object_id, "user_auth_id": auth_id, **SUBSCRIBED, **(condition or {})},
+                update,
+                projection={"source": 1, "overlay": 1},
+                array_filters=array_filters,
+                return_document=ReturnDocument.AFTER
+            )
+            if deck_data is None:
+                return False
+        if deck_data is not None:
+            card_count = overlay_card_count(self._source_cards(deck_data), deck_data['overlay'])
+            self.db.decks.update_one({"_id": deck_object_id}, {"$set": {"card_count": card_count}})
+        return True
+
+    def _update_subscribed_deck(self, auth_id, deck, deck_data):
+        """Write what changed in a subscribed deck into its overlay, or turn it into a deck of its own if it was reordered"""
+        changes = DeckChanges(deck)
+        if not changes:
+            return
+        deck_object_id = ObjectId(deck._id)
+        first = {"$set": {}}
+        if changes.name is not None:
+            first["$set"]["name"] = changes.name
+        if changes.experience_delta:
+            first["$inc"] = {"experience": changes.experience_delta}
+
+        if changes.reordered:
+            # An overlay can't reorder public cards, so the deck becomes a copy of its own
+            self._insert_cards(deck_object_id, 0, deck.flashcards)
+            first["$set"].update(card_layout=SEPARATE_CARDS, card_count=len(deck.flashcards), next_position=len(deck.flashcards),
+                                 updated_at=datetime.datetime.utcnow())
+            first["$unset"] = {"source": "", "overlay": ""}
+            result = self.db.decks.update_one({"_id": deck_object_id, "user_auth_id": auth_id, **SUBSCRIBED}, first)
+            if result.matched_count != 1:
+                self.db.cards.delete_many({"deck_id": deck_object_id})
+            return
+
+        public_cards = self._source_cards(deck_data)
+        added_ids = {card_data['card_id'] for card_data in deck_data.get('overlay', {}).get('added', [])}
+        unset_fields = {}
+        array_filters = []
+        for card in changes.changed_cards:
+            document = card_to_document(card)
+            public_card = public_cards.by_id.get(card.card_id)
+            if public_card is None:
+                if card.card_id in added_ids:
+                    name = f"a{len(array_filters)}"
+                    first["$set"][f"overlay.added.$[{name}]"] = document
+                    array_filters.append({f"{name}.card_id": card.card_id})
+                continue
+            edit = {field: document[field] for field in EDITABLE_FIELDS if document[field] != public_card[field]}
+            if edit:
+                first["$set"][f"overlay.edits.{card.card_id}"] = edit
+            else:
+                unset_fields[f"overlay.edits.{card.card_id}"] = ""
+            if card.correct_answers:
+                first["$set"][f"overlay.progress.{card.card_id}"] = card.correct_answers
+            else:
+                unset_fields[f"overlay.progress.{card.card_id}"] = ""
+
+        removed_public = [card_id for card_id in changes.removed_ids if card_id in public_cards.by_id]
+        if removed_public:
+            first["$addToSet"] = {"overlay.removed": {"$each": removed_public}}
+            for card_id in removed_public:
+                unset_fields[f"overlay.edits.{card_id}"] = ""
+                unset_fields[f"overlay.progress.{card_id}"] = ""
+        if unset_fields:
+            first["$unset"] = unset_fields
+
+        # $pull and $push on the same array can't share an update
+        updates = [(first, array_filters or None)]
+        removed_added = [card_id for card_id in changes.removed_ids if card_id not in public_cards.by_id]
+        if removed_added:
+            updates.append(({"$pull": {"overlay.added": {"card_id": {"$in": removed_added}}}}, None))
+        if changes.added_cards:
+            updates.append(({"$push": {"overlay.added": {"$each": [card_to_document(card) for card in changes.added_cards]}}}, None))
+        self._update_overlay(auth_id, deck_object_id, updates)
+
+    def _record_subscribed(self, auth_id, deck_data, correct_counts):
+        """Add correct answers to a subscribed deck's overlay and those to its cards to its experience; how many answers went to cards it has"""
+        public_cards = self._source_cards(deck_data)
+        overlay = deck_data.get('overlay') or empty_overlay()
+        removed = set(overlay.get('removed', []))
+        added_ids = {card_data['card_id'] for card_data in overlay.get('added', [])}
+        increments = {}
+        array_filters = []
+        recorded = 0
+        for card_id, count in correct_counts.items():
+            if card_id in public_cards.by_id and card_id not in removed:
+                increments[f"overlay.progress.{card_id}"] = count
+            elif card_id in added_ids:
+                name = f"a{len(array_filters)}"
+                increments[f"overlay.added.$[{name}].correct_answers"] = count
+                array_filters.append({f"{name}.card_id": card_id})
+            else:
+                continue
+            recorded += count
+        increments["experience"] = recorded
+        result = self.db.decks.update_one({"_id": deck_data['_id'], "user_auth_id": auth_id, **SUBSCRIBED},
+                                          {"$inc": increments}, array_filters=array_filters or None)
+        if result.matched_count != 1:
+            return None
+        self._bump(auth_id)
+        return recorded
+
+    def add_cards(self, auth_id, deck_id, cards):
+        if not cards:
+            return True
+        try:
+            deck_object_id = ObjectId(deck_id)
+            first_position = self._reserve_positions(auth_id, deck_object_id, len(cards))
+            if first_position is not None:
+                self._insert_cards(deck_object_id, first_position, cards)
+                self._bump(auth_id)
+                return True
+            if self._update_overlay(auth_id, deck_object_id, [({"$push": {"overlay.added": {"$each": [card_to_document(card) for card in cards]}}}, None)]):
+                self._bump(auth_id)
+                return True
+        except Exception as ex:
+            print(f"Error adding cards in MongoDB: {ex}")
+            return False
+        return self._update_deck(auth_id, deck_id, {
+            "$push": {"flashcards": {"$each": [card_to_document(card) for card in cards]}},
+            "$set": {"updated_at": datetime.datetime.utcnow()}
+        }, action="adding cards")
+
+    def delete_card(self, auth_id, deck_id, card_id):
+        try:
+            deck_object_id = ObjectId(deck_id)
+            deck_data = self.db.decks.find_one({"_id": deck_object_id, "user_auth_id": auth_id}, {"card_layout": 1, "source": 1})
+            if deck_data is None:
+                return False
+            if is_subscription(deck_data):
+                # Only matching while the card is still there makes a repeated delete report it missing
+                if card_id in self._source_cards(deck_data).by_id:
+                    update = {"$addToSet": {"overlay.removed": card_id},
+                              "$unset": {f"overlay.edits.{card_id}": "", f"overlay.progress.{card_id}": ""}}
+                    condition = {"overlay.removed": {"$ne": card_id}}
+                else:
+                    update = {"$pull": {"overlay.added": {"card_id": card_id}}}
+                    condition = {"overlay.added.card_id": card_id}
+                if self._update_overlay(auth_id, deck_object_id, [(update, None)], condition):
+                    self._bump(auth_id)
+                    return True
+                return False
+            if is_separate(deck_data):
+                if self.db.cards.delete_one({"deck_id": deck_object_id, "card_id": card_id}).deleted_count == 0:
+                    return False
+                self.db.decks.update_one({"_id": deck_object_id}, {
+                    "$inc": {"card_count": -1},
+                    "$set": {"updated_at": datetime.datetime.utcnow()}
+                })
+                self._bump(auth_id)
+                return True
+        except Exception as ex:
+            print(f"Error deleting card in MongoDB: {ex}")
+            return False
+        # Matching on the card ID makes the update miss, and report False, when the deck has no such card
+        return self._update_deck(auth_id, deck_id, {
+            "$pull": {"flashcards": {"card_id": card_id}},
+            "$set": {"updated_at": datetime.datetime.utcnow()}
+        }, card_id=card_id, action="deleting card")
+
+    def delete_deck(self, auth_id, deck_id):
+        try:
+            result = self.db.decks.delete_one({"_id": ObjectId(deck_id), "user_auth_id": auth_id})
+            if result.deleted_count == 1:
+                self.db.cards.delete_many({"deck_id": ObjectId(deck_id)})
+                self._bump(auth_id)
+            return result.deleted_count == 1
+        except Exception as ex:
+            print(f"Error deleting deck in MongoDB: {ex}")
+            return False
+
+    def record_answers(self, auth_id, deck_id, correct_counts):
+        try:
+            deck_object_id = ObjectId(deck_id)
+            deck_data = self.db.decks.find_one({"_id": deck_object_id, "user_auth_id": auth_id},
+                                               {**SUBSCRIPTION_FIELDS, "flashcards.card_id": 1})
+            if deck_data is None:
+                return False
+            if is_subscription(deck_data):
+                return self._record_subscribed(auth_id, deck_data, correct_counts) is not None
+            if is_separate(deck_data):
+                # Answers to cards the deck no longer has earn no experience
+                found = self.db.cards.distinct("card_id", {"deck_id": deck_object_id, "card_id": {"$in": list(correct_counts)}})
+                # Usually every card got the same count, which makes this a single update
+                card_ids_by_count = {}
+                for card_id in found:
+                    card_ids_by_count.setdefault(correct_counts[card_id], []).append(card_id)
+                if card_ids_by_count:
+                    self.db.cards.bulk_write([
+                        pymongo.UpdateMany({"deck_id": deck_object_id, "card_id": {"$in": card_ids}}, {"$inc": {"correct_answers": count}})
+                        for count, card_ids in card_ids_by_count.items()
+                    ], ordered=False)
+                self.db.decks.update_one({"_id": deck_object_id}, {"$inc": {"experience": sum(correct_counts[card_id] for card_id in found)}})
+                self._bump(auth_id)
+                return True
+            card_ids = {card_data.get('card_id') for card_data in deck_data.get('flashcards', [])}
+        except Exception as ex:
+            print(f"Error recording answers in MongoDB: {ex}")
+            return False
+
+        found = [card_id for card_id in correct_counts if card_id in card_ids]
+        increments = {"experience": sum(correct_counts[card_id] for card_id in found)}
+        array_filters = []
+        for card_id in found:
+            count = correct_counts[card_id]
+            name = f"c{len(array_filters)}"
+            increments[f"flashcards.$[{name}].correct_answers"] = count
+            array_filters.append({f"{name}.card_id": card_id})
+        return self._update_deck(auth_id, deck_id, {"$inc": increments}, array_filters=array_filters,
+                                 action="recording answers")
+
+    def record_correct_answer(self, auth_id, deck_id, card_id):
+        try:
+            deck_object_id = ObjectId(deck_id)
+            deck_data = self.db.decks.find_one({"_id": deck_object_id, "user_auth_id": auth_id}, SUBSCRIPTION_FIELDS)
+            if deck_data is None:
+                return False
+            if is_subscription(deck_data):
+                # A stale card ID changes nothing here either
+                card_documents = self._subscription_cards(deck_data)
+                if not any(card_data['card_id'] == card_id for card_data in card_documents):
+                    return False
+                return bool(self._record_subscribed(auth_id, deck_data, {card_id: 1}))
+            if is_separate(deck_data):
+                # One small card document changes, however big the deck is
+                result = self.db.cards.update_one({"deck_id": deck_object_id, "card_id": card_id}, {"$inc": {"correct_answers": 1}})
+                if result.matched_count == 1:
+                    self.db.decks.update_one({"_id": deck_object_id}, {"$inc": {"experience": 1}})
+                    self._bump(auth_id)
+                return result.matched_count == 1
+        except Exception as ex:
+            print(f"Error recording answer in MongoDB: {ex}")
+            return False
+        # The positional operator only matches when the card exists, so a stale card ID changes nothing
+        return self._update_deck(auth_id, deck_id, {"$inc": {"flashcards.$.correct_answers": 1, "experience": 1}},
+                                 card_id=card_id, action="recording answer")
+
+    def _update_deck(self, auth_id, deck_id, update, array_filters=None, card_id=None, action="updating deck"):
+        """Apply one update to one of a user's decks with embedded cards, bumping the version if the deck matched"""
+        deck_filter = {"_id": ObjectId(deck_id), "user_auth_id": auth_id, **EMBEDDED}
+        if card_id is not None:
+            deck_filter["flashcards.card_id"] = card_id
+        update.setdefault("$inc", {})["card_revision"] = 1
+        try:
+            result = self.db.decks.update_one(deck_filter, update, array_filters=array_filters)
+            if result.matched_count == 1:
+                self._bump(auth_id)
+            return result.matched_count == 1
+        except Exception as ex:
+            print(f"Error {action} in MongoDB: {ex}")
+            return False
+
+    def _publish(self, auth_id, deck_id, name, card_documents):
+        try:
+            now = datetime.datetime.utcnow()
+            # Reserving the version number first keeps two concurrent publishes from writing the same version
+            public_data = self.db.public_decks.find_one_and_update(
+                {"owner_auth_id": auth_id, "source_deck_id": deck_id},
+                {
+                    "$inc": {"next_version": 1},
+                    "$setOnInsert": {"name": name, "version": 0, "card_count": 0, "subscriptions": 0, "created_at": now, "updated_at": now}
+                },
+                projection={"next_version": 1},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            public_object_id = public_data['_id']
+            version = public_data['next_version']
+            if card_documents:
+                self.db.public_cards.insert_many([
+                    dict(card_data, public_id=public_object_id, version=version, position=position)
+                    for position, card_data in enumerate(card_documents)
+                ], ordered=False)
+            # The cards are in place before subscribers can see the version; an older publish finishing late changes nothing
+            self.db.public_decks.update_one(
+                {"_id": public_object_id, "version": {"$lt": version}},
+                {"$set": {"name": name, "version": version, "card_count": len(card_documents), "updated_at": now,
+                          "search_text": deck_search_text(card_documents)}}
+            )
+            return self.get_public_deck(str(public_object_id))
+        except Exception as ex:
+            print(f"Error publishing deck in MongoDB: {ex}")
+            return None
+
+    def get_public_deck(self, public_id):
+        try:
+            public_data = self.db.public_decks.find_one({"_id": ObjectId(public_id), "version": {"$gte": 1}}, PUBLIC_DECK_FIELDS)
+            return public_deck_from_document(public_data) if public_data else None
+        except Exception as ex:
+            print(f"Error getting public deck from MongoDB: {ex}")
+            return None
+
+    def list_public_decks(self, offset=0, limit=20):
+        try:
+            public_decks = (self.db.public_decks.find({"version": {"$gte": 1}}, PUBLIC_DECK_FIELDS)
+                            .sort("updated_at", pymongo.DESCENDING).skip(offset).limit(limit))
+            return [public_deck_from_document(public_data) for public_data in public_decks]
+        except Exception as ex:
+            print(f"Error listing public decks from MongoDB: {ex}")
+            return []
+
+    def search_public_decks(self, query, offset=0, limit=20):
+        words = search_words(query)
+        if not words:
+            return []
+        try:
+            # The public_search text index does the matching and scoring (with name matches weighted up)
+            public_decks = self.db.public_decks.find(
+                {"$text": {"$search": " ".join(words)}, "version": {"$gte": 1}},
+                {**PUBLIC_DECK_FIELDS, "score": {"$meta": "textScore"}}
+            ).sort([("score", {"$meta": "textScore"})]).skip(offset).limit(limit)
+            return [public_deck_from_document(public_data) for public_data in public_decks]
+        except Exception as ex:
+            print(f"Error searching public decks in MongoDB: {ex}")
+            return []
+
+    def get_published_deck(self, auth_id, deck_id):
+        try:
+            public_data = self.db.public_decks.find_one({"owner_auth_id": auth_id, "source_deck_id": deck_id, "version": {"$gte": 1}},
+                                                        PUBLIC_DECK_FIELDS)
+            return public_deck_from_document(public_data) if public_data else None
+        except Exception as ex:
+            print(f"Error getting public deck from MongoDB: {ex}")
+            return None
+
+    def _load_public_cards(self, public_id, version):
+        try:
+            public_object_id = ObjectId(public_id)
+            card_documents = list(self.db.public_cards.find({"public_id": public_object_id, "version": version}, CARD_FIELDS)
+                                  .sort("position", pymongo.ASCENDING))
+            if not card_documents and self.db.public_decks.find_one({"_id": public_object_id}, {"_id": 1}) is None:
+                return None
+            return card_documents
+        except Exception as ex:
+            print(f"Error getting public cards from MongoDB: {ex}")
+            return None
+
+    def subscribe(self, auth_id, public_id):
+        try:
+            user = self.db.users.find_one({"auth_id": auth_id}, {"_id": 1})
+            if not user:
+                return None
+            public_data = self.db.public_decks.find_one_and_update(
+                {"_id": ObjectId(public_id), "version": {"$gte": 1}},
+                {"$inc": {"subscriptions": 1}},
+                projection={"name": 1, "version": 1, "card_count": 1}
+            )
+            if public_data is None:
+                return None
+            now = datetime.datetime.utcnow()
+            deck_id = new_deck_id()
+            self.db.decks.insert_one({
+                '_id': ObjectId(deck_id),
+                'user_auth_id': auth_id,
+                'user_object_id': user['_id'],
+                'name': public_data['name'],
+                'experience': 0,
+                'card_layout': SUBSCRIPTION_CARDS,
+                'source': {"public_id": public_id, "version": public_data['version']},
+                'overlay': empty_overlay(),
+                'card_count': public_data['card_count'],
+                'created_at': now,
+                'updated_at': now
+            })
+            self._bump(auth_id)
+            return deck_id
+        except Exception as ex:
+            print(f"Error subscribing to deck in MongoDB: {ex}")
+            return None
+
+    def get_deck_source(self, auth_id, deck_id):
+        try:
+            deck_data = self.db.decks.find_one({"_id": ObjectId(deck_id), "user_auth_id": auth_id, **SUBSCRIBED}, {"source": 1})
+        except Exception as ex:
+            print(f"Error getting deck from MongoDB: {ex}")
+            return None
+        return dict(deck_data['source']) if deck_data else None
+
+    def update_subscription(self, auth_id, deck_id):
+        try:
+            deck_object_id = ObjectId(deck_id)
+            deck_data = self.db.decks.find_one({"_id": deck_object_id, "user_auth_id": auth_id, **SUBSCRIBED}, SUBSCRIPTION_FIELDS)
+            if deck_data is None:
+                return False
+            public_data = self.db.public_decks.find_one({"_id": ObjectId(deck_data['source']['public_id'])}, {"version": 1})
+            if public_data is None or public_data['version'] == deck_data['source']['version']:
+                return True
+            deck_data['source']['version'] = public_data['version']
+            card_count = overlay_card_count(self._source_cards(deck_data), deck_data['overlay'])
+            self.db.decks.update_one({"_id": deck_object_id, **SUBSCRIBED},
+                                     {"$set": {"source.version": public_data['version'], "card_count": card_count}})
+            self._bump(auth_id)
+            return True
+        except Exception as ex:
+            print(f"Error updating subscription in MongoDB: {ex}")
+            return False
+
+    def stats(self):
+        return {"backend": self.backend, "database": self.db.name, "public_cards": self.public_cards.stats()}
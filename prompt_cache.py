@@ -0,0 +1,183 @@
+# File used for
+#     - remembering AI responses on disk (SQLite), keyed by a hash of the model and the normalized prompt
+#     - expiring entries after a TTL and evicting the least recently used ones past a size limit
+#     - letting concurrent identical prompts share one upstream call instead of each making their own
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+# Share of the size limit freed in one go when the cache is over it, so eviction doesn't run on every put
+EVICTION_SLACK = 0.1
+
+
+def normalize_prompt(prompt):
+    """Prompt text with runs of whitespace collapsed, so formatting differences don't miss the cache"""
+    return " ".join(prompt.split())
+
+
+def prompt_key(prompt, model):
+    """Content address of a prompt for a model"""
+    return hashlib.sha256(f"{model}\0{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+
+class InFlight:
+    """An upstream call other threads with the same prompt are waiting on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class PromptCache:
+    """Prompt -> response cache in a SQLite file, with TTL, LRU size bound and request coalescing"""
+
+    def __init__(self, path, ttl_seconds=7 * 24 * 3600, max_bytes=50 * 1024 * 1024):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._local = threading.local()  # one SQLite connection per thread
+        self._lock = threading.Lock()
+        self._in_flight = {}  # key -> InFlight
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.expired = 0
+        self.evictions = 0
+        self._connection()  # create the table now, so a bad path shows up at startup
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, model TEXT NOT NULL, response TEXT NOT NULL,"
+                " size INTEGER NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            self._local.connection = connection
+        return connection
+
+    def get(self, prompt, model):
+        """The cached response for prompt and model, or None if there is none (or it expired)"""
+        response = self._read(prompt_key(prompt, model))
+        with self._lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return response
+
+    def _read(self, key):
+        connection = self._connection()
+        row = connection.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if now - row[1] > self.ttl_seconds:
+            connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            with self._lock:
+                self.expired += 1
+            return None
+        connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def put(self, prompt, model, response):
+        """Store a response, then evict least recently used entries if the cache is over its size"""
+        key = prompt_key(prompt, model)
+        now = time.time()
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, model, response, len(response.encode("utf-8")), now, now)
+        )
+        self._evict(connection, now)
+
+    def _evict(self, connection, now):
+        expired = connection.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)).rowcount
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        evicted = 0
+        if total > self.max_bytes:
+            target = self.max_bytes * (1 - EVICTION_SLACK)
+            for key, size in connection.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+                if total <= target:
+                    break
+                connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                total -= size
+                evicted += 1
+        with self._lock:
+            self.expired += max(0, expired)
+            self.evictions += evicted
+
+    def get_or_compute(self, prompt, model, compute, refresh=False):
+        """Return the cached response, or call compute() once for everyone asking for this prompt right now
+
+        With refresh, the cached response is skipped and replaced by a new one.
+        """
+        if not refresh:
+            cached = self.get(prompt, model)
+            if cached is not None:
+                return cached
+
+        key = prompt_key(prompt, model)
+        with self._lock:
+            in_flight = self._in_flight.get(key)
+            leader = in_flight is None
+            if leader:
+                in_flight = self._in_flight[key] = InFlight()
+            else:
+                self.coalesced += 1
+        if not leader:
+            in_flight.done.wait()
+            if in_flight.error is not None:
+                raise in_flight.error
+            return in_flight.result
+
+        try:
+            # Another leader may have stored it between our miss and now
+            cached = None if refresh else self._read(key)
+            if cached is not None:
+                with self._lock:
+                    self.coalesced += 1
+                in_flight.result = cached
+            else:
+                in_flight.result = compute()
+                self.put(prompt, model, in_flight.result)
+            return in_flight.result
+        except Exception as ex:
+            in_flight.error = ex
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            in_flight.done.set()
+
+    def clear(self):
+        self._connection().execute("DELETE FROM responses")
+
+    def stats(self):
+        """Counters for monitoring the cache; upstream_saved counts both hits and coalesced calls"""
+        entries, size = self._connection().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "path": os.path.abspath(self.path),
+                "entries": entries,
+                "bytes": size,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "coalesced": self.coalesced,
+                "upstream_saved": self.hits + self.coalesced,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "in_flight": len(self._in_flight),
+            }
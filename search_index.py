@@ -0,0 +1,102 @@
+# File used for
+#     - searching public decks by the words in their names and cards without scanning every deck
+#     - an inverted index (word -> the decks containing it, with counts) updated one deck at a time as
+#       decks are published, for the in-memory deck store
+#     - ranking matches with BM25, counting a word in a deck's name for more than one on its cards
+
+import heapq
+import math
+import operator
+import re
+import threading
+from collections import Counter
+
+WORD_PATTERN = re.compile(r"\w+")
+
+# A word in a deck's name counts as this many words on its cards
+NAME_WEIGHT = 3
+
+# BM25: how quickly repeats of a word stop adding to a deck's score, and how much long decks are discounted
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Card text indexed per deck; the rest of a huge deck adds little to finding it
+MAX_INDEXED_CHARACTERS = 64 * 1024
+
+
+def search_words(text):
+    """The lowercased words of text, in order"""
+    return WORD_PATTERN.findall(text.lower())
+
+
+def deck_search_text(card_documents):
+    """The card text of a published deck as it is indexed: questions and answers, capped in length"""
+    text = " ".join(f"{card_data['question']} {card_data['answer']}" for card_data in card_documents)
+    return text[:MAX_INDEXED_CHARACTERS]
+
+
+class SearchIndex:
+    """Inverted index over documents that have a name and a body, ranked with BM25"""
+
+    def __init__(self):
+        self.postings = {}  # word -> {doc_id: weighted count}
+        self.lengths = {}   # doc_id -> weighted word count
+        self.words = {}     # doc_id -> its distinct words, so an update can take the old ones out
+        self.total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def update(self, doc_id, name, text):
+        """Index a document, replacing what was indexed for it before"""
+        counts = Counter(search_words(text))
+        for word in search_words(name):
+            counts[word] += NAME_WEIGHT
+        length = sum(counts.values())
+        with self._lock:
+            self._remove(doc_id)
+            for word, count in counts.items():
+                self.postings.setdefault(word, {})[doc_id] = count
+            self.lengths[doc_id] = length
+            self.words[doc_id] = tuple(counts)
+            self.total_length += length
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        length = self.lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self.total_length -= length
+        for word in self.words.pop(doc_id):
+            posting = self.postings[word]
+            del posting[doc_id]
+            if not posting:
+                del self.postings[word]
+
+    def search(self, query, offset=0, limit=20):
+        """(doc_id, score) of the documents containing any word of the query, best first
+
+        Every matching document is scored, so consecutive pages never overlap or skip one.
+        """
+        with self._lock:
+            count = len(self.lengths)
+            postings = [self.postings[word] for word in set(search_words(query)) if word in self.postings]
+            if not postings:
+                return []
+            average_length = self.total_length / count
+            lengths = self.lengths
+            scores = {}
+            for posting in postings:
+                idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+                for doc_id, frequency in posting.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc_id] / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        return heapq.nlargest(offset + limit, scores.items(), key=operator.itemgetter(1))[offset:]
+
+    def stats(self):
+        with self._lock:
+            return {"documents": len(self.lengths), "words": len(self.postings)}
@@ -0,0 +1,692 @@
+# File used for
+#     - storing users and decks in a local SQLite file when there is no MongoDB server
+#     - normalized tables: one row per deck and one per card, keyed by (deck_id, position)
+#     - public decks: one row per published version, with that version's cards; subscribed decks keep
+#       only their overlay (progress and local edits, as JSON) next to the version they follow
+#     - searching public decks with an FTS5 full-text index kept in step with every publish
+#     - WAL mode, so several worker processes can read while one writes
+
+import datetime
+import json
+import os
+import sqlite3
+import threading
+
+from datacompression import DeckSummary
+from deck_store import (DEFAULT_COLUMNAR_THRESHOLD, DeckChanges, DeckList, DeckStore, PublicCards, build_deck,
+                        card_from_document, card_to_document, empty_overlay, merge_overlay, new_deck_id, overlay_apply_changes,
+                        overlay_card_count, overlay_delete_card, overlay_record_answers, take_deck_snapshot)
+from search_index import NAME_WEIGHT, deck_search_text, search_words
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    auth_id TEXT PRIMARY KEY,
+    email TEXT,
+    name TEXT,
+    picture TEXT,
+    deck_version INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT,
+    last_login TEXT
+);
+CREATE TABLE IF NOT EXISTS decks (
+    id TEXT PRIMARY KEY,
+    user_auth_id TEXT NOT NULL REFERENCES users (auth_id),
+    name TEXT NOT NULL,
+    experience INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS decks_user ON decks (user_auth_id, id);
+CREATE TABLE IF NOT EXISTS cards (
+    deck_id TEXT NOT NULL REFERENCES decks (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    card_id TEXT NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    correct_answers INTEGER NOT NULL DEFAULT 0,
+    reversible INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (deck_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cards_card_id ON cards (deck_id, card_id);
+CREATE TABLE IF NOT EXISTS public_decks (
+    id TEXT PRIMARY KEY,
+    owner_auth_id TEXT NOT NULL,
+    source_deck_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    card_count INTEGER NOT NULL,
+    subscriptions INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT,
+    updated_at TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS public_decks_source ON public_decks (owner_auth_id, source_deck_id);
+CREATE INDEX IF NOT EXISTS public_decks_updated ON public_decks (updated_at);
+CREATE TABLE IF NOT EXISTS public_cards (
+    public_id TEXT NOT NULL REFERENCES public_decks (id),
+    version INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    card_id TEXT NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    reversible INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (public_id, version, position)
+) WITHOUT ROWID;
+"""
+
+# Columns added after the first release of each table, so existing files get them too:
+# subscribed decks fill in the decks ones, and search_rowid links a public deck to its search row
+ADDED_COLUMNS = {
+    "decks": {
+        "source_id": "TEXT",
+        "source_version": "INTEGER",
+        "overlay": "TEXT",
+        "card_count": "INTEGER",
+    },
+    "public_decks": {
+        "search_rowid": "INTEGER",
+    },
+}
+
+# Ranks name matches above card matches, like the in-memory index
+SEARCH_SCHEMA = f"""
+CREATE VIRTUAL TABLE public_search USING fts5 (name, cards);
+INSERT INTO public_search (public_search, rank) VALUES ('rank', 'bm25({NAME_WEIGHT}.0, 1.0)');
+"""
+
+CARD_COLUMNS = "card_id, question, answer, correct_answers, reversible"
+DECK_COLUMNS = "name, experience, source_id, source_version, overlay"
+PUBLIC_COLUMNS = "id, owner_auth_id, source_deck_id, name, version, card_count, subscriptions, created_at, updated_at"
+
+
+def card_document_from_row(row):
+    """Turn a (card_id, question, answer, correct_answers, reversible) row into a card document"""
+    return {
+        'card_id': row[0],
+        'question': row[1],
+        'answer': row[2],
+        'correct_answers': row[3],
+        'reversible': bool(row[4])
+    }
+
+
+def card_row(deck_id, position, card):
+    return (deck_id, position, card.card_id, card.question, card.answer, card.correct_answers, int(card.reversible))
+
+
+def public_deck_from_row(row):
+    return dict(zip(("public_id", "owner_auth_id", "source_deck_id", "name", "version", "card_count",
+                     "subscriptions", "created_at", "updated_at"), row))
+
+
+class SQLiteDeckStore(DeckStore):
+    """Decks and cards in a SQLite file; every process opening the same file sees the same decks"""
+
+    backend = "sqlite"
+
+    def __init__(self, path, columnar_threshold=DEFAULT_COLUMNAR_THRESHOLD):
+        super().__init__(columnar_threshold)
+        self.path = path
+        self._local = threading.local()  # one SQLite connection per thread
+        connection = self._connection()
+        connection.executescript(SCHEMA)
+        for table, columns in ADDED_COLUMNS.items():
+            existing_columns = {row[1] for row in connection.execute(f"PRAGMA table_info({table})")}
+            for column, column_type in columns.items():
+                if column not in existing_columns:
+                    connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+        connection.execute("CREATE INDEX IF NOT EXISTS public_decks_search ON public_decks (search_rowid)")
+        self.full_text_search = self._create_search_index(connection)
+
+    def _create_search_index(self, connection):
+        """Create the public deck search table if needed and index any public deck it is missing; False without FTS5"""
+        if connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'public_search'").fetchone() is None:
+            try:
+                connection.executescript(f"BEGIN; {SEARCH_SCHEMA} COMMIT;")
+            except sqlite3.OperationalError as ex:
+                connection.execute("ROLLBACK")
+                print(f"SQLite has no full-text search ({ex}); public deck search only matches deck names")
+                return False
+
+        def index_missing(connection):
+            missing = connection.execute("SELECT id, name, version FROM public_decks WHERE search_rowid IS NULL").fetchall()
+            for public_id, name, version in missing:
+                card_documents = [
+                    {'question': question, 'answer': answer} for question, answer in connection.execute(
+                        "SELECT question, answer FROM public_cards WHERE public_id = ? AND version = ? ORDER BY position",
+                        (public_id, version)
+                    )
+                ]
+                self._index_public_deck(connection, public_id, name, deck_search_text(card_documents))
+
+        self._write("indexing public decks", index_missing)
+        return True
+
+    @staticmethod
+    def _index_public_deck(connection, public_id, name, text):
+        """Point a public deck's search row at its latest name and cards"""
+        search_rowid = connection.execute("SELECT search_rowid FROM public_decks WHERE id = ?", (public_id,)).fetchone()[0]
+        if search_rowid is not None:
+            connection.execute("DELETE FROM public_search WHERE rowid = ?", (search_rowid,))
+        search_rowid = connection.execute("INSERT INTO public_search (rowid, name, cards) VALUES (?, ?, ?)",
+                                          (search_rowid, name, text)).lastrowid
+        connection.execute("UPDATE public_decks SET search_rowid = ? WHERE id = ?", (search_rowid, public_id))
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Transactions are begun explicitly, so reads don't hold locks between statements
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA foreign_keys=ON")
+            self._local.connection = connection
+        return connection
+
+    def _write(self, action, work):
+        """Run work(connection) in one write transaction; False if it failed or returned False"""
+        connection = self._connection()
+        try:
+            # IMMEDIATE takes the write lock up front, so concurrent writers queue instead of deadlocking
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(connection)
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+            return result is not False
+        except Exception as ex:
+            print(f"Error {action} in SQLite: {ex}")
+            return False
+
+    @staticmethod
+    def _bump(connection, auth_id):
+        connection.execute("UPDATE users SET deck_version = deck_version + 1 WHERE auth_id = ?", (auth_id,))
+
+    @staticmethod
+    def _deck_row(connection, auth_id, deck_id):
+        """(name, experience, source_id, source_version, overlay) of one of a user's decks, or None"""
+        return connection.execute(f"SELECT {DECK_COLUMNS} FROM decks WHERE id = ? AND user_auth_id = ?", (deck_id, auth_id)).fetchone()
+
+    def _subscription(self, row):
+        """(PublicCards, overlay) of a subscribed deck's row, or None for a deck with its own cards"""
+        if row[2] is None:
+            return None
+        return self.get_public_cards(row[2], row[3]) or PublicCards(()), json.loads(row[4])
+
+    @staticmethod
+    def _write_overlay(connection, deck_id, public_cards, overlay):
+        connection.execute("UPDATE decks SET overlay = ?, card_count = ?, updated_at = ? WHERE id = ?",
+                           (json.dumps(overlay), overlay_card_count(public_cards, overlay),
+                            datetime.datetime.utcnow().isoformat(), deck_id))
+
+    def _append_cards(self, connection, deck_id, cards):
+        next_position = connection.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM cards WHERE deck_id = ?", (deck_id,)).fetchone()[0]
+        connection.executemany(
+            f"INSERT INTO cards (deck_id, position, {CARD_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [card_row(deck_id, next_position + offset, card) for offset, card in enumerate(cards)]
+        )
+
+    def _card_documents(self, connection, deck_id, row):
+        subscription = self._subscription(row)
+        if subscription is not None:
+            return merge_overlay(*subscription)
+        rows = connection.execute(f"SELECT {CARD_COLUMNS} FROM cards WHERE deck_id = ? ORDER BY position", (deck_id,))
+        return [card_document_from_row(card_data) for card_data in rows]
+
+    def upsert_user(self, auth_id, email, name=None, picture=None):
+        now = datetime.datetime.utcnow().isoformat()
+
+        def upsert(connection):
+            existing_user = connection.execute("SELECT 1 FROM users WHERE auth_id = ?", (auth_id,)).fetchone()
+            if existing_user:
+                connection.execute("UPDATE users SET email = ?, name = ?, picture = ?, last_login = ? WHERE auth_id = ?",
+                                   (email, name, picture, now, auth_id))
+                print(f"Updated existing user: {email}")
+            else:
+                connection.execute("INSERT INTO users (auth_id, email, name, picture, created_at, last_login) VALUES (?, ?, ?, ?, ?, ?)",
+                                   (auth_id, email, name, picture, now, now))
+                print(f"Created new user: {email}")
+
+        return self._write("creating/updating user", upsert)
+
+    def get_user(self, auth_id):
+        try:
+            cursor = self._connection().execute("SELECT * FROM users WHERE auth_id = ?", (auth_id,))
+            row = cursor.fetchone()
+            return dict(zip([column[0] for column in cursor.description], row)) if row else None
+        except Exception as ex:
+            print(f"Error getting user: {ex}")
+            return None
+
+    def get_deck_version(self, auth_id):
+        try:
+            row = self._connection().execute("SELECT deck_version FROM users WHERE auth_id = ?", (auth_id,)).fetchone()
+        except Exception as ex:
+            print(f"Error getting deck version from SQLite: {ex}")
+            return None
+        return row[0] if row else None
+
+    def load_decks(self, auth_id):
+        connection = self._connection()
+        try:
+            # One read transaction, so the decks and their cards come from the same moment
+            connection.execute("BEGIN")
+            try:
+                deck_rows = connection.execute(f"SELECT id, {DECK_COLUMNS} FROM decks WHERE user_auth_id = ? ORDER BY id", (auth_id,)).fetchall()
+                decks = DeckList(
+                    build_deck(row[0], row[1], row[2], self._card_documents(connection, row[0], row[1:]), self.columnar_threshold)
+                    for row in deck_rows
+                )
+            finally:
+                connection.execute("COMMIT")
+            decks.loaded_ids = {deck._id for deck in decks}
+            return decks
+        except Exception as ex:
+            print(f"Error getting decks from SQLite: {ex}")
+            return DeckList()
+
+    def load_deck(self, auth_id, deck_id):
+        connection = self._connection()
+        try:
+            connection.execute("BEGIN")
+            try:
+                row = self._deck_row(connection, auth_id, deck_id)
+                if row is None:
+                    return None
+                card_documents = self._card_documents(connection, deck_id, row)
+            finally:
+                connection.execute("COMMIT")
+            return build_deck(deck_id, row[0], row[1], card_documents, self.columnar_threshold)
+        except Exception as ex:
+            print(f"Error getting deck from SQLite: {ex}")
+            return None
+
+    def get_card(self, auth_id, deck_id, card_id):
+        try:
+            connection = self._connection()
+            row = self._deck_row(connection, auth_id, deck_id)
+            if row is None:
+                return None
+            if row[2] is not None:
+                card_data = next((card_data for card_data in self._card_documents(connection, deck_id, row)
+                                  if card_data['card_id'] == card_id), None)
+                return card_from_document(card_data) if card_data else None
+            card_data = connection.execute(f"SELECT {CARD_COLUMNS} FROM cards WHERE deck_id = ? AND card_id = ?",
+                                           (deck_id, card_id)).fetchone()
+            return card_from_document(card_document_from_row(card_data)) if card_data else None
+        except Exception as ex:
+            print(f"Error getting card from SQLite: {ex}")
+            return None
+
+    def get_card_id(self, auth_id, deck_id, card_index):
+        try:
+            connection = self._connection()
+            row = self._deck_row(connection, auth_id, deck_id)
+            if row is None:
+                return None
+            if row[2] is not None:
+                card_documents = self._card_documents(connection, deck_id, row)
+                return card_documents[card_index]['card_id'] if 0 <= card_index < len(card_documents) else None
+            card_data = connection.execute("SELECT card_id FROM cards WHERE deck_id = ? ORDER BY position LIMIT 1 OFFSET ?",
+                                           (deck_id, card_index)).fetchone()
+            return card_data[0] if card_data else None
+        except Exception as ex:
+            print(f"Error getting card from SQLite: {ex}")
+            return None
+
+    def get_deck_page(self, auth_id, deck_id, offset, limit):
+        connection = self._connection()
+        try:
+            connection.execute("BEGIN")
+            try:
+                row = self._deck_row(connection, auth_id, deck_id)
+                if row is None:
+                    return None, []
+                if row[2] is not None:
+                    card_documents = self._card_documents(connection, deck_id, row)
+                    card_count = len(card_documents)
+                    card_documents = card_documents[offset:offset + limit]
+                else:
+                    card_count = connection.execute("SELECT COUNT(*) FROM cards WHERE deck_id = ?", (deck_id,)).fetchone()[0]
+                    card_documents = [card_document_from_row(card_data) for card_data in connection.execute(
+                        f"SELECT {CARD_COLUMNS} FROM cards WHERE deck_id = ? ORDER BY position LIMIT ? OFFSET ?",
+                        (deck_id, limit, offset)
+                    )]
+            finally:
+                connection.execute("COMMIT")
+            summary = DeckSummary(row[0], card_count, row[1], deck_id)
+            return summary, [card_from_document(card_data) for card_data in card_documents]
+        except Exception as ex:
+            print(f"Error getting deck page from SQLite: {ex}")
+            return None, []
+
+    def get_deck_summaries(self, auth_id):
+        try:
+            rows = self._connection().execute(
+                "SELECT id, name, experience,"
+                " CASE WHEN source_id IS NULL THEN (SELECT COUNT(*) FROM cards WHERE deck_id = decks.id) ELSE card_count END"
+                " FROM decks WHERE user_auth_id = ? ORDER BY id", (auth_id,)
+            )
+            return [DeckSummary(name, card_count, experience, deck_id) for deck_id, name, experience, card_count in rows]
+        except Exception as ex:
+            print(f"Error getting deck summaries from SQLite: {ex}")
+            return []
+
+    def save_decks(self, auth_id, decks):
+        kept_ids = set()
+
+        def save(connection):
+            if connection.execute("SELECT 1 FROM users WHERE auth_id = ?", (auth_id,)).fetchone() is None:
+                print(f"Cannot save decks: User with auth_id {auth_id} not found")
+                return False
+            loaded_ids = getattr(decks, 'loaded_ids', None)
+            if loaded_ids is None:
+                # Plain lists don't know what was loaded, so ask the database
+                loaded_ids = {row[0] for row in connection.execute("SELECT id FROM decks WHERE user_auth_id = ?", (auth_id,))}
+
+            now = datetime.datetime.utcnow().isoformat()
+            changed = False
+            for deck in decks:
+                deck_id = getattr(deck, '_id', None)
+                row = self._deck_row(connection, auth_id, deck_id) if deck_id in loaded_ids and hasattr(deck, '_snapshot') else None
+                if row is not None:
+                    kept_ids.add(deck_id)
+                    changed = self._update_deck(connection, deck, row, now) or changed
+                    continue
+                deck._id = new_deck_id()
+                connection.execute(
+                    "INSERT INTO decks (id, user_auth_id, name, experience, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (deck._id, auth_id, deck.name, deck.experience, now, now)
+                )
+                self._append_cards(connection, deck._id, deck.flashcards)
+                kept_ids.add(deck._id)
+                changed = True
+
+            # Remove decks that are no longer in the list; their cards go with them
+            decks_to_delete = [(deck_id, auth_id) for deck_id in loaded_ids if deck_id not in kept_ids]
+            if decks_to_delete:
+                deleted = connection.executemany("DELETE FROM decks WHERE id = ? AND user_auth_id = ?", decks_to_delete).rowcount
+                changed = changed or deleted > 0
+            if changed:
+                self._bump(connection, auth_id)
+
+        if not self._write("saving decks", save):
+            return False
+        for deck in decks:
+            take_deck_snapshot(deck)
+        if isinstance(decks, DeckList):
+            decks.loaded_ids = kept_ids
+        return True
+
+    def _update_deck(self, connection, deck, row, now):
+        """Write what changed in a loaded deck; whether anything did"""
+        changes = DeckChanges(deck)
+        if not changes:
+            return False
+        connection.execute(
+            "UPDATE decks SET name = ?, experience = experience + ?, updated_at = ? WHERE id = ?",
+            (deck.name, changes.experience_delta, now, deck._id)
+        )
+        subscription = self._subscription(row)
+        if subscription is not None:
+            if not changes.reordered:
+                public_cards, overlay = subscription
+                self._write_overlay(connection, deck._id, public_cards, overlay_apply_changes(overlay, changes, public_cards))
+                return True
+            # An overlay can't reorder public cards, so the deck becomes a copy of its own
+            connection.execute("UPDATE decks SET source_id = NULL, source_version = NULL, overlay = NULL, card_count = NULL"
+                               " WHERE id = ?", (deck._id,))
+        if changes.reordered:
+            # Positions are the primary key, so a new order is easiest written from scratch
+            connection.execute("DELETE FROM cards WHERE deck_id = ?", (deck._id,))
+            self._append_cards(connection, deck._id, deck.flashcards)
+            return True
+        if changes.removed_ids:
+            connection.executemany("DELETE FROM cards WHERE deck_id = ? AND card_id = ?",
+                                   [(deck._id, card_id) for card_id in changes.removed_ids])
+        if changes.changed_cards:
+            connection.executemany(
+                "UPDATE cards SET question = ?, answer = ?, correct_answers = ?, reversible = ? WHERE deck_id = ? AND card_id = ?",
+                [(card.question, card.answer, card.correct_answers, int(card.reversible), deck._id, card.card_id)
+                 for card in changes.changed_cards]
+            )
+        if changes.added_cards:
+            self._append_cards(connection, deck._id, changes.added_cards)
+        return True
+
+    def add_cards(self, auth_id, deck_id, cards):
+        if not cards:
+            return True
+
+        def add(connection):
+            row = self._deck_row(connection, auth_id, deck_id)
+            if row is None:
+                return False
+            subscription = self._subscription(row)
+            if subscription is not None:
+                public_cards, overlay = subscription
+                overlay['added'].extend(card_to_document(card) for card in cards)
+                self._write_overlay(connection, deck_id, public_cards, overlay)
+            else:
+                self._append_cards(connection, deck_id, cards)
+            self._touch(connection, auth_id, deck_id)
+
+        return self._write("adding cards", add)
+
+    def delete_card(self, auth_id, deck_id, card_id):
+        def delete(connection):
+            row = self._deck_row(connection, auth_id, deck_id)
+            if row is None:
+                return False
+            subscription = self._subscription(row)
+            if subscription is not None:
+                public_cards, overlay = subscription
+                if not overlay_delete_card(overlay, card_id, public_cards):
+                    return False
+                self._write_overlay(connection, deck_id, public_cards, overlay)
+            elif connection.execute("DELETE FROM cards WHERE deck_id = ? AND card_id = ?", (deck_id, card_id)).rowcount == 0:
+                return False
+            self._touch(connection, auth_id, deck_id)
+
+        return self._write("deleting card", delete)
+
+    def delete_deck(self, auth_id, deck_id):
+        def delete(connection):
+            if connection.execute("DELETE FROM decks WHERE id = ? AND user_auth_id = ?", (deck_id, auth_id)).rowcount != 1:
+                return False
+            self._bump(connection, auth_id)
+
+        return self._write("deleting deck", delete)
+
+    def record_answers(self, auth_id, deck_id, correct_counts):
+        def record(connection):
+            recorded = self._record(connection, auth_id, deck_id, correct_counts)
+            if recorded is None:
+                return False
+            # Answers to cards the deck no longer has earn no experience
+            connection.execute("UPDATE decks SET experience = experience + ? WHERE id = ?", (recorded, deck_id))
+            self._bump(connection, auth_id)
+
+        return self._write("recording answers", record)
+
+    def record_correct_answer(self, auth_id, deck_id, card_id):
+        def record(connection):
+            # Like MongoDB's positional update, a stale card ID changes nothing
+            if not self._record(connection, auth_id, deck_id, {card_id: 1}):
+                return False
+            connection.execute("UPDATE decks SET experience = experience + 1 WHERE id = ?", (deck_id,))
+            self._bump(connection, auth_id)
+
+        return self._write("recording answer", record)
+
+    def _record(self, connection, auth_id, deck_id, correct_counts):
+        """Add correct answers to one of a user's decks' cards; how many answers went to cards that were found, None without the deck"""
+        row = self._deck_row(connection, auth_id, deck_id)
+        if row is None:
+            return None
+        subscription = self._subscription(row)
+        if subscription is not None:
+            public_cards, overlay = subscription
+            recorded = overlay_record_answers(overlay, correct_counts, public_cards)
+            if recorded:
+                connection.execute("UPDATE decks SET overlay = ? WHERE id = ?", (json.dumps(overlay), deck_id))
+            return recorded
+        card_ids = list(correct_counts)
+        found = {card_id for (card_id,) in connection.execute(
+            f"SELECT card_id FROM cards WHERE deck_id = ? AND card_id IN ({', '.join('?' * len(card_ids))})",
+            [deck_id, *card_ids]
+        )}
+        connection.executemany(
+            "UPDATE cards SET correct_answers = correct_answers + ? WHERE deck_id = ? AND card_id = ?",
+            [(correct_counts[card_id], deck_id, card_id) for card_id in found]
+        )
+        return sum(correct_counts[card_id] for card_id in found)
+
+    def _touch(self, connection, auth_id, deck_id):
+        connection.execute("UPDATE decks SET updated_at = ? WHERE id = ?", (datetime.datetime.utcnow().isoformat(), deck_id))
+        self._bump(connection, auth_id)
+
+    def _publish(self, auth_id, deck_id, name, card_documents):
+        published = {}
+
+        def publish(connection):
+            now = datetime.datetime.utcnow().isoformat()
+            row = connection.execute("SELECT id, version FROM public_decks WHERE owner_auth_id = ? AND source_deck_id = ?",
+                                     (auth_id, deck_id)).fetchone()
+            public_id, version = (row[0], row[1] + 1) if row else (new_deck_id(), 1)
+            if row:
+                connection.execute("UPDATE public_decks SET name = ?, version = ?, card_count = ?, updated_at = ? WHERE id = ?",
+                                   (name, version, len(card_documents), now, public_id))
+            else:
+                connection.execute(f"INSERT INTO public_decks ({PUBLIC_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, 0, ?, ?)",
+                                   (public_id, auth_id, deck_id, name, version, len(card_documents), now, now))
+            connection.executemany(
+                "INSERT INTO public_cards (public_id, version, position, card_id, question, answer, reversible) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(public_id, version, position, card_data['card_id'], card_data['question'], card_data['answer'], int(card_data['reversible']))
+                 for position, card_data in enumerate(card_documents)]
+            )
+            if self.full_text_search:
+                self._index_public_deck(connection, public_id, name, deck_search_text(card_documents))
+            published['public_id'] = public_id
+
+        if not self._write("publishing deck", publish):
+            return None
+        return self.get_public_deck(published['public_id'])
+
+    def get_public_deck(self, public_id):
+        try:
+            row = self._connection().execute(f"SELECT {PUBLIC_COLUMNS} FROM public_decks WHERE id = ?", (public_id,)).fetchone()
+            return public_deck_from_row(row) if row else None
+        except Exception as ex:
+            print(f"Error getting public deck from SQLite: {ex}")
+            return None
+
+    def list_public_decks(self, offset=0, limit=20):
+        try:
+            rows = self._connection().execute(
+                f"SELECT {PUBLIC_COLUMNS} FROM public_decks ORDER BY updated_at DESC LIMIT ? OFFSET ?", (limit, offset)
+            )
+            return [public_deck_from_row(row) for row in rows]
+        except Exception as ex:
+            print(f"Error listing public decks from SQLite: {ex}")
+            return []
+
+    def search_public_decks(self, query, offset=0, limit=20):
+        words = list(dict.fromkeys(search_words(query)))
+        if not words:
+            return []
+        try:
+            if self.full_text_search:
+                # Ranking and paging happen inside the full-text index; only the page's decks are looked up
+                rows = self._connection().execute(
+                    f"SELECT {PUBLIC_COLUMNS} FROM"
+                    " (SELECT rowid, rank FROM public_search WHERE public_search MATCH ? ORDER BY rank LIMIT ? OFFSET ?) AS matches"
+                    " JOIN public_decks ON public_decks.search_rowid = matches.rowid ORDER BY matches.rank",
+                    (" OR ".join(f'"{word}"' for word in words), limit, offset)
+                )
+            else:
+                rows = self._connection().execute(
+                    f"SELECT {PUBLIC_COLUMNS} FROM public_decks WHERE {' OR '.join(['name LIKE ?'] * len(words))}"
+                    " ORDER BY updated_at DESC LIMIT ? OFFSET ?",
+                    [f"%{word}%" for word in words] + [limit, offset]
+                )
+            return [public_deck_from_row(row) for row in rows]
+        except Exception as ex:
+            print(f"Error searching public decks in SQLite: {ex}")
+            return []
+
+    def get_published_deck(self, auth_id, deck_id):
+        try:
+            row = self._connection().execute(
+                f"SELECT {PUBLIC_COLUMNS} FROM public_decks WHERE owner_auth_id = ? AND source_deck_id = ?", (auth_id, deck_id)
+            ).fetchone()
+            return public_deck_from_row(row) if row else None
+        except Exception as ex:
+            print(f"Error getting public deck from SQLite: {ex}")
+            return None
+
+    def _load_public_cards(self, public_id, version):
+        rows = self._connection().execute(
+            "SELECT card_id, question, answer, 0, reversible FROM public_cards WHERE public_id = ? AND version = ? ORDER BY position",
+            (public_id, version)
+        ).fetchall()
+        if not rows and self.get_public_deck(public_id) is None:
+            return None
+        return [card_document_from_row(row) for row in rows]
+
+    def subscribe(self, auth_id, public_id):
+        deck_ids = []
+
+        def subscribe(connection):
+            public = connection.execute("SELECT name, version, card_count FROM public_decks WHERE id = ?", (public_id,)).fetchone()
+            if public is None or connection.execute("SELECT 1 FROM users WHERE auth_id = ?", (auth_id,)).fetchone() is None:
+                return False
+            now = datetime.datetime.utcnow().isoformat()
+            deck_ids.append(new_deck_id())
+            connection.execute(
+                "INSERT INTO decks (id, user_auth_id, name, experience, created_at, updated_at, source_id, source_version, overlay, card_count)"
+                " VALUES (?, ?, ?, 0, ?, ?, ?, ?, ?, ?)",
+                (deck_ids[0], auth_id, public[0], now, now, public_id, public[1], json.dumps(empty_overlay()), public[2])
+            )
+            connection.execute("UPDATE public_decks SET subscriptions = subscriptions + 1 WHERE id = ?", (public_id,))
+            self._bump(connection, auth_id)
+
+        return deck_ids[0] if self._write("subscribing to deck", subscribe) else None
+
+    def get_deck_source(self, auth_id, deck_id):
+        try:
+            row = self._deck_row(self._connection(), auth_id, deck_id)
+        except Exception as ex:
+            print(f"Error getting deck from SQLite: {ex}")
+            return None
+        return {"public_id": row[2], "version": row[3]} if row and row[2] is not None else None
+
+    def update_subscription(self, auth_id, deck_id):
+        def update(connection):
+            row = self._deck_row(connection, auth_id, deck_id)
+            if row is None or row[2] is None:
+                return False
+            public = connection.execute("SELECT version FROM public_decks WHERE id = ?", (row[2],)).fetchone()
+            if public is None or public[0] == row[3]:
+                return True
+            overlay = json.loads(row[4])
+            public_cards = self.get_public_cards(row[2], public[0]) or PublicCards(())
+            connection.execute("UPDATE decks SET source_version = ?, card_count = ? WHERE id = ?",
+                               (public[0], overlay_card_count(public_cards, overlay), deck_id))
+            self._bump(connection, auth_id)
+
+        return self._write("updating subscription", update)
+
+    def stats(self):
+        try:
+            connection = self._connection()
+            users, decks, cards, public_decks = connection.execute(
+                "SELECT (SELECT COUNT(*) FROM users), (SELECT COUNT(*) FROM decks), (SELECT COUNT(*) FROM cards),"
+                " (SELECT COUNT(*) FROM public_decks)"
+            ).fetchone()
+        except Exception as ex:
+            print(f"Error getting stats from SQLite: {ex}")
+            users = decks = cards = public_decks = None
+        return {"backend": self.backend, "path": os.path.abspath(self.path), "users": users, "decks": decks, "cards": cards,
+                "public_decks": public_decks, "public_cards": self.public_cards.stats(), "full_text_search": self.full_text_search}
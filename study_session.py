@@ -0,0 +1,268 @@
+# File used for
+#     - building the card list of a study session (question, answer mode, answer choices)
+#     - picking wrong answers from a pool built once per session instead of once per card
+#     - preferring wrong answers that look like the right one when the deck's answer index is given
+#     - splitting a session into a plan (cacheable per deck version) and a cheap random deal per request
+#     - planning lazily, card by card, including the reverse direction of reversible cards
+
+import random
+from collections import deque
+
+try:
+    import numpy
+except ImportError:  # NumPy is optional; without it distractors are drawn card by card
+    numpy = None
+
+# Decks at least this big draw all their distractors in one NumPy call when NumPy is installed
+NUMPY_MIN_CARDS = 2000
+
+# Number of wrong choices shown next to the right one in multiple choice mode
+WRONG_CHOICES = 3
+
+# Wrong choices are drawn from this many candidates (the most similar answers when an
+# answer index is given), so sessions dealt from the same plan still vary
+SIMILAR_CANDIDATES = 6
+
+# A reversible card is asked the other way round this many cards after it was asked forwards
+REVERSE_DELAY = 10
+
+# Rough size of a planned card's dict and list, in bytes
+PLANNED_CARD_OVERHEAD = 700
+
+
+class AnswerPool:
+    """The distinct answers of a deck, with where each one is used"""
+
+    def __init__(self, answers):
+        self.answers = []
+        self.index = {}       # answer -> position in self.answers
+        self.positions = {}   # answer -> positions of the cards that have it
+        for card_position, answer in enumerate(answers):
+            if answer not in self.index:
+                self.index[answer] = len(self.answers)
+                self.answers.append(answer)
+                self.positions[answer] = []
+            self.positions[answer].append(card_position)
+
+    def __len__(self):
+        return len(self.answers)
+
+    def sample_wrong(self, correct_answer, count, rng=random):
+        """Pick up to count distinct answers other than correct_answer, in O(count) expected time"""
+        own = self.index.get(correct_answer)
+        available = len(self.answers) - (own is not None)
+        count = min(count, available)
+        if count <= 0:
+            return []
+        if count * 2 > available:
+            # Few answers to choose from: rejection would keep hitting the same ones
+            return rng.sample([answer for answer in self.answers if answer != correct_answer], count)
+
+        chosen = []
+        total = len(self.answers)
+        random_float = rng.random
+        while len(chosen) < count:
+            position = int(random_float() * total)
+            if position != own and position not in chosen:
+                chosen.append(position)
+        return [self.answers[position] for position in chosen]
+
+    def sample_wrong_batch(self, correct_answers, count, seed=None):
+        """Pick count wrong answers for every correct answer at once with NumPy
+
+        Returns a list of answer lists. Needs at least count + 1 distinct answers.
+        Each row draws from a shrinking range and shifts past the answers already
+        excluded (its own answer first), so draws are distinct without rejection.
+        """
+        generator = numpy.random.default_rng(seed)
+        total = len(self.answers)
+        excluded = numpy.array([self.index[answer] for answer in correct_answers], dtype=numpy.int64)[:, None]
+        picks = []
+        for drawn in range(count):
+            pick = generator.integers(0, total - 1 - drawn, size=len(excluded))
+            for column in range(excluded.shape[1]):
+                pick += pick >= excluded[:, column]
+            picks.append(pick)
+            excluded = numpy.sort(numpy.concatenate([excluded, pick[:, None]], axis=1), axis=1)
+        answers = self.answers
+        return [[answers[position] for position in row] for row in numpy.stack(picks, axis=1).tolist()]
+
+
+def with_answer_shuffled_in(answer, wrong_answers, rng):
+    """Insert the right answer at a random position among wrong answers that are already in random order
+
+    This gives the same distribution as shuffling all of them, for a fraction of the cost.
+    """
+    slot = int(rng.random() * (len(wrong_answers) + 1))
+    return wrong_answers[:slot] + [answer] + wrong_answers[slot:]
+
+
+def deck_answers(deck):
+    """The answer of every card, without building Flashcards for columnar decks"""
+    answers = getattr(deck.flashcards, 'answers', None)
+    return answers if answers is not None else [card.answer for card in deck.flashcards]
+
+
+def deck_questions(deck):
+    """The question of every card, without building Flashcards for columnar decks"""
+    questions = getattr(deck.flashcards, 'questions', None)
+    return questions if questions is not None else [card.question for card in deck.flashcards]
+
+
+def count_session_cards(deck):
+    """How many entries a session of the deck has: one per card, plus one per reversible card"""
+    flashcards = deck.flashcards
+    if hasattr(flashcards, 'reversible_count'):
+        return len(flashcards) + flashcards.reversible_count()
+    return len(flashcards) + sum(1 for card in flashcards if card.reversible)
+
+
+def similar_candidates(index, get_pool, correct_answer, rng):
+    """The answers most similar to correct_answer, topped up at random to at least WRONG_CHOICES"""
+    candidates = index.similar(correct_answer, SIMILAR_CANDIDATES)
+    if len(candidates) < WRONG_CHOICES:
+        for answer in get_pool().sample_wrong(correct_answer, WRONG_CHOICES + len(candidates), rng):
+            if answer not in candidates:
+                candidates.append(answer)
+                if len(candidates) == WRONG_CHOICES:
+                    break
+    return candidates
+
+
+def iter_session_plan(deck, answer_index=None, load_question_index=None, use_numpy=None, rng=random):
+    """Plan a study session card by card, only as far as the cards are asked for
+
+    Yields one entry per card, in deck order, with its answer mode and the wrong answers
+    it may show ('candidates'). deal_choices picks the actual choices, so a plan can be
+    cached per deck version and dealt differently on every request. A reversible card
+    also gets a reverse entry (its answer asked, its question expected) REVERSE_DELAY
+    entries after the forward one, planned when it is reached.
+
+    With an AnswerIndex of the deck's answers, candidates are the answers most similar
+    to the right one instead of random ones; load_question_index returns the same for
+    questions and is only called once a reverse entry needs it.
+    """
+    flashcards = deck.flashcards
+    card_count = len(flashcards)
+    pools = {}
+    indexes = {'forward': answer_index}
+
+    def get_pool(direction):
+        # Built the first time a card of this direction needs random wrong answers
+        if direction not in pools:
+            pools[direction] = AnswerPool(deck_answers(deck) if direction == 'forward' else deck_questions(deck))
+        return pools[direction]
+
+    def get_index(direction):
+        if direction not in indexes:
+            indexes[direction] = load_question_index() if load_question_index is not None else None
+        return indexes[direction]
+
+    if use_numpy is None:
+        use_numpy = numpy is not None and card_count >= NUMPY_MIN_CARDS
+    batch_candidates = None
+    if use_numpy and answer_index is None and numpy is not None and card_count >= 4 and len(get_pool('forward')) > SIMILAR_CANDIDATES:
+        batch_candidates = get_pool('forward').sample_wrong_batch(deck_answers(deck), SIMILAR_CANDIDATES, rng.getrandbits(64))
+
+    def plan_card(card, direction, position=None):
+        if direction == 'forward':
+            question, answer = card.question, card.answer
+        else:
+            question, answer = card.answer, card.question
+        card_data = {
+            'card_id': card.card_id,
+            'question': question,
+            'correct_answer': answer,
+            'correct_count': card.correct_answers,
+            'reversible': card.reversible,
+            'direction': direction
+        }
+
+        # Determine answer mode based on correct answers and deck size
+        if card.correct_answers > 5:
+            # Guaranteed typed answer if >5 correct answers
+            card_data['answer_mode'] = 'typed'
+            card_data['candidates'] = []
+        elif card_count < 4:
+            # True/False mode for small decks: the false answer is any different answer
+            card_data['answer_mode'] = 'true_false'
+            pool = get_pool(direction)
+            card_data['candidates'] = pool.sample_wrong(answer, len(pool), rng) or ["False answer"]
+        else:
+            # Multiple choice mode
+            card_data['answer_mode'] = 'multiple_choice'
+            index = get_index(direction)
+            if batch_candidates is not None and position is not None:
+                candidates = batch_candidates[position]
+            elif index is not None:
+                candidates = similar_candidates(index, lambda: get_pool(direction), answer, rng)
+            else:
+                candidates = get_pool(direction).sample_wrong(answer, SIMILAR_CANDIDATES, rng)
+
+            # If we don't have enough wrong answers, generate some generic ones
+            while len(candidates) < WRONG_CHOICES:
+                candidates.append(f"Option {len(candidates) + 1}")
+            card_data['candidates'] = candidates
+        return card_data
+
+    reverse_due = deque()  # (entry number it is due at, card) for reverse entries not planned yet
+    planned = 0
+    for position, card in enumerate(flashcards):
+        while reverse_due and reverse_due[0][0] <= planned:
+            yield plan_card(reverse_due.popleft()[1], 'reverse')
+            planned += 1
+        yield plan_card(card, 'forward', position)
+        planned += 1
+        if card.reversible:
+            reverse_due.append((planned + REVERSE_DELAY, card))
+    for _, card in reverse_due:
+        yield plan_card(card, 'reverse')
+
+
+def build_session_plan(deck, answer_index=None, use_numpy=None, rng=random, load_question_index=None):
+    """Plan a whole study session at once (see iter_session_plan)"""
+    return list(iter_session_plan(deck, answer_index, load_question_index, use_numpy, rng))
+
+
+def deal_choices(card_data, rng=random):
+    """Pick the choices shown for one planned card, in random order"""
+    candidates = card_data['candidates']
+    if card_data['answer_mode'] == 'typed':
+        return []
+    if card_data['answer_mode'] == 'true_false':
+        false_answer = candidates[int(rng.random() * len(candidates))] if candidates else "False answer"
+        return with_answer_shuffled_in(card_data['correct_answer'], [false_answer], rng)
+    # Partial Fisher-Yates: the first WRONG_CHOICES slots end up a random sample in random order
+    picked = list(candidates)
+    while len(picked) < WRONG_CHOICES:
+        picked.append(f"Option {len(picked) + 1}")
+    total = len(picked)
+    for i in range(WRONG_CHOICES):
+        j = i + int(rng.random() * (total - i))
+        picked[i], picked[j] = picked[j], picked[i]
+    return with_answer_shuffled_in(card_data['correct_answer'], picked[:WRONG_CHOICES], rng)
+
+
+def deal_session(plan, rng=random):
+    """Turn a session plan into study data with answer choices for each card"""
+    study_data = []
+    for card_data in plan:
+        dealt = dict(card_data)
+        del dealt['candidates']
+        dealt['choices'] = deal_choices(card_data, rng)
+        study_data.append(dealt)
+    return study_data
+
+
+def generate_study_session(deck, rng=random, use_numpy=None, answer_index=None):
+    """Generate study session data with answer choices for each card."""
+    return deal_session(build_session_plan(deck, answer_index, use_numpy, rng), rng)
+
+
+def estimate_plan_size(plan):
+    """Estimate how many bytes a session plan keeps alive, for the cache's memory budget"""
+    size = 0
+    for card_data in plan:
+        size += PLANNED_CARD_OVERHEAD + len(card_data['question']) + len(card_data['correct_answer'])
+        size += sum(len(answer) for answer in card_data['candidates'])
+    return size
@@ -0,0 +1,33 @@
+# Reading decks from CSV and packing them: counts read from a file must fit the formats that store them.
+
+import io
+
+import pytest
+
+from datacompression import CardColumns, decode_deck, pack_deck, read_deck_lazily, unpack_deck
+
+
+def test_counts_round_trip():
+    deck = decode_deck("Deck,4294967295\nquestion,answer,4294967295,true\n")
+    assert deck.experience == 2**32 - 1 and deck.flashcards[0].correct_answers == 2**32 - 1
+    packed = unpack_deck(pack_deck(deck))
+    assert packed.experience == deck.experience and packed.flashcards[0].correct_answers == 2**32 - 1
+    assert CardColumns(deck.flashcards)[0].correct_answers == 2**32 - 1
+
+
+@pytest.mark.parametrize("text", [
+    "Deck,-1\nquestion,answer\n",
+    "Deck,4294967296\nquestion,answer\n",
+    "Deck,0\nquestion,answer,-1\n",
+    "Deck,0\nquestion,answer,99999999999\n",
+    "Deck,0\nquestion,answer,lots\n",
+])
+def test_out_of_range_counts_are_rejected(text):
+    with pytest.raises(ValueError):
+        name, experience, cards = read_deck_lazily(io.StringIO(text, newline=''))
+        list(cards)
+
+
+def test_blank_counts_are_zero():
+    deck = decode_deck("Deck,\nquestion,answer, ,\n")
+    assert deck.experience == 0 and deck.flashcards[0].correct_answers == 0
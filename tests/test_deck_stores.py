@@ -0,0 +1,207 @@
+# Conformance of the DeckStore interface: every backend must give the same results for everything
+# the app does with decks, including public decks and subscriptions.
+#
+# The memory and SQLite backends always run, with cards held both as lists and as columns. MongoDB runs
+# when a server answers at MONGO_URI (a throwaway database is used and dropped afterwards).
+
+import os
+
+import pytest
+
+from datacompression import Deck, Flashcard
+from deck_store import DeckList, MemoryDeckStore
+
+MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017/")
+
+
+@pytest.fixture(params=["memory", "memory-columnar", "sqlite", "sqlite-columnar", "mongo"])
+def store(request, tmp_path):
+    backend, _, layout = request.param.partition("-")
+    # Threshold 1 keeps every loaded deck in columns
+    columnar_threshold = 1 if layout == "columnar" else 1000
+    if backend == "memory":
+        yield MemoryDeckStore(columnar_threshold)
+    elif backend == "sqlite":
+        from sqlite_deck_store import SQLiteDeckStore
+        yield SQLiteDeckStore(str(tmp_path / "decks.sqlite3"), columnar_threshold)
+    else:
+        from mongo_deck_store import MongoDeckStore
+        try:
+            mongo_store = MongoDeckStore.connect(MONGO_URI, columnar_threshold)
+        except Exception as ex:
+            pytest.skip(f"MongoDB not available: {str(ex).splitlines()[0][:80]}")
+        from indexes import ensure_indexes
+        mongo_store.db = mongo_store.db.client.get_database(f"studystack_test_{os.getpid()}")
+        ensure_indexes(mongo_store.db)
+        yield mongo_store
+        mongo_store.db.client.drop_database(mongo_store.db.name)
+
+
+def cards(prefix, count):
+    return [Flashcard(f"{prefix} question {i}", f"{prefix} answer {i}", 0, i % 2 == 0) for i in range(count)]
+
+
+def test_conformance(store):
+    """Walk one user through everything the app does with decks, checking each result"""
+    auth_id = "conformance-user"
+    assert store.get_deck_version(auth_id) is None, "unknown users have no deck version"
+    assert not store.save_decks(auth_id, DeckList([Deck("Orphan", [])])), "saving decks needs an existing user"
+    assert store.upsert_user(auth_id, "user@example.com", "User"), "upsert_user creates the user"
+    assert store.upsert_user(auth_id, "user@example.com", "Renamed"), "upsert_user updates the user"
+    assert store.get_user(auth_id)["name"] == "Renamed", "get_user returns the latest details"
+    version = store.get_deck_version(auth_id)
+    assert store.load_decks(auth_id) == [], "new users have no decks"
+
+    decks = DeckList([Deck("First", cards("first", 5)), Deck("Second", cards("second", 3), 4)])
+    assert store.save_decks(auth_id, decks), "save_decks inserts new decks"
+    first_id, second_id = decks[0]._id, decks[1]._id
+    assert first_id and second_id and first_id != second_id, "new decks get distinct IDs"
+    assert store.get_deck_version(auth_id) > version, "saves bump the deck version"
+
+    loaded = store.load_decks(auth_id)
+    assert [deck._id for deck in loaded] == [first_id, second_id], "decks load in creation order"
+    assert [card.question for card in loaded[0].flashcards] == [card.question for card in decks[0].flashcards], "cards load in order"
+    assert loaded[1].experience == 4, "experience is stored"
+    assert ([(summary.name, summary.card_count, summary.experience) for summary in store.get_deck_summaries(auth_id)]
+            == [("First", 5, 0), ("Second", 3, 4)]), "summaries count cards"
+
+    # Edit, remove, append and rename in one save
+    deck = loaded[0]
+    deck.name = "First, renamed"
+    deck.flashcards[1].answer = "changed answer"
+    removed_id = deck.flashcards[2].card_id
+    del deck.flashcards[2]
+    deck.flashcards.extend(cards("extra", 2))
+    deck.experience += 3
+    version = store.get_deck_version(auth_id)
+    assert store.save_decks(auth_id, loaded), "save_decks updates loaded decks"
+    assert store.get_deck_version(auth_id) > version, "updates bump the deck version"
+    reloaded = store.load_deck(auth_id, first_id)
+    assert reloaded.name == "First, renamed" and reloaded.experience == 3, "name and experience are updated"
+    assert [card.card_id for card in reloaded.flashcards] == [card.card_id for card in deck.flashcards], "removed and appended cards are saved in order"
+    assert reloaded.flashcards[1].answer == "changed answer", "edited cards are saved"
+    assert store.get_card(auth_id, first_id, removed_id) is None, "removed cards are gone"
+
+    # Reordering rewrites the card list
+    reloaded.flashcards.reverse()
+    assert store.save_decks(auth_id, DeckList([reloaded, store.load_deck(auth_id, second_id)], [first_id, second_id])), "reordered decks save"
+    assert ([card.card_id for card in store.load_deck(auth_id, first_id).flashcards]
+            == [card.card_id for card in reloaded.flashcards]), "new card order is saved"
+
+    # Saving without changes writes nothing
+    version = store.get_deck_version(auth_id)
+    assert store.save_decks(auth_id, store.load_decks(auth_id)), "saving unchanged decks succeeds"
+    assert store.get_deck_version(auth_id) == version, "saving unchanged decks does not bump the version"
+
+    # Single-card reads and writes
+    first_card = reloaded.flashcards[0]
+    assert store.get_card(auth_id, first_id, first_card.card_id).question == first_card.question, "get_card finds cards"
+    assert store.get_card_id(auth_id, first_id, 0) == first_card.card_id, "get_card_id finds positions"
+    assert store.get_card_id(auth_id, first_id, 100) is None, "get_card_id past the end is None"
+    summary, page = store.get_deck_page(auth_id, first_id, 1, 2)
+    assert summary.card_count == 6 and [card.card_id for card in page] == [card.card_id for card in reloaded.flashcards[1:3]], "get_deck_page slices cards"
+    assert store.get_deck_page(auth_id, "0" * 24, 0, 10) == (None, []), "missing decks have no page"
+
+    assert store.add_cards(auth_id, second_id, cards("added", 2)), "add_cards appends"
+    assert len(store.load_deck(auth_id, second_id).flashcards) == 5, "added cards are stored"
+    assert not store.add_cards(auth_id, "0" * 24, cards("lost", 1)), "add_cards to a missing deck fails"
+    second_cards = store.load_deck(auth_id, second_id).flashcards
+    assert store.delete_card(auth_id, second_id, second_cards[0].card_id), "delete_card removes cards"
+    assert not store.delete_card(auth_id, second_id, second_cards[0].card_id), "deleting a missing card reports it"
+    assert len(store.load_deck(auth_id, second_id).flashcards) == 4, "deleted cards are gone"
+
+    # Progress
+    target = second_cards[1].card_id
+    assert store.record_answers(auth_id, second_id, {target: 2}), "record_answers succeeds"
+    assert store.record_correct_answer(auth_id, second_id, target), "record_correct_answer succeeds"
+    assert not store.record_correct_answer(auth_id, second_id, "no-such-card"), "stale card IDs change nothing"
+    assert store.record_answers(auth_id, second_id, {"no-such-card": 5}), "record_answers skips stale card IDs"
+    assert store.get_card(auth_id, second_id, target).correct_answers == 3, "correct answers add up"
+    assert store.load_deck(auth_id, second_id).experience == 4 + 3, "experience adds up"
+
+    # Other users can't see or touch the decks
+    assert store.upsert_user("someone-else", "other@example.com"), "a second user is created"
+    assert store.load_deck("someone-else", first_id) is None, "decks belong to their user"
+    assert not store.delete_deck("someone-else", first_id), "other users can't delete decks"
+
+    # Decks missing from a saved list are deleted, as is a deck deleted directly
+    remaining = store.load_decks(auth_id)
+    assert store.save_decks(auth_id, DeckList(remaining[1:], remaining.loaded_ids)), "saving a shorter list succeeds"
+    assert [deck._id for deck in store.load_decks(auth_id)] == [second_id], "decks left out of a save are deleted"
+    assert store.delete_deck(auth_id, second_id), "delete_deck removes decks"
+    assert store.load_decks(auth_id) == [] and store.get_card(auth_id, second_id, target) is None, "deleted decks take their cards with them"
+
+
+def test_public_decks(store):
+    """Publish a deck, subscribe to it, change the subscription locally and follow a new version"""
+    owner, subscriber = "publishing-user", "subscribing-user"
+    store.upsert_user(owner, "owner@example.com")
+    store.upsert_user(subscriber, "subscriber@example.com")
+    decks = DeckList([Deck("Shared", cards("shared", 4))])
+    store.save_decks(owner, decks)
+    owner_deck = store.load_deck(owner, decks[0]._id)
+    assert store.record_correct_answer(owner, owner_deck._id, owner_deck.flashcards[0].card_id), "the owner studies the deck"
+
+    assert store.publish_deck(owner, "0" * 24) is None, "missing decks can't be published"
+    public = store.publish_deck(owner, owner_deck._id)
+    assert public and public["version"] == 1 and public["card_count"] == 4, "publishing creates version 1"
+    assert store.get_published_deck(owner, owner_deck._id)["public_id"] == public["public_id"], "the owner's deck knows its public deck"
+    assert [listed["public_id"] for listed in store.list_public_decks()] == [public["public_id"]], "public decks are listed"
+    assert store.subscribe(subscriber, "0" * 24) is None, "missing public decks can't be subscribed to"
+
+    deck_id = store.subscribe(subscriber, public["public_id"])
+    assert deck_id is not None, "subscribing gives the user a deck"
+    assert store.get_public_deck(public["public_id"])["subscriptions"] == 1, "subscriptions are counted"
+    assert store.get_deck_source(subscriber, deck_id) == {"public_id": public["public_id"], "version": 1}, "the deck follows version 1"
+    deck = store.load_deck(subscriber, deck_id)
+    assert [card.card_id for card in deck.flashcards] == [card.card_id for card in owner_deck.flashcards], "subscribers see the public cards"
+    assert all(card.correct_answers == 0 for card in deck.flashcards), "the owner's progress is not published"
+
+    # Progress, edits, removals and additions stay in the subscriber's overlay
+    first, second, third = (card.card_id for card in deck.flashcards[:3])
+    assert store.record_answers(subscriber, deck_id, {first: 2}), "subscribers record answers"
+    assert store.record_correct_answer(subscriber, deck_id, first), "subscribers record single answers"
+    assert not store.record_correct_answer(subscriber, deck_id, "no-such-card"), "stale card IDs change nothing in overlays"
+    assert store.record_answers(subscriber, deck_id, {"no-such-card": 5}), "record_answers skips stale card IDs in overlays"
+    assert store.get_card(subscriber, deck_id, first).correct_answers == 3, "overlay progress adds up"
+    assert store.load_deck(subscriber, deck_id).experience == 3, "overlay experience only counts known cards"
+    assert store.delete_card(subscriber, deck_id, second), "subscribers delete public cards"
+    assert not store.delete_card(subscriber, deck_id, second), "deleting a hidden public card reports it missing"
+    assert store.add_cards(subscriber, deck_id, cards("own", 1)), "subscribers add their own cards"
+    deck = store.load_deck(subscriber, deck_id)
+    deck.flashcards[1].answer = "my answer"
+    deck.flashcards[-1].question = "my question"
+    assert store.save_decks(subscriber, DeckList([deck], [deck_id])), "subscribed decks save"
+    deck = store.load_deck(subscriber, deck_id)
+    assert len(deck.flashcards) == 4 and second not in [card.card_id for card in deck.flashcards], "removed public cards stay hidden"
+    assert deck.flashcards[1].card_id == third and deck.flashcards[1].answer == "my answer", "local edits are kept"
+    assert deck.flashcards[-1].question == "my question", "the subscriber's own cards are editable"
+    assert deck.experience == 3, "subscribed decks earn experience"
+    assert store.get_deck_summaries(subscriber)[0].card_count == 4, "summaries count overlay cards"
+    assert store.get_card_id(subscriber, deck_id, 3) == deck.flashcards[3].card_id, "get_card_id reads overlay cards"
+    assert store.load_deck(owner, owner_deck._id).flashcards[2].answer == owner_deck.flashcards[2].answer, "local edits don't reach the public deck"
+
+    # A new version leaves subscribers where they were until they update
+    owner_deck = store.load_deck(owner, owner_deck._id)
+    owner_deck.flashcards[0].question = "better question"
+    owner_deck.flashcards.append(cards("late", 1)[0])
+    store.save_decks(owner, DeckList([owner_deck], [owner_deck._id]))
+    assert store.publish_deck(owner, owner_deck._id)["version"] == 2, "publishing again creates version 2"
+    assert [found["public_id"] for found in store.search_public_decks("Better shared")] == [public["public_id"]], "search finds public decks by name and latest cards"
+    assert store.search_public_decks("nosuchword") == [] and store.search_public_decks("  ") == [], "search without matches is empty"
+    assert store.load_deck(subscriber, deck_id).flashcards[0].question != "better question", "subscribers keep their version"
+    assert store.update_subscription(subscriber, deck_id), "update_subscription succeeds"
+    deck = store.load_deck(subscriber, deck_id)
+    assert store.get_deck_source(subscriber, deck_id)["version"] == 2, "the deck follows version 2"
+    assert deck.flashcards[0].question == "better question" and deck.flashcards[0].correct_answers == 3, "updates bring new cards and keep progress"
+    assert len(deck.flashcards) == 5 and deck.flashcards[1].answer == "my answer", "updates keep local edits and removals"
+    summary, page = store.get_deck_page(subscriber, deck_id, 4, 10)
+    assert summary.card_count == 5 and len(page) == 1, "pages of subscribed decks"
+
+    # Reordering turns the subscription into a deck of its own
+    deck.flashcards.reverse()
+    assert store.save_decks(subscriber, DeckList([deck], [deck_id])), "reordered subscriptions save"
+    assert store.get_deck_source(subscriber, deck_id) is None, "reordered decks no longer follow the public deck"
+    assert [card.card_id for card in store.load_deck(subscriber, deck_id).flashcards] == [card.card_id for card in deck.flashcards], "the reordered cards are kept"
+    assert store.record_correct_answer(subscriber, deck_id, deck.flashcards[0].card_id), "detached decks record answers"
+    assert not store.update_subscription(subscriber, deck_id), "detached decks can't be updated"
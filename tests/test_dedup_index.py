@@ -0,0 +1,40 @@
+# Finding duplicate cards (dedup_index.py): reworded copies of a card are caught, while cards that
+# only differ in an operator, a number or their answer are kept.
+
+import pytest
+
+from dedup_index import DedupIndex, NewCardFilter
+
+
+@pytest.mark.parametrize("question, answer", [
+    ("What is 5 - 3?", "2"),
+    ("What is 5 * 3?", "15"),
+    ("What is 5 + 3?", "eight hundred"),
+    ("What is 5 + 4?", "8"),
+    ("What is 1.5 + 3?", "8"),
+])
+def test_cards_asking_something_else_are_kept(question, answer):
+    assert DedupIndex([("What is 5 + 3?", "8")]).find_duplicate(question, answer) is None
+
+
+@pytest.mark.parametrize("question, answer", [
+    ("what is 5+3", "8"),
+    ("WHAT IS 5 + 3?", "8."),
+    ("What is 5 + 3 exactly?", "8"),
+])
+def test_reworded_copies_are_caught(question, answer):
+    assert DedupIndex([("What is 5 + 3?", "8")]).find_duplicate(question, answer) == ("What is 5 + 3?", "8")
+
+
+def test_reworded_questions_are_caught():
+    index = DedupIndex([("What is the capital of France?", "Paris")])
+    for question in ["What's the capital of France?", "  What  is  the  capital  of  France ?",
+                     "What is the capital of France exactly?"]:
+        assert index.find_duplicate(question, "Paris") == ("What is the capital of France?", "Paris")
+    assert index.find_duplicate("What is the capital of France?", "Lyon") is None
+
+
+def test_numbered_cards_are_all_kept():
+    new_cards = NewCardFilter(DedupIndex())
+    assert sum(new_cards.accept(f"question number {i}", f"answer {i}") for i in range(1200)) == 1200
+    assert not new_cards.accept("Question number 7?", "answer 7")
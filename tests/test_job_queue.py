@@ -0,0 +1,100 @@
+# The background job queue behind AI deck expansion: jobs get an ID at once and run off the request
+# thread, failures are recorded instead of lost, the queue stays bounded, and jobs are only shown to
+# their owner. The last test runs a real expansion prompt through the queue against the stub LLM server.
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+from job_queue import JobQueue, QueueFull
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from stub_llm_server import start_stub_server
+
+
+def test_submit_returns_at_once_and_runs_in_the_background():
+    release = threading.Event()
+    jobs = JobQueue(workers=1)
+    started = time.perf_counter()
+    job_id = jobs.submit(lambda: release.wait(5) and "finished")
+    assert time.perf_counter() - started < 0.5, "submitting doesn't wait for the job"
+    assert jobs.get(job_id).status in ("queued", "running")
+    release.set()
+    job = jobs.wait(job_id, timeout=5)
+    assert job.status == "done" and job.result == "finished"
+    assert job.to_dict()["result"] == "finished"
+    assert job.function is None and job.args is None, "finished jobs let go of their arguments"
+
+
+def test_failures_are_recorded():
+    def fail():
+        raise RuntimeError("could not save the generated cards")
+
+    jobs = JobQueue(workers=1)
+    job = jobs.wait(jobs.submit(fail), timeout=5)
+    assert job.status == "failed" and job.error == "could not save the generated cards"
+    stats = jobs.stats()
+    assert stats["failed"] == 1 and stats["completed"] == 0 and stats["failure_rate"] == 1.0
+
+
+def test_full_queue_rejects_jobs():
+    release = threading.Event()
+    jobs = JobQueue(workers=1, max_queued=2)
+    running = jobs.submit(release.wait, 5)
+    while jobs.get(running).status != "running":
+        time.sleep(0.01)
+    waiting = [jobs.submit(release.wait, 5) for _ in range(2)]
+    with pytest.raises(QueueFull):
+        jobs.submit(release.wait, 5)
+    assert jobs.stats()["rejected"] == 1 and jobs.stats()["queued"] == 2
+    release.set()
+    for job_id in [running] + waiting:
+        assert jobs.wait(job_id, timeout=5).status == "done"
+    assert jobs.stats()["completed"] == 3
+
+
+def test_jobs_are_only_shown_to_their_owner():
+    jobs = JobQueue(workers=1)
+    job_id = jobs.submit(lambda: 1, owner="user-a", kind="expand_deck")
+    assert jobs.get(job_id, owner="user-a").kind == "expand_deck"
+    assert jobs.get(job_id, owner="user-b") is None
+    assert jobs.get("no-such-job") is None
+
+
+def test_old_finished_jobs_are_forgotten():
+    jobs = JobQueue(workers=1, keep_finished=2)
+    job_ids = []
+    for number in range(4):
+        job_ids.append(jobs.submit(lambda number=number: number))
+        jobs.wait(job_ids[-1], timeout=5)
+    # Old jobs are dropped when the next one is submitted
+    jobs.wait(jobs.submit(lambda: None), timeout=5)
+    assert jobs.get(job_ids[0]) is None and jobs.get(job_ids[1]) is None
+    assert jobs.get(job_ids[-1]).result == 3
+
+
+def test_expansion_prompt_runs_as_a_job_against_the_stub_server():
+    from ai_cards import CohereClient
+
+    server = start_stub_server(latency=1.0)
+    try:
+        client = CohereClient(base_url=server.base_url, api_key="stub")
+
+        def expand(card_count):
+            response = client.chat(f"Generate {card_count} flashcards for the deck \"Test\".", "command-r")
+            return {"added": sum(1 for line in response.splitlines() if line.startswith("Q:"))}
+
+        jobs = JobQueue(workers=2)
+        started = time.perf_counter()
+        job_ids = [jobs.submit(expand, 5) for _ in range(4)]
+        assert time.perf_counter() - started < 0.5, "requests don't wait for the AI"
+        results = [jobs.wait(job_id, timeout=20) for job_id in job_ids]
+        assert [job.status for job in results] == ["done"] * 4
+        assert [job.result for job in results] == [{"added": 5}] * 4
+        assert server.requests == 4
+    finally:
+        server.shutdown()
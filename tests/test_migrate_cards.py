@@ -0,0 +1,68 @@
+# Moving embedded cards into the cards collection (migrate_cards.py), checked on an in-process
+# MongoDB stand-in (mongomock); skipped when it isn't installed.
+
+import pytest
+from bson.objectid import ObjectId
+
+from migrate_cards import migrate_deck, migrate_decks
+from mongo_deck_store import MongoDeckStore
+
+mongomock = pytest.importorskip("mongomock")
+
+
+@pytest.fixture
+def store():
+    store = MongoDeckStore(mongomock.MongoClient().studystack)
+    store.upsert_user("legacy-user", "legacy@example.com")
+    return store
+
+
+def insert_legacy_deck(db, card_ids):
+    """An embedded deck as older versions saved it; a None card ID stands for a card saved before IDs existed"""
+    deck_data = {
+        "_id": ObjectId(), "user_auth_id": "legacy-user", "name": "Legacy", "experience": 0,
+        "flashcards": [{"question": f"question {i}", "answer": f"answer {i}", "correct_answers": 0, "reversible": False,
+                        **({"card_id": card_id} if card_id else {})}
+                       for i, card_id in enumerate(card_ids)]
+    }
+    db.decks.insert_one(deck_data)
+    return deck_data
+
+
+def test_migrated_cards_keep_their_ids(store):
+    deck_data = insert_legacy_deck(store.db, ["first", "second"])
+    assert migrate_deck(store.db, deck_data)
+    deck_id = str(deck_data['_id'])
+    assert [card.card_id for card in store.load_deck("legacy-user", deck_id).flashcards] == ["first", "second"]
+    assert store.db.decks.find_one({"_id": deck_data['_id']}).get('flashcards') is None
+
+
+def test_cards_without_ids_get_stable_ones(store):
+    deck_data = insert_legacy_deck(store.db, [None, "kept", None])
+    assert migrate_deck(store.db, deck_data)
+    deck_id = str(deck_data['_id'])
+
+    card_ids = [card.card_id for card in store.load_deck("legacy-user", deck_id).flashcards]
+    assert all(card_ids) and card_ids[1] == "kept" and len(set(card_ids)) == 3
+    assert [card.card_id for card in store.load_deck("legacy-user", deck_id).flashcards] == card_ids, \
+        "card IDs don't change between loads"
+
+    assert store.record_correct_answer("legacy-user", deck_id, card_ids[0])
+    assert store.get_card("legacy-user", deck_id, card_ids[0]).correct_answers == 1
+    assert store.delete_card("legacy-user", deck_id, card_ids[2])
+    assert [card.card_id for card in store.load_deck("legacy-user", deck_id).flashcards] == card_ids[:2]
+
+
+def test_finishing_the_migration_repairs_cards_copied_without_ids(store):
+    deck_data = insert_legacy_deck(store.db, ["kept"])
+    assert migrate_deck(store.db, deck_data)
+    # What a run from before IDs were assigned during the copy left behind
+    store.db.cards.insert_one({"deck_id": deck_data['_id'], "position": 1, "question": "q", "answer": "a",
+                               "correct_answers": 0, "reversible": False})
+    version = store.get_deck_version("legacy-user")
+
+    assert migrate_decks(store.db)['done']
+    card_ids = [card.card_id for card in store.load_deck("legacy-user", str(deck_data['_id'])).flashcards]
+    assert card_ids[0] == "kept" and card_ids[1]
+    assert [card.card_id for card in store.load_deck("legacy-user", str(deck_data['_id'])).flashcards] == card_ids
+    assert store.get_deck_version("legacy-user") > version